@@ -2,3 +2,4 @@ from .backtest import backtest
 from .binance_api_manager import BinanceAPIManager
 from .crypto_trading import main as run_trader
 from .database_warmup import warmup_database
+from .replay import replay
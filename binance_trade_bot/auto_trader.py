@@ -1,21 +1,27 @@
 import time
 from abc import ABC, abstractmethod
-from collections import defaultdict
 from datetime import datetime
-from typing import Dict, Optional, Tuple
+from itertools import repeat
+from math import nan
+from typing import Dict, List, Optional, Tuple
 
-from sqlalchemy.orm import Session
+import numpy as np
 
 from .binance_api_manager import BinanceAPIManager
+from .binance_stream_manager import MARKET_BUY, MARKET_SELL, MARKET_SELL_FILL_QUOTE
 from .config import Config
 from .database import Database, LogScout
 from .logger import Logger
-from .models import CoinValue, Pair
+from .models import CoinValue
 from .postpone import postpone_heavy_calls
 from .ratios import CoinStub
+from .ticker_prices import BRIDGE_QUOTE_IDX
+from .timings import timed
 
 
 class AutoTrader(ABC):
+    RESYNC_PRIORITY_CANDIDATES = 5
+
     def __init__(self, binance_manager: BinanceAPIManager, database: Database, logger: Logger, config: Config):
         self.manager = binance_manager
         self.db = database
@@ -23,6 +29,20 @@ class AutoTrader(ABC):
         self.config = config
 
     def initialize(self):
+        self.manager.set_ticker_coins([coin.symbol for coin in CoinStub.get_all()])
+        self.initialize_trade_thresholds()
+
+    def update_coins(self, symbols: List[str]):
+        """
+        Change the traded coins without a restart: the ratio matrix is resized in place, market streams of the added
+        and removed coins are subscribed and unsubscribed and only the pairs of the added coins are initialized
+        """
+        current_coin = self.db.get_current_coin()
+        if current_coin is not None and current_coin.symbol not in symbols:
+            self.logger.warning(f"Keeping the current coin {current_coin.symbol} enabled, it was removed from the list")
+            symbols = symbols + [current_coin.symbol]
+        self.db.set_coins(symbols)
+        self.manager.update_coins([coin.symbol for coin in CoinStub.get_all()])
         self.initialize_trade_thresholds()
 
     def transaction_through_bridge(self, from_coin: CoinStub, to_coin: CoinStub, sell_price: float, buy_price: float):
@@ -70,10 +90,12 @@ class AutoTrader(ABC):
             to_coin_buy_price: float,
             to_coin_amount: float,
             quote_amount: float,
+            market_prices: Optional[List[Tuple[Optional[float], Optional[float]]]] = None,
     ) -> bool:
         """
         Update all the coins with the threshold of buying the current held coin
 
+        :param market_prices: prices of the requests below when they are already known, fetched otherwise
         :returns True if update was successful, False otherwise
         """
         # Note: rethink if its better just to divide quote by price instead explicit passing amount
@@ -84,30 +106,30 @@ class AutoTrader(ABC):
             )
             return False
 
-        for coin in CoinStub.get_all():
-            if coin is to_coin:
-                continue
-
-            coin_price, _ = self.manager.get_market_sell_price_fill_quote(
-                coin.symbol + self.config.BRIDGE.symbol, quote_amount
+        bridge = self.config.BRIDGE.symbol
+        other_coins = [coin for coin in CoinStub.get_all() if coin is not to_coin]
+        requests = [(coin.symbol + bridge, MARKET_SELL_FILL_QUOTE, quote_amount) for coin in other_coins]
+        if from_coin is not None:
+            requests.append((from_coin.symbol + bridge, MARKET_BUY, quote_amount))
+            requests.append((to_coin.symbol + bridge, MARKET_SELL, to_coin_amount))
+        prices = self.manager.get_market_prices(requests) if market_prices is None else market_prices
+
+        # missing prices are NaN, the first coin without one is reported and the column is left untouched
+        coin_prices = np.array([coin_price for coin_price, _ in prices[: len(other_coins)]], dtype=float)
+        missing = np.flatnonzero(np.isnan(coin_prices))
+        if len(missing) > 0:
+            coin = other_coins[missing[0]]
+            self.logger.info(
+                f"Update for coin {coin.symbol + self.config.BRIDGE.symbol} can't be performed, not enough "
+                f"orders in order book "
             )
+            return False
 
-            if coin_price is None:
-                self.logger.info(
-                    f"Update for coin {coin.symbol + self.config.BRIDGE.symbol} can't be performed, not enough "
-                    f"orders in order book "
-                )
-                return False
-
-            self.db.ratios_manager.set(coin.idx, to_coin.idx, coin_price / to_coin_buy_price)
+        other_idxs = np.delete(np.arange(len(other_coins) + 1), to_coin.idx)
+        self.db.ratios_manager.set_column(to_coin.idx, coin_prices / to_coin_buy_price, other_idxs)
 
         if from_coin is not None:
-            from_coin_buy_price, _ = self.manager.get_market_buy_price(
-                from_coin.symbol + self.config.BRIDGE.symbol, quote_amount
-            )
-            to_coin_sell_price, _ = self.manager.get_market_sell_price(
-                to_coin.symbol + self.config.BRIDGE.symbol, to_coin_amount
-            )
+            (from_coin_buy_price, _), (to_coin_sell_price, _) = prices[-2:]
             if from_coin_buy_price is None or to_coin_sell_price is None:
                 self.logger.info(
                     f"Can't update reverse pair {to_coin.symbol}->{from_coin.symbol}, not enough orders in order book"
@@ -144,47 +166,41 @@ class AutoTrader(ABC):
         ratios_manager = self.db.ratios_manager
         max_quote_amount = self._max_value_in_wallet()
 
-        session: Session
-        with self.db.db_session() as session:
-            pairs = session.query(Pair).filter(Pair.ratio.is_(None)).all()
-            grouped_pairs = defaultdict(list)
-            for pair in pairs:
-                if pair.from_coin.enabled and pair.to_coin.enabled:
-                    grouped_pairs[pair.from_coin.symbol].append(pair)
-            for from_coin_symbol, group in grouped_pairs.items():
-                from_coin_idx = CoinStub.get_by_symbol(from_coin_symbol).idx
-                self.logger.info(f"Initializing {from_coin_symbol} vs [{', '.join([p.to_coin.symbol for p in group])}]")
-                for pair in group:
-                    for _ in range(10):  # basically retrying 10 times to get the price
-                        from_coin_price, _ = self.manager.get_market_sell_price_fill_quote(
-                            from_coin_symbol + self.config.BRIDGE.symbol, max_quote_amount
-                        )
-                        if from_coin_price is not None:
-                            break
-                        time.sleep(1)
-                    if from_coin_price is None:
-                        self.logger.info(
-                            "Skipping initializing {}, symbol not found".format(pair.from_coin + self.config.BRIDGE)
-                        )
-                        continue
-
-                    for _ in range(10):
-                        to_coin_price, _ = self.manager.get_market_buy_price(
-                            pair.to_coin.symbol + self.config.BRIDGE.symbol, max_quote_amount
-                        )
-                        if to_coin_price is not None:
-                            break
-                        time.sleep(10)
-
-                    if to_coin_price is None:
-                        self.logger.info(
-                            "Skipping initializing {}, symbol not found".format(pair.to_coin + self.config.BRIDGE)
-                        )
-                        continue
-
-                    ratios_manager.set(
-                        from_coin_idx, CoinStub.get_by_symbol(pair.to_coin.symbol).idx, from_coin_price / to_coin_price
+        # pairs without a ratio yet, the diagonal is always 1
+        uninitialized = np.isnan(ratios_manager.get_all())
+        for from_coin_idx in np.flatnonzero(uninitialized.any(axis=1)).tolist():
+            from_coin_symbol = CoinStub.get_by_idx(from_coin_idx).symbol
+            to_coins = [CoinStub.get_by_idx(to_idx) for to_idx in np.flatnonzero(uninitialized[from_coin_idx]).tolist()]
+            self.logger.info(f"Initializing {from_coin_symbol} vs [{', '.join([c.symbol for c in to_coins])}]")
+            for to_coin in to_coins:
+                for _ in range(10):  # basically retrying 10 times to get the price
+                    from_coin_price, _ = self.manager.get_market_sell_price_fill_quote(
+                        from_coin_symbol + self.config.BRIDGE.symbol, max_quote_amount
+                    )
+                    if from_coin_price is not None:
+                        break
+                    time.sleep(1)
+                if from_coin_price is None:
+                    self.logger.info(
+                        f"Skipping initializing {from_coin_symbol + self.config.BRIDGE.symbol}, symbol not found"
+                    )
+                    continue
+
+                for _ in range(10):
+                    to_coin_price, _ = self.manager.get_market_buy_price(
+                        to_coin.symbol + self.config.BRIDGE.symbol, max_quote_amount
+                    )
+                    if to_coin_price is not None:
+                        break
+                    time.sleep(10)
+
+                if to_coin_price is None:
+                    self.logger.info(
+                        f"Skipping initializing {to_coin.symbol + self.config.BRIDGE.symbol}, symbol not found"
                     )
+                    continue
+
+                ratios_manager.set(from_coin_idx, to_coin.idx, from_coin_price / to_coin_price)
         self.db.commit_ratios()
         return True
 
@@ -195,67 +211,169 @@ class AutoTrader(ABC):
         """
         ...
 
-    def _get_ratios(
-            self, coin: CoinStub, coin_sell_price, quote_amount, enable_scout_log=True
-    ) -> Tuple[Dict[Tuple[int, int], float], Dict[str, Tuple[float, float]]]:
+    def _get_buy_prices(self, quote_amount: float) -> List[Tuple[Optional[float], Optional[float]]]:
         """
-        Given a coin, get the current price ratio for every other enabled coin
+        Get market buy price and bought amount of every coin for quote_amount of bridge in a single batch
+
+        :returns list of (price, amount) indexed by CoinStub.idx
         """
-        ratio_dict: Dict[(int, int), float] = {}
-        price_amounts: Dict[str, (float, float)] = {}
+        return self.manager.get_market_prices(
+            [(coin.symbol + self.config.BRIDGE.symbol, MARKET_BUY, quote_amount) for coin in CoinStub.get_all()]
+        )
 
-        scout_logs = []
-        for to_idx, target_ratio in enumerate(self.db.ratios_manager.get_from_coin(coin.idx)):
-            if coin.idx == to_idx:
-                continue
-            to_coin = CoinStub.get_by_idx(to_idx)
-            optional_coin_buy_price, optional_coin_amount = self.manager.get_market_buy_price(
-                to_coin.symbol + self.config.BRIDGE.symbol, quote_amount
-            )
+    @timed("get_ratios")
+    def _get_ratio_diff_matrix(
+            self,
+            from_idxs: np.ndarray,
+            sell_prices: np.ndarray,
+            buy_prices: List[Tuple[Optional[float], Optional[float]]],
+            log_missing_prices=True,
+    ) -> np.ndarray:
+        """
+        Ratio diffs of the jumps from every from_idxs coin to every coin, broadcast over the RatiosManager rows
 
-            if optional_coin_buy_price is None:
+        :param sell_prices: sell price of every from_idxs coin
+        :param buy_prices: (price, amount) of every coin as returned by _get_buy_prices
+        :param log_missing_prices: log the coins without a buy price, off when the same prices were logged already
+        :returns a row per from_idxs coin indexed by CoinStub.idx, NaN for the coin itself and for coins without a
+            buy price
+        """
+        bridge = self.config.BRIDGE.symbol
+        buy_price_vector = np.array([nan if price is None else price for price, _ in buy_prices])
+        has_buy_price = ~np.isnan(buy_price_vector)
+        for to_idx in np.flatnonzero(~has_buy_price).tolist() if log_missing_prices else ():
+            if len(from_idxs) > 1 or to_idx != from_idxs[0]:  # a single coin doesn't need its own buy price
                 self.logger.info(  # NB: exclude missing coins on start-up
-                    f"Market price for coin {to_coin.symbol + self.config.BRIDGE.symbol} can't be calculated, skipping"
+                    f"Market price for coin {CoinStub.get_by_idx(to_idx).symbol + bridge} can't be calculated, skipping"
                 )
-                continue
-
-            price_amounts[to_coin.symbol] = (optional_coin_buy_price, optional_coin_amount)
-
-            # Obtain (current coin)/(optional coin)
-            coin_opt_coin_ratio = coin_sell_price / optional_coin_buy_price
-
-            from_fee = self.manager.get_fee(coin.symbol, self.config.BRIDGE.symbol, True)
-            to_fee = self.manager.get_fee(to_coin.symbol, self.config.BRIDGE.symbol, False)
-            transaction_fee = from_fee + to_fee - from_fee * to_fee
 
-            ratio_dict[(coin.idx, to_coin.idx)] = (
-                    (1 - transaction_fee) * coin_opt_coin_ratio / target_ratio - 1 - self.config.SCOUT_MARGIN / 100
+        target_ratios = self.db.ratios_manager.get_all()[from_idxs]
+        from_fees = self.manager.get_fee_vector(True)[from_idxs][:, np.newaxis]
+        to_fees = np.where(has_buy_price, self.manager.get_fee_vector(False), nan)
+        transaction_fees = from_fees + to_fees - from_fees * to_fees
+        # (current coin)/(optional coin) ratio against the target, in the same operation order as a scalar loop
+        ratio_diffs = (
+                (1 - transaction_fees) * (sell_prices[:, np.newaxis] / buy_price_vector) / target_ratios
+                - 1
+                - self.config.SCOUT_MARGIN / 100
+        )
+        ratio_diffs[:, ~has_buy_price] = nan
+        ratio_diffs[np.arange(len(from_idxs)), from_idxs] = nan
+        return ratio_diffs
+
+    def _log_scout_matrix(
+            self,
+            from_idxs: np.ndarray,
+            sell_prices: np.ndarray,
+            buy_prices: List[Tuple[Optional[float], Optional[float]]],
+            ratio_diffs: np.ndarray,
+    ):
+        """
+        Log every evaluated jump of a _get_ratio_diff_matrix result in a single batch
+        """
+        buy_price_vector = np.array([nan if price is None else price for price, _ in buy_prices])
+        candidates = np.broadcast_to(~np.isnan(buy_price_vector), ratio_diffs.shape).copy()
+        candidates[np.arange(len(from_idxs)), from_idxs] = False
+        if not candidates.any():
+            return
+        target_ratios = self.db.ratios_manager.get_all()[from_idxs]
+        pair_ids = self.db.ratios_manager.get_all_pair_ids()[from_idxs]
+        rows, cols = np.nonzero(candidates)
+        self.db.batch_log_scout(
+            list(
+                map(
+                    LogScout,
+                    pair_ids[rows, cols].tolist(),
+                    ratio_diffs[rows, cols].tolist(),
+                    target_ratios[rows, cols].tolist(),
+                    sell_prices[rows].tolist(),
+                    buy_price_vector[cols].tolist(),
+                )
             )
+        )
 
-            if enable_scout_log:
-                scout_logs.append(
-                    LogScout(
-                        self.db.ratios_manager.get_pair_id(coin.idx, to_idx),
-                        ratio_dict[(coin.idx, to_coin.idx)],
-                        target_ratio,
-                        coin_sell_price,
-                        optional_coin_buy_price,
-                    )
-                )
+    def _get_ratio_diffs(
+            self,
+            coin: CoinStub,
+            coin_sell_price: float,
+            buy_prices: List[Tuple[Optional[float], Optional[float]]],
+            enable_scout_log=True,
+    ) -> np.ndarray:
+        """
+        Ratio diff of the jump from coin to every coin, computed for the whole row at once
 
-        if scout_logs:
-            self.db.batch_log_scout(scout_logs)
+        :param buy_prices: (price, amount) of every coin as returned by _get_buy_prices
+        :returns ratio diffs indexed by CoinStub.idx, NaN for coin itself and for coins without a buy price
+        """
+        from_idxs = np.array([coin.idx])
+        sell_prices = np.array([coin_sell_price])
+        ratio_diffs = self._get_ratio_diff_matrix(from_idxs, sell_prices, buy_prices)
+        if enable_scout_log:
+            self._log_scout_matrix(from_idxs, sell_prices, buy_prices, ratio_diffs)
+        return ratio_diffs[0]
+
+    @staticmethod
+    def _best_candidate(ratio_diffs: np.ndarray) -> Optional[int]:
+        """
+        :returns CoinStub.idx of the biggest positive ratio diff, the lowest idx among equal ones, None if none is
+            positive
+        """
+        positive_diffs = np.where(ratio_diffs > 0, ratio_diffs, 0.0)
+        if not positive_diffs.any():
+            return None
+        return int(np.argmax(positive_diffs))
 
-        return ratio_dict, price_amounts
+    def _update_resync_priorities(self, coin: CoinStub, ratio_diffs: np.ndarray):
+        """
+        Resync order books of the current coin and of the best jump candidates first after a reconnect
+        """
+        candidates = np.flatnonzero(~np.isnan(ratio_diffs))
+        # stable sort, so equal diffs keep the order of their idx
+        best_candidates = candidates[np.argsort(-ratio_diffs[candidates], kind="stable")]
+        symbols = [coin.symbol] + [
+            CoinStub.get_by_idx(to_idx).symbol for to_idx in best_candidates[: self.RESYNC_PRIORITY_CANDIDATES].tolist()
+        ]
+        self.manager.set_resync_priorities([symbol + self.config.BRIDGE.symbol for symbol in symbols])
+
+    def _arm_scout_trigger(
+            self,
+            coin: CoinStub,
+            coin_sell_price: float,
+            quote_amount: float,
+            buy_prices: List[Tuple[Optional[float], Optional[float]]],
+            ratio_diffs: np.ndarray,
+    ):
+        """
+        Let order book updates start the next scout once a jump from coin may reach its threshold, see ScoutTrigger
 
-    @postpone_heavy_calls
-    def _jump_to_best_coin(
+        A ratio diff d reaches 0 once the sell price / buy price ratio of its jump grows by (1 + m) / (1 + m + d),
+        m being the scout margin
+        """
+        if self.config.SCOUT_MODE != "event":
+            return
+        bridge = self.config.BRIDGE.symbol
+        margin = 1 + self.config.SCOUT_MARGIN / 100
+        candidates = np.flatnonzero(ratio_diffs + margin > 0)
+        required_growths = margin / (margin + ratio_diffs[candidates])
+        self.manager.arm_scout_trigger(
+            coin.symbol + bridge,
+            coin_sell_price,
+            quote_amount,
+            {
+                CoinStub.get_by_idx(to_idx).symbol + bridge: (buy_prices[to_idx][0], required_growth)
+                for to_idx, required_growth in zip(candidates.tolist(), required_growths.tolist())
+            },
+        )
+
+    def _walk_jump_chain(
             self, coin: CoinStub, coin_sell_price: float, quote_amount: float, coin_amount: float
-    ):  # pylint: disable=too-many-locals
+    ) -> Optional[Tuple[List[str], CoinStub, float]]:
         """
-        Given a coin, search for a coin to jump to
+        Walk greedily from coin: take the best jump, evaluate the order books again from the coin it lands on and
+        repeat while there is a jump
+
+        :returns (jump chain, last coin, buy price of the last coin), None if the walk can't be completed
         """
-        can_walk_deeper = True
         jump_chain = [coin.symbol]
         # We simulate a possible buy chain and land on its very end, updating all ratios along the path
         # as it would be if we buy them all with real orders
@@ -264,43 +382,163 @@ class AutoTrader(ABC):
         last_coin_buy_price = 0.0  # it will be set for reasonable value after we found our first jump candidate
         last_coin_quote = quote_amount
         last_coin_amount = coin_amount
-        bridge_balance = self.manager.get_currency_balance(self.config.BRIDGE.symbol)
         is_initial_coin = True
 
-        while can_walk_deeper:
+        while True:
             if not is_initial_coin:
                 last_coin_sell_price, last_coin_quote = self.manager.get_market_sell_price(
                     last_coin.symbol + self.config.BRIDGE.symbol, last_coin_amount
                 )
                 if last_coin_sell_price is None:
-                    self.db.ratios_manager.rollback()
-                    return
-            ratio_dict, prices = self._get_ratios(
-                last_coin, last_coin_sell_price, last_coin_quote, enable_scout_log=is_initial_coin
+                    return None
+            buy_prices = self._get_buy_prices(last_coin_quote)
+            ratio_diffs = self._get_ratio_diffs(
+                last_coin, last_coin_sell_price, buy_prices, enable_scout_log=is_initial_coin
             )
-
-            ratio_dict = {k: v for k, v in ratio_dict.items() if v > 0}
+            if is_initial_coin:
+                self._update_resync_priorities(coin, ratio_diffs)
 
             # if we have any viable options, pick the one with the biggest ratio
-            if ratio_dict:
-                new_best_pair = max(ratio_dict, key=ratio_dict.get)
-                new_best_coin = CoinStub.get_by_idx(new_best_pair[1])
-                if not is_initial_coin:  # update thresholds because we should buy anyway when walk through chain
-                    # This should be performed in a single transaction so we don't leave our ratios in invalid state
-                    if not self.update_trade_threshold(
-                            last_coin, new_best_coin, last_coin_buy_price, last_coin_amount, last_coin_quote
-                    ):
-                        self.db.ratios_manager.rollback()
-                        return
-                last_coin = new_best_coin
-                last_coin_buy_price, last_coin_amount = prices[last_coin.symbol]
-                jump_chain.append(last_coin.symbol)
-                is_initial_coin = False
-            else:
-                can_walk_deeper = False
+            new_best_idx = self._best_candidate(ratio_diffs)
+            if new_best_idx is None:
+                if is_initial_coin:
+                    self._arm_scout_trigger(coin, coin_sell_price, quote_amount, buy_prices, ratio_diffs)
+                return jump_chain, last_coin, last_coin_buy_price
+            new_best_coin = CoinStub.get_by_idx(new_best_idx)
+            if not is_initial_coin:  # update thresholds because we should buy anyway when walk through chain
+                # This should be performed in a single transaction so we don't leave our ratios in invalid state
+                if not self.update_trade_threshold(
+                        last_coin, new_best_coin, last_coin_buy_price, last_coin_amount, last_coin_quote
+                ):
+                    return None
+            last_coin = new_best_coin
+            last_coin_buy_price, last_coin_amount = buy_prices[new_best_idx]
+            jump_chain.append(last_coin.symbol)
+            is_initial_coin = False
+
+    @staticmethod
+    def _best_jump_chain(start_idx: int, ratio_diffs: np.ndarray, max_hops: int) -> List[int]:
+        """
+        Chain of at most max_hops jumps from start_idx, searched in log space like a hop limited Bellman-Ford
+
+        A chain scores the sum of log(1 + ratio diff) of its jumps. Only jumps with a positive ratio diff are taken and
+        no coin is visited twice, as the thresholds the walk updates would rule out jumping back anyway. Only the best
+        chain of every length is kept per terminal coin, equal scores keep the lowest idx. This is a heuristic: a
+        chain dropped that way because it visited a coin needed later isn't explored again, so a better chain may be
+        missed. Its cost stays polynomial where an exact search over simple paths grows with n ** max_hops.
+
+        :param ratio_diffs: square matrix indexed by CoinStub.idx, NaN where there is no jump
+        :returns CoinStub idxs of the chain, start_idx first
+        """
+        n = len(ratio_diffs)
+        positive = ratio_diffs > 0
+        weights = np.where(positive, np.log1p(np.where(positive, ratio_diffs, 0.0)), -np.inf)
+        scores = np.full(n, -np.inf)
+        scores[start_idx] = 0.0
+        # visited[to_idx] marks the coins on the best chain ending in to_idx
+        visited = np.zeros((n, n), dtype=bool)
+        visited[start_idx, start_idx] = True
+        chains = {start_idx: [start_idx]}
+        best_chain, best_score = chains[start_idx], 0.0
+        for _ in range(max_hops):
+            extended = scores[:, np.newaxis] + weights
+            extended[visited] = -np.inf
+            from_idxs = np.argmax(extended, axis=0)
+            scores = extended[from_idxs, np.arange(n)]
+            reached = np.flatnonzero(scores > -np.inf)
+            if not len(reached):
+                break
+            visited = visited[from_idxs]
+            visited[reached, reached] = True
+            chains = {to_idx: chains[int(from_idxs[to_idx])] + [to_idx] for to_idx in reached.tolist()}
+            to_idx = int(np.argmax(scores))
+            if scores[to_idx] > best_score:
+                best_chain, best_score = chains[to_idx], float(scores[to_idx])
+        return best_chain
+
+    def _search_jump_chain(
+            self, coin: CoinStub, coin_sell_price: float, quote_amount: float
+    ) -> Optional[Tuple[List[str], CoinStub, float]]:  # pylint: disable=too-many-locals
+        """
+        Plan the jump chain from coin over a single batch of order book prices instead of walking it hop by hop
+
+        Every coin is priced for quote_amount of bridge, the buy prices as in the walk and the sell prices like
+        update_trade_threshold requests them for the column of a coin. Once a chain is planned, a last batch prices
+        selling the amount bought of each coin passed through, for the reverse pair update_trade_threshold sets, so
+        their thresholds are set without further book queries.
+
+        :returns (jump chain, last coin, buy price of the last coin), None if the thresholds can't be updated
+        """
+        bridge = self.config.BRIDGE.symbol
+        coins = CoinStub.get_all()
+        n = len(coins)
+        buy_prices = self._get_buy_prices(quote_amount)
+        ratio_diffs = self._get_ratio_diffs(coin, coin_sell_price, buy_prices)
+        self._update_resync_priorities(coin, ratio_diffs)
+        best_idx = self._best_candidate(ratio_diffs)
+        if best_idx is None:
+            self._arm_scout_trigger(coin, coin_sell_price, quote_amount, buy_prices, ratio_diffs)
+            return [coin.symbol], coin, 0.0
+
+        queries = n
+        if self.config.JUMP_SEARCH_HOPS == 1:
+            chain = [coin.idx, best_idx]
+        else:
+            sell_prices = self.manager.get_market_prices(
+                [(other_coin.symbol + bridge, MARKET_SELL_FILL_QUOTE, quote_amount) for other_coin in coins]
+            )
+            queries += n
+            sell_price_vector = np.array([nan if price is None else price for price, _ in sell_prices])
+            sell_price_vector[coin.idx] = coin_sell_price
+            from_idxs = np.flatnonzero(~np.isnan(sell_price_vector))
+            ratio_diff_matrix = np.full((n, n), nan)
+            ratio_diff_matrix[from_idxs] = self._get_ratio_diff_matrix(
+                from_idxs, sell_price_vector[from_idxs], buy_prices, log_missing_prices=False
+            )
+            chain = self._best_jump_chain(coin.idx, ratio_diff_matrix, self.config.JUMP_SEARCH_HOPS)
+
+            passed_idxs = chain[1:-1]
+            sell_back_prices = []
+            if passed_idxs:
+                sell_back_prices = self.manager.get_market_prices(
+                    [
+                        (CoinStub.get_by_idx(idx).symbol + bridge, MARKET_SELL, buy_prices[idx][1])
+                        for idx in passed_idxs
+                    ]
+                )
+                queries += len(passed_idxs)
+            for last_idx, next_idx, sell_back_price in zip(passed_idxs, chain[2:], sell_back_prices):
+                last_coin, next_coin = CoinStub.get_by_idx(last_idx), CoinStub.get_by_idx(next_idx)
+                last_coin_buy_price, last_coin_amount = buy_prices[last_idx]
+                market_prices = [price for other_coin, price in zip(coins, sell_prices) if other_coin is not last_coin]
+                market_prices += [buy_prices[next_idx], sell_back_price]
+                if not self.update_trade_threshold(
+                        last_coin, next_coin, last_coin_buy_price, last_coin_amount, quote_amount, market_prices
+                ):
+                    return None
+
+        jump_chain = [CoinStub.get_by_idx(idx).symbol for idx in chain]
+        self.logger.info(f"Planned jump chain: {jump_chain} with {queries} book price queries")
+        return jump_chain, CoinStub.get_by_idx(chain[-1]), buy_prices[chain[-1]][0]
+
+    @postpone_heavy_calls
+    @timed("jump_to_best_coin")
+    def _jump_to_best_coin(self, coin: CoinStub, coin_sell_price: float, quote_amount: float, coin_amount: float):
+        """
+        Given a coin, search for a coin to jump to
+        """
+        bridge_balance = self.manager.get_currency_balance(self.config.BRIDGE.symbol)
+        if self.config.JUMP_SEARCH_HOPS:
+            found = self._search_jump_chain(coin, coin_sell_price, quote_amount)
+        else:
+            found = self._walk_jump_chain(coin, coin_sell_price, quote_amount, coin_amount)
+        if found is None:
+            self.db.ratios_manager.rollback()
+            return
+        jump_chain, last_coin, last_coin_buy_price = found
         self.db.commit_ratios()
 
-        if not is_initial_coin:
+        if len(jump_chain) > 1:
             if len(jump_chain) > 2:
                 self.logger.info(f"Squashed jump chain: {jump_chain}")
             if jump_chain[0] != jump_chain[-1]:
@@ -334,37 +572,40 @@ class AutoTrader(ABC):
         ):
             return None
 
-        for coin in coins:
-            current_coin_price = self.manager.get_ticker_price(coin.symbol + self.config.BRIDGE.symbol)
-
-            if current_coin_price is None:
-                continue
-
-            ratio_dict, _ = self._get_ratios(coin, current_coin_price, bridge_balance)
-            if not any(v > 0 for v in ratio_dict.values()):
-                '''
-                This code checks if any value in ratio_dict is 
-                greater than zero. If all values are less than 
-                or equal to zero, the condition will be True
-                and the code block inside the if statement 
-                will be executed. 
-                
-                we are looking for a negative value in the ratio dictionary
-                
-                It will buy the first coin and just go back :)
-                '''
-                # There will only be one coin where all the ratios are negative. When we find it, buy it if we can
-                if bridge_balance > self.manager.get_min_notional(coin.symbol, self.config.BRIDGE.symbol):
-                    self.logger.info(f"Will be purchasing {coin.symbol} using bridge coin")
-                    result = self.manager.buy_alt(
-                        coin.symbol,
-                        self.config.BRIDGE.symbol,
-                        self.manager.get_ticker_price(coin.symbol + self.config.BRIDGE.symbol),
-                    )
-                    if result is not None:
-                        self.db.set_current_coin(coin.symbol)
-                        self.db.commit_ratios()
-                        return coin
+        # one price vector and one broadcast over the ratio matrix instead of a ratio row per coin
+        buy_prices = self._get_buy_prices(bridge_balance)
+        sell_prices = np.array(
+            [self.manager.get_ticker_price_by_idx(coin.idx, BRIDGE_QUOTE_IDX) for coin in coins], dtype=float
+        )  # None becomes NaN
+        from_idxs = np.flatnonzero(~np.isnan(sell_prices))
+        if not len(from_idxs):
+            return None
+        ratio_diffs = self._get_ratio_diff_matrix(from_idxs, sell_prices[from_idxs], buy_prices)
+
+        # There will only be one coin where all the ratios are negative. When we find it, buy it if we can
+        # rows are logged up to the bought coin, as when they were evaluated one by one
+        logged_rows = 0
+        no_jump_rows = np.flatnonzero(~(ratio_diffs > 0).any(axis=1))
+        for row in no_jump_rows.tolist():
+            coin = CoinStub.get_by_idx(int(from_idxs[row]))
+            if bridge_balance > self.manager.get_min_notional(coin.symbol, self.config.BRIDGE.symbol):
+                scouted = slice(logged_rows, row + 1)
+                self._log_scout_matrix(
+                    from_idxs[scouted], sell_prices[from_idxs[scouted]], buy_prices, ratio_diffs[scouted]
+                )
+                logged_rows = row + 1
+                self.logger.info(f"Will be purchasing {coin.symbol} using bridge coin")
+                result = self.manager.buy_alt(
+                    coin.symbol,
+                    self.config.BRIDGE.symbol,
+                    self.manager.get_ticker_price_by_idx(coin.idx, BRIDGE_QUOTE_IDX),
+                )
+                if result is not None:
+                    self.db.set_current_coin(coin.symbol)
+                    self.db.commit_ratios()
+                    return coin
+        scouted = slice(logged_rows, None)
+        self._log_scout_matrix(from_idxs[scouted], sell_prices[from_idxs[scouted]], buy_prices, ratio_diffs[scouted])
         return None
 
     def update_values(self):
@@ -374,13 +615,21 @@ class AutoTrader(ABC):
         now = datetime.now()
 
         coins = self.db.get_coins(False)
+        ticker_prices = self.manager.cache.ticker_prices
+        usdt_idx = ticker_prices.quote_idx("USDT")
+        btc_idx = ticker_prices.quote_idx("BTC")
         cv_batch = []
         for coin in coins:
             balance = self.manager.get_currency_balance(coin.symbol)
             if balance == 0:
                 continue
-            usd_value = self.manager.get_ticker_price(coin + "USDT")
-            btc_value = self.manager.get_ticker_price(coin + "BTC")
+            coin_stub = CoinStub.get_by_symbol(coin.symbol)
+            if coin_stub is None:  # disabled coins have no slot
+                usd_value = self.manager.get_ticker_price(coin + "USDT")
+                btc_value = self.manager.get_ticker_price(coin + "BTC")
+            else:
+                usd_value = self.manager.get_ticker_price_by_idx(coin_stub.idx, usdt_idx)
+                btc_value = self.manager.get_ticker_price_by_idx(coin_stub.idx, btc_idx)
             cv = CoinValue(coin, balance, usd_value, btc_value, datetime=now)
             cv_batch.append(cv)
         self.db.batch_update_coin_values(cv_batch)
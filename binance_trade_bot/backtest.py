@@ -1,18 +1,27 @@
 from collections import defaultdict
 from datetime import datetime, timedelta
 from traceback import format_exc
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 import binance.client
+import numpy as np
 from binance import Client
 from sqlitedict import SqliteDict
 
 from .binance_api_manager import BinanceAPIManager, BinanceOrderBalanceManager
-from .binance_stream_manager import BinanceCache, BinanceOrder
+from .binance_stream_manager import (
+    MARKET_BUY,
+    MARKET_SELL,
+    MARKET_SELL_FILL_QUOTE,
+    BinanceCache,
+    BinanceOrder,
+    MarketPriceRequest,
+)
 from .config import Config
 from .database import Database
 from .logger import Logger
 from .models import Pair, ScoutHistory
+from .ratios import CoinStub
 from .strategies import get_strategy
 
 
@@ -36,15 +45,16 @@ class MockBinanceManager(BinanceAPIManager):
         self.datetime = start_date or datetime(2021, 1, 1)
         self.balances = start_balances or {config.BRIDGE.symbol: 100}
         self.non_existing_pairs = set()
-        self.reinit_trader_callback = None
+        self.update_coins_callback = None
 
-    def set_reinit_trader_callback(self, reinit_trader_callback):
-        self.reinit_trader_callback = reinit_trader_callback
+    def set_update_coins_callback(self, update_coins_callback):
+        self.update_coins_callback = update_coins_callback
 
     def set_coins(self, coins_list: List[str]):
-        self.db.set_coins(coins_list)
-        if self.reinit_trader_callback is not None:
-            self.reinit_trader_callback()
+        if self.update_coins_callback is None:
+            self.db.set_coins(coins_list)
+        else:
+            self.update_coins_callback(coins_list)
 
     def setup_websockets(self):
         pass  # No websockets are needed for backtesting
@@ -55,6 +65,9 @@ class MockBinanceManager(BinanceAPIManager):
     def get_fee(self, origin_coin: str, target_coin: str, selling: bool):
         return 0.001
 
+    def get_fee_vector(self, selling: bool) -> np.ndarray:
+        return np.full(CoinStub.len_coins(), 0.001)
+
     def get_ticker_price(self, ticker_symbol: str):
         """
         Get ticker price of a specific coin
@@ -106,6 +119,14 @@ class MockBinanceManager(BinanceAPIManager):
         price = self.get_ticker_price(symbol)
         return (price, quote_amount / price) if price is not None else (None, None)
 
+    def get_market_prices(self, requests: List[MarketPriceRequest]) -> List[Tuple[float, float]]:
+        methods = {
+            MARKET_SELL: self.get_market_sell_price,
+            MARKET_SELL_FILL_QUOTE: self.get_market_sell_price_fill_quote,
+            MARKET_BUY: self.get_market_buy_price,
+        }
+        return [methods[side](symbol, amount) for symbol, side, amount in requests]
+
     def buy_alt(self, origin_coin: str, target_coin: str, buy_price: float):
         origin_symbol = origin_coin
         target_symbol = target_coin
@@ -248,7 +269,7 @@ def backtest(
     trader = strategy(manager, db, logger, config)
     trader.initialize()
 
-    manager.set_reinit_trader_callback(trader.initialize)
+    manager.set_update_coins_callback(trader.update_coins)
     yield manager
 
     n = 1
@@ -5,17 +5,27 @@ import time
 import traceback
 from abc import ABC, abstractmethod
 from collections import defaultdict
-from typing import Callable, Dict, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
+import numpy as np
 from binance.client import Client
 from binance.exceptions import BinanceAPIException, BinanceOrderException, BinanceRequestException
 from cachetools import TTLCache, cached
 
-from .binance_stream_manager import BinanceCache, BinanceOrder, BinanceStreamManager, StreamManagerWorker
+from .binance_stream_manager import (
+    BinanceCache,
+    BinanceOrder,
+    BinanceStreamManager,
+    MarketPriceRequest,
+    StreamManagerWorker,
+)
 from .config import Config
 from .database import Database
 from .logger import Logger
 from .postpone import heavy_call
+from .ratios import CoinStub
+from .ticker_prices import BRIDGE_QUOTE_IDX, TickerPrices
+from .timings import timed
 
 
 def float_as_decimal_str(num: float):
@@ -93,7 +103,7 @@ class PaperOrderBalanceManager(AbstractOrderBalanceManager):
         else:
             self.balances[self.bridge] = self.get_currency_balance(self.bridge) - quote_quantity
             self.balances[symbol_base] = self.get_currency_balance(symbol_base) + quantity * 0.999
-        self.cache.balances_changed_event.set()
+        self.cache.balances_changed()
         super().make_order(side, symbol, quantity, quote_quantity)
         if side == Client.SIDE_BUY:
             # we do it only after buy for transaction speed
@@ -137,6 +147,7 @@ class BinanceOrderBalanceManager(AbstractOrderBalanceManager):
                     }
                 )
                 self.logger.debug(f"Fetched all balances: {cache_balances}")
+                self.cache.balances_version += 1
                 if currency_symbol not in cache_balances:
                     cache_balances[currency_symbol] = 0.0
                     return 0.0
@@ -161,6 +172,11 @@ class BinanceAPIManager:  # pylint:disable=too-many-public-methods
         self.config = config
         self.cache = cache
         self.order_balance_manager = order_balance_manager
+        if not cache.ticker_prices.quotes:
+            cache.ticker_prices = TickerPrices.create(config)
+        self.bnb_quote_idx = cache.ticker_prices.quote_idx("BNB")
+        # selling -> (inputs shared by every coin, ticker update times per coin, fees), see get_fee_vector
+        self._fee_vectors: Dict[bool, Tuple[Tuple, np.ndarray, np.ndarray]] = {}
         self.stream_manager: Optional[BinanceStreamManager] = None
         self.setup_websockets()
 
@@ -171,7 +187,7 @@ class BinanceAPIManager:  # pylint:disable=too-many-public-methods
         logger: Logger,
         ob_factory: Callable[[Client, BinanceCache], AbstractOrderBalanceManager],
     ) -> "BinanceAPIManager":
-        cache = BinanceCache()
+        cache = BinanceCache(TickerPrices.create(config))
         # initializing the client class calls `ping` API endpoint, verifying the connection
         client = Client(
             config.BINANCE_API_KEY,
@@ -227,7 +243,11 @@ class BinanceAPIManager:  # pylint:disable=too-many-public-methods
         if origin_coin == "BNB":
             fee_amount_bnb = fee_amount
         else:
-            origin_price = self.get_ticker_price(origin_coin + "BNB")
+            coin = CoinStub.get_by_symbol(origin_coin)
+            if coin is None or self.bnb_quote_idx is None:
+                origin_price = self.get_ticker_price(origin_coin + "BNB")
+            else:
+                origin_price = self.get_ticker_price_by_idx(coin.idx, self.bnb_quote_idx)
             if origin_price is None:
                 return base_fee
             fee_amount_bnb = fee_amount * origin_price
@@ -238,6 +258,54 @@ class BinanceAPIManager:  # pylint:disable=too-many-public-methods
             return base_fee * 0.75
         return base_fee
 
+    def _get_fee_inputs(self, selling: bool) -> Tuple[Tuple, np.ndarray]:
+        """
+        What get_fee reads besides the symbols: the values shared by every coin and a row per coin with the update
+        times of the ticker prices its fee depends on
+        """
+        n = CoinStub.len_coins()
+        if self.config.BINANCE_TLD != "com":
+            return (), np.empty((n, 0))
+        trade_fees = self.get_trade_fees()
+        if not self.get_using_bnb_for_fees():
+            return (trade_fees, False), np.empty((n, 0))
+        # the traded amount depends on the balances, buying also on the price of the coin in the bridge
+        shared_inputs = (trade_fees, True, self.cache.balances_version)
+        quote_idxs = [self.bnb_quote_idx] if selling else [self.bnb_quote_idx, BRIDGE_QUOTE_IDX]
+        ticker_prices = self.cache.ticker_prices
+        if self.bnb_quote_idx is None or len(ticker_prices.coins) != n:
+            # prices are read by symbol, NaN update times make the fees recomputed on every call
+            return shared_inputs, np.full((n, len(quote_idxs)), math.nan)
+        updated = np.frombuffer(ticker_prices.updated).reshape(n, len(ticker_prices.quotes))
+        return shared_inputs, updated[:, quote_idxs]
+
+    def get_fee_vector(self, selling: bool) -> np.ndarray:
+        """
+        Fee of trading every coin against the bridge as get_fee returns it, indexed by CoinStub idx.
+
+        Fees are kept between calls with the inputs they were computed from. All of them are recomputed when the
+        trade fee table, the BNB burn flag or the balances change, the fee of a single coin when a ticker price it
+        depends on was updated. Coins get_fee fails for have a NaN fee.
+        """
+        shared_inputs, coin_inputs = self._get_fee_inputs(selling)
+        cached = self._fee_vectors.get(selling)
+        if cached is None or cached[0] != shared_inputs or cached[1].shape != coin_inputs.shape:
+            fees = np.full(len(coin_inputs), math.nan)
+            stale_idxs = range(len(coin_inputs))
+        else:
+            fees = cached[2]
+            stale_idxs = np.flatnonzero((coin_inputs != cached[1]).any(axis=1)).tolist()
+        bridge = self.config.BRIDGE.symbol
+        for idx in stale_idxs:
+            symbol = CoinStub.get_by_idx(idx).symbol
+            try:
+                fees[idx] = self.get_fee(symbol, bridge, selling)
+            except Exception as e:  # pylint: disable=broad-except
+                self.logger.debug(f"Fee of {symbol + bridge} can't be calculated: {e}")
+                fees[idx] = math.nan
+        self._fee_vectors[selling] = (shared_inputs, coin_inputs, fees)
+        return fees
+
     def close(self):
         if self.stream_manager:
             self.stream_manager.close()
@@ -248,32 +316,86 @@ class BinanceAPIManager:  # pylint:disable=too-many-public-methods
         """
         return self.binance_client.get_account()
 
+    @timed("get_market_sell_price")
     def get_market_sell_price(self, symbol: str, amount: float) -> (float, float):
         return self.stream_manager.get_market_sell_price(symbol, amount)
 
+    @timed("get_market_buy_price")
     def get_market_buy_price(self, symbol: str, quote_amount: float) -> (float, float):
         return self.stream_manager.get_market_buy_price(symbol, quote_amount)
 
+    @timed("get_market_sell_price_fill_quote")
     def get_market_sell_price_fill_quote(self, symbol: str, quote_amount: float) -> (float, float):
         return self.stream_manager.get_market_sell_price_fill_quote(symbol, quote_amount)
 
+    @timed("get_market_prices")
+    def get_market_prices(self, requests: List[MarketPriceRequest]) -> List[Tuple[float, float]]:
+        return self.stream_manager.get_market_prices(requests)
+
+    def set_resync_priorities(self, symbols: List[str]):
+        """
+        Order books to resync first after a websocket reconnect, most important first
+        """
+        if self.stream_manager:
+            self.stream_manager.set_resync_priorities(symbols)
+
+    def arm_scout_trigger(
+        self, symbol: str, sell_price: float, quote_amount: float, candidates: Dict[str, Tuple[float, float]]
+    ):
+        """
+        Let order book updates signal the next scout, see ScoutTrigger
+        """
+        if self.stream_manager:
+            self.stream_manager.scout_trigger.arm(symbol, sell_price, quote_amount, candidates)
+
     def get_ticker_price(self, ticker_symbol: str):
         """
         Get ticker price of a specific coin
         """
-        price = self.cache.ticker_values.get(ticker_symbol, None)
+        price = self.cache.ticker_prices.get_symbol(ticker_symbol)
+        if price is None:
+            price = self.cache.ticker_values.get(ticker_symbol, None)
         if price is None and ticker_symbol not in self.cache.non_existent_tickers:
+            ticker_prices = self.cache.ticker_prices
+            tickers = {ticker["symbol"]: float(ticker["price"]) for ticker in self.binance_client.get_symbol_ticker()}
+            self.logger.debug(f"Fetched all ticker prices: {tickers}")
+            now = time.time()
             self.cache.ticker_values = {
-                ticker["symbol"]: float(ticker["price"]) for ticker in self.binance_client.get_symbol_ticker()
+                symbol: value for symbol, value in tickers.items() if not ticker_prices.update(symbol, value, now)
             }
-            self.logger.debug(f"Fetched all ticker prices: {self.cache.ticker_values}")
-            price = self.cache.ticker_values.get(ticker_symbol, None)
+            price = tickers.get(ticker_symbol, None)
             if price is None:
                 self.logger.info(f"Ticker does not exist: {ticker_symbol} - will not be fetched from now on")
                 self.cache.non_existent_tickers.add(ticker_symbol)
 
         return price
 
+    def get_ticker_price_by_idx(self, coin_idx: int, quote_idx: int) -> Optional[float]:
+        """
+        Get ticker price of a coin by its CoinStub idx and the index of the quote asset in ticker_prices.quotes
+        """
+        price = self.cache.ticker_prices.get(coin_idx, quote_idx)
+        if price is None:
+            return self.get_ticker_price(self.cache.ticker_prices.symbol(coin_idx, quote_idx))
+        return price
+
+    def set_ticker_coins(self, coins: List[str]):
+        """
+        Align the coin axis of ticker prices with CoinStub indices
+        """
+        if self.cache.ticker_prices.coins != coins:
+            self.cache.ticker_prices = self.cache.ticker_prices.with_coins(coins)
+
+    def update_coins(self, coins: List[str]):
+        """
+        Follow a change of the coin list at runtime, coins in CoinStub order
+        """
+        self.set_ticker_coins(coins)
+        # fee vectors are indexed by CoinStub idx
+        self._fee_vectors.clear()
+        if self.stream_manager:
+            self.stream_manager.update_coins(coins)
+
     def get_currency_balance(self, currency_symbol: str, force=False) -> float:
         """
         Get balance of a specific coin
@@ -2,18 +2,63 @@ import abc
 import asyncio
 import concurrent.futures
 import threading
+import time
 import uuid
+from array import array
+from bisect import bisect_left
 from collections import deque
 from contextlib import asynccontextmanager, contextmanager, suppress
-from typing import Callable, Dict, List, Optional, Set, Union
+from functools import partial
+from itertools import accumulate, chain, islice
+from operator import itemgetter, mul
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple, Union
 
 import binance.client
-from binance.exceptions import BinanceAPIException
 from sortedcontainers import SortedDict
 from unicorn_binance_websocket_api import BinanceWebSocketApiManager
 
 from .config import Config
 from .logger import Logger
+from .market_recorder import MarketDataRecorder, symbol_of
+from .resync_scheduler import OrderBookResyncScheduler
+from .stream_parser import parse_depth_update, parse_mini_ticker
+from .ticker_prices import TickerPrices, ticker_quotes
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+
+def new_event_loop(event_loop="asyncio") -> asyncio.AbstractEventLoop:
+    """
+    :param event_loop: "asyncio", "uvloop" or "auto" for uvloop when it is installed
+    """
+    if event_loop == "uvloop" and uvloop is None:
+        raise ValueError("event loop 'uvloop' requested, but uvloop is not installed")
+    if event_loop != "asyncio" and uvloop is not None:
+        return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+def run_in_event_loop(main, event_loop="asyncio"):
+    """
+    asyncio.run with the loop of new_event_loop
+    """
+    loop = new_event_loop(event_loop)
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(main)
+    finally:
+        try:
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
 
 
 class ThreadSafeAsyncLock:
@@ -67,12 +112,20 @@ class BinanceOrder:  # pylint: disable=too-few-public-methods
 
 
 class BinanceCache:  # pylint: disable=too-few-public-methods
-    def __init__(self):
+    def __init__(self, ticker_prices: Optional[TickerPrices] = None):
+        self.ticker_prices = ticker_prices or TickerPrices()
+        # prices of the symbols without a slot in ticker_prices
         self.ticker_values: Dict[str, float] = {}
         self._balances: Dict[str, float] = {}
         self._balances_mutex: ThreadSafeAsyncLock = ThreadSafeAsyncLock()
         self.non_existent_tickers: Set[str] = set()
         self.balances_changed_event = threading.Event()
+        # incremented on every change of the balances, so values computed from them can be cached
+        self.balances_version = 0
+
+    def balances_changed(self):
+        self.balances_version += 1
+        self.balances_changed_event.set()
 
     def attach_loop(self):
         self._balances_mutex.attach_loop()
@@ -115,7 +168,8 @@ class DepthCache:
         if amount == 0:
             del self.bids[price]
         elif len(self.bids) >= self.max_size:
-            self.bids = SortedDict({k: self.bids[k] for k in self.bids.keys()[-self.keep_limit :]})
+            # drop the lowest bids in place instead of rebuilding the dict
+            del self.bids.keys()[: -self.keep_limit]
 
     def add_ask(self, ask):
         """Add an ask to the cache
@@ -129,7 +183,8 @@ class DepthCache:
         if amount == 0:
             del self.asks[price]
         elif len(self.asks) >= self.max_size:
-            self.asks = SortedDict({k: self.asks[k] for k in self.asks.keys()[: self.keep_limit]})
+            # drop the highest asks in place instead of rebuilding the dict
+            del self.asks.keys()[self.keep_limit :]
 
     def get_bids(self):
         """Get the current bids
@@ -197,48 +252,421 @@ class DepthCache:
         """
         return self.asks.items()
 
+    def snapshot_ladders(self) -> Tuple["DepthLadder", "DepthLadder"]:
+        # the prefix sums of fill queries are built once per published snapshot, not on every level update
+        return DepthLadder.from_levels(True, self.get_bids()), DepthLadder.from_levels(False, self.get_asks())
+
+    def clear(self):
+        self.bids.clear()
+        self.asks.clear()
+
+
+class DepthLadder:
+    """
+    One side of an order book stored in contiguous price/quantity arrays, best price first.
+
+    Levels are located with a binary search over sign-adjusted prices, so both sides are kept ascending
+    in search key order and truncation of the far levels is a single in-place slice deletion.
+
+    The ladder also keeps cumulative quantity and cumulative quote arrays. Every update only marks the
+    suffix starting from the touched level as stale, the stale suffix is recomputed once on the next fill
+    query, so a whole diff batch costs a single partial pass. A fill for any amount is then a bisect over
+    the prefix sums plus one interpolation inside the last touched level.
+    """
+
+    __slots__ = ("_sign", "_keys", "prices", "quantities", "_cum_quantities", "_cum_quotes", "_stale_from")
+
+    def __init__(self, descending: bool):
+        self._sign = -1.0 if descending else 1.0
+        self._keys = array("d")
+        self.prices = array("d")
+        self.quantities = array("d")
+        self._cum_quantities = array("d")
+        self._cum_quotes = array("d")
+        self._stale_from = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    @classmethod
+    def from_levels(cls, descending: bool, levels: Iterable[Tuple[float, float]]) -> "DepthLadder":
+        """
+        Build a ladder with up to date cumulative arrays from (price, quantity) levels that are already ordered
+        best price first
+        """
+        ladder = cls(descending)
+        for price, quantity in levels:
+            ladder.prices.append(price)
+            ladder.quantities.append(quantity)
+        ladder._keys.extend(map(ladder._sign.__mul__, ladder.prices))  # pylint: disable=protected-access
+        ladder._refresh_cumulative()  # pylint: disable=protected-access
+        return ladder
+
+    def copy(self) -> "DepthLadder":
+        """
+        Copy of the ladder with up to date cumulative arrays, so reading it never writes to it
+        """
+        self._refresh_cumulative()
+        ladder = DepthLadder(self._sign < 0)
+        for attr in ("_keys", "prices", "quantities", "_cum_quantities", "_cum_quotes"):
+            setattr(ladder, attr, getattr(self, attr)[:])
+        ladder._stale_from = self._stale_from  # pylint: disable=protected-access
+        return ladder
+
+    def update(self, price: float, quantity: float) -> int:
+        """
+        Set quantity for a price level, zero quantity removes the level
+
+        :return: index of the touched level
+        """
+        key = self._sign * price
+        idx = bisect_left(self._keys, key)
+        if idx < len(self._keys) and self._keys[idx] == key:
+            if quantity == 0:
+                del self._keys[idx]
+                del self.prices[idx]
+                del self.quantities[idx]
+            else:
+                self.quantities[idx] = quantity
+        elif quantity != 0:
+            self._keys.insert(idx, key)
+            self.prices.insert(idx, price)
+            self.quantities.insert(idx, quantity)
+        else:
+            return idx
+        if idx < self._stale_from:
+            self._stale_from = idx
+        return idx
+
+    def truncate(self, keep_limit: int):
+        del self._keys[keep_limit:]
+        del self.prices[keep_limit:]
+        del self.quantities[keep_limit:]
+        if keep_limit < self._stale_from:
+            self._stale_from = keep_limit
+
+    def items(self):
+        return zip(self.prices, self.quantities)
+
+    def clear(self):
+        self.truncate(0)
+
+    def _refresh_cumulative(self):
+        start = self._stale_from
+        size = len(self.quantities)
+        if start == size == len(self._cum_quantities):
+            return
+        del self._cum_quantities[start:]
+        del self._cum_quotes[start:]
+        qty_base = self._cum_quantities[-1] if start > 0 else 0.0
+        quote_base = self._cum_quotes[-1] if start > 0 else 0.0
+        self._cum_quantities.extend(islice(accumulate(chain((qty_base,), self.quantities[start:])), 1, None))
+        self._cum_quotes.extend(
+            islice(accumulate(chain((quote_base,), map(mul, self.prices[start:], self.quantities[start:]))), 1, None)
+        )
+        self._stale_from = size
+
+    def _fill_level(self, cumulative: array, value: float) -> int:
+        """
+        :return: index of the level where filling of value ends or -1 if the ladder is too shallow
+        """
+        idx = bisect_left(cumulative, value)
+        if idx == len(cumulative):
+            if idx == 0 or value - cumulative[-1] > 1e-15:
+                return -1
+            idx -= 1
+        return idx
+
+    def fill_quantity(self, quantity: float) -> Optional[float]:
+        """
+        :return: quote amount received (or paid) for filling quantity of base asset, None if not enough depth
+        """
+        self._refresh_cumulative()
+        idx = self._fill_level(self._cum_quantities, quantity)
+        if idx < 0:
+            return None
+        if idx == 0:
+            return self.prices[0] * quantity
+        return self._cum_quotes[idx - 1] + self.prices[idx] * (quantity - self._cum_quantities[idx - 1])
+
+    def fill_quote(self, quote: float) -> Optional[float]:
+        """
+        :return: base asset quantity filled for the quote amount, None if not enough depth
+        """
+        self._refresh_cumulative()
+        idx = self._fill_level(self._cum_quotes, quote)
+        if idx < 0:
+            return None
+        if idx == 0:
+            return quote / self.prices[0]
+        return self._cum_quantities[idx - 1] + (quote - self._cum_quotes[idx - 1]) / self.prices[idx]
+
+
+class ArrayDepthCache:
+    def __init__(self, keep_limit=200, max_size=400):
+        """Initialise the array backed DepthCache
+
+        It has the same interface as DepthCache, but keeps each side in a DepthLadder
+        instead of SortedDict, so updates and truncation don't allocate new containers.
+
+        :param keep_limit: How many items to keep in each ladder after wipe
+        :type keep_limit: int
+        :param max_size: Max size of ladder after which wipe occurs
+        :type max_size: int
+
+        """
+        self.bids = DepthLadder(descending=True)
+        self.asks = DepthLadder(descending=False)
+        self.keep_limit = keep_limit
+        self.max_size = max_size
+
+    def add_bid(self, bid):
+        self.bids.update(float(bid[0]), float(bid[1]))
+        if len(self.bids) >= self.max_size:
+            self.bids.truncate(self.keep_limit)
+
+    def add_ask(self, ask):
+        self.asks.update(float(ask[0]), float(ask[1]))
+        if len(self.asks) >= self.max_size:
+            self.asks.truncate(self.keep_limit)
+
+    def get_bids(self):
+        """Get the current bids, best (highest) price first, see DepthCache.get_bids"""
+        return self.bids.items()
+
+    def get_asks(self):
+        """Get the current asks, best (lowest) price first, see DepthCache.get_asks"""
+        return self.asks.items()
+
+    def snapshot_ladders(self) -> Tuple[DepthLadder, DepthLadder]:
+        return self.bids.copy(), self.asks.copy()
+
     def clear(self):
         self.bids.clear()
         self.asks.clear()
 
 
-class DepthCacheManager:
-    def __init__(self, symbol, client: binance.AsyncClient, logger: Logger, limit=100):
+DEPTH_CACHE_TYPES = {"sorted": DepthCache, "array": ArrayDepthCache}
+
+
+class DepthSnapshot:
+    """
+    Immutable copy of an order book published by DepthCacheManager after each applied diff batch.
+
+    A published snapshot is never modified, so any thread may read it without synchronization. The version is
+    incremented on every publication of the same DepthCacheManager and last_update_id is the last diff id applied.
+    """
+
+    __slots__ = ("version", "last_update_id", "bids", "asks")
+
+    def __init__(self, version: int, last_update_id: int, bids: DepthLadder, asks: DepthLadder):
+        self.version = version
+        self.last_update_id = last_update_id
+        self.bids = bids
+        self.asks = asks
+
+    def is_newer_than(self, version: int) -> bool:
+        return self.version > version
+
+    def get_market_sell_price_fill_quote(self, quote: float):
+        if abs(quote) <= 1e-15:
+            return 0.0, 0.0
+        amount = self.bids.fill_quote(quote)
+        if amount is None:
+            return None, None
+        return quote / amount, amount
+
+    def get_market_sell_price(self, amount: float):
+        if abs(amount) <= 1e-15:
+            return 0.0, 0.0
+        quote = self.bids.fill_quantity(amount)
+        if quote is None:
+            return None, None
+        return quote / amount, quote
+
+    def get_market_buy_price(self, quote_amount: float):
+        if abs(quote_amount) <= 1e-15:
+            return 0.0, 0.0
+        amount = self.asks.fill_quote(quote_amount)
+        if amount is None:
+            return None, None
+        return quote_amount / amount, amount
+
+    def __repr__(self):
+        return f"<DepthSnapshot v{self.version} id={self.last_update_id} bids={len(self.bids)} asks={len(self.asks)}>"
+
+
+# sides of a market price request, amount is in base asset for MARKET_SELL and in quote asset otherwise
+MARKET_SELL = "sell"
+MARKET_SELL_FILL_QUOTE = "sell_fill_quote"
+MARKET_BUY = "buy"
+MARKET_PRICE_METHODS = {
+    MARKET_SELL: "get_market_sell_price",
+    MARKET_SELL_FILL_QUOTE: "get_market_sell_price_fill_quote",
+    MARKET_BUY: "get_market_buy_price",
+}
+
+MarketPriceRequest = Tuple[str, str, float]
+
+
+class DepthCacheManager:  # pylint: disable=too-many-instance-attributes
+    PRICE_MEMO_SIZE = 64
+
+    def __init__(
+        self,
+        symbol,
+        client: binance.AsyncClient,
+        logger: Logger,
+        limit=100,
+        depth_cache_factory: Callable[[], Union[DepthCache, ArrayDepthCache]] = DepthCache,
+        resync_scheduler: Optional[OrderBookResyncScheduler] = None,
+    ):  # pylint:disable=too-many-arguments
         self.id = uuid.uuid4()
         self.pending_signals_counter = 0
-        self.pending_reinit = False
+        self.pending_reinits = 0
         self.data_queue = deque()
         self.symbol = symbol
-        self.depth_cache = DepthCache()
+        self.depth_cache = depth_cache_factory()
         self.client = client
         self.limit = limit
         self.last_update_id = -1
         self.logger = logger
+        self.resync_scheduler = resync_scheduler or OrderBookResyncScheduler(client, logger)
+        self._reinit_lock: Optional[asyncio.Lock] = None
+        self.reinit_tasks: Set[asyncio.Task] = set()
+        self.snapshot = DepthSnapshot(0, self.last_update_id, *self.depth_cache.snapshot_ladders())
+        self._price_memo: Tuple[int, Dict[Tuple[str, float], Tuple[float, float]]] = (self.snapshot.version, {})
+        self.price_memo_hits = 0
+        self.price_memo_misses = 0
+        self.max_queue_size = 0
+        self.diffs_merged = 0
+        self.batches_applied = 0
+        self.stream_overlaps = 0
+        self.held_data: List[Dict] = []
+
+    def publish_snapshot(self):
+        self.snapshot = DepthSnapshot(
+            self.snapshot.version + 1, self.last_update_id, *self.depth_cache.snapshot_ladders()
+        )
 
-    async def _handle_data(self, data):
+    def get_market_price(self, side: str, amount: float):
+        """
+        Market price of the latest snapshot, memoized by (side, amount) until a newer snapshot is published
+        """
+        snapshot = self.snapshot
+        version, memo = self._price_memo
+        if version != snapshot.version or len(memo) >= self.PRICE_MEMO_SIZE:
+            memo = {}
+            self._price_memo = (snapshot.version, memo)
+        key = (side, amount)
+        result = memo.get(key)
+        if result is None:
+            self.price_memo_misses += 1
+            result = memo[key] = getattr(snapshot, MARKET_PRICE_METHODS[side])(amount)
+        else:
+            self.price_memo_hits += 1
+        return result
+
+    def _merge_data(self, data, bids: Dict[str, str], asks: Dict[str, str]) -> bool:
+        """
+        Merge levels of the event into bids and asks if it continues the sequence of the book
+
+        :return: True if the event was merged
+        """
         if data["final_update_id_in_event"] <= self.last_update_id:
-            return  # ignore
+            return False  # ignore
         if data["first_update_id_in_event"] > self.last_update_id + 1:
+            if self.stream_overlaps > 0:
+                # the other connection of a hot swap may still deliver the missing events
+                self.held_data.append(data)
+                return False
             self.logger.debug(
                 f"OB: {self.symbol} reinit, update delta: {data['first_update_id_in_event'] - self.last_update_id}"
             )
-            await self.reinit()
-            return
-        self.apply_orders(data)
+            # keep the event, it may continue the sequence of the upcoming snapshot
+            self.data_queue.appendleft(data)
+            self.request_reinit()
+            return False
+        # only the latest quantity of a price level matters
+        bids.update(data["bids"])
+        asks.update(data["asks"])
         self.last_update_id = data["final_update_id_in_event"]
+        return True
 
     def buffer_incoming_data(self) -> bool:
-        return self.pending_signals_counter > 0 or self.pending_reinit
+        return self.pending_signals_counter > 0 or self.pending_reinits > 0
 
-    async def process_data(self, data):
-        if self.buffer_incoming_data():
-            self.data_queue.append(data)
-            return
+    def drain_data_queue(self):
+        """
+        Coalesce every queued event continuing the sequence into a single level map and apply it at once
+        """
+        bids: Dict[str, str] = {}
+        asks: Dict[str, str] = {}
+        merged = 0
+        while len(self.data_queue) > 0 and not self.buffer_incoming_data():
+            if self._merge_data(self.data_queue.popleft(), bids, asks):
+                merged += 1
+        if self.held_data and not self.buffer_incoming_data():
+            merged += self._merge_held_data(bids, asks)
+        if merged > 0:
+            self.apply_orders({"bids": bids.items(), "asks": asks.items()})
+            self.diffs_merged += merged
+            self.batches_applied += 1
+            self.publish_snapshot()
+
+    def _merge_held_data(self, bids: Dict[str, str], asks: Dict[str, str]) -> int:
+        """
+        Merge held events the sequence reached meanwhile, in order of their update ids
 
-        while len(self.data_queue) > 0:
-            pop_data = self.data_queue.popleft()
-            await self._handle_data(pop_data)
-        await self._handle_data(data)
+        :return: number of events merged
+        """
+        held = sorted(self.held_data, key=itemgetter("first_update_id_in_event"))
+        self.held_data = []
+        merged = 0
+        for data in held:
+            if data["final_update_id_in_event"] <= self.last_update_id:
+                continue
+            if data["first_update_id_in_event"] > self.last_update_id + 1:
+                self.held_data.append(data)
+                continue
+            bids.update(data["bids"])
+            asks.update(data["asks"])
+            self.last_update_id = data["final_update_id_in_event"]
+            merged += 1
+        return merged
+
+    def begin_stream_overlap(self):
+        """
+        A second connection delivers the same events until end_stream_overlap, events ahead of the sequence are held
+        instead of resyncing the book
+        """
+        self.stream_overlaps += 1
+
+    def end_stream_overlap(self):
+        if self.stream_overlaps == 1:
+            # events of both connections may still be queued and fill each other's gaps
+            self.drain_data_queue()
+        self.stream_overlaps = max(self.stream_overlaps - 1, 0)
+        if self.stream_overlaps == 0 and self.held_data:
+            # no connection delivered the missing events, so the sequence did break
+            self.data_queue.extendleft(reversed(self.held_data))
+            self.held_data = []
+            self.drain_data_queue()
+
+    def enqueue_data(self, data):
+        self.data_queue.append(data)
+        self.max_queue_size = max(self.max_queue_size, len(self.data_queue))
+
+    def get_queue_stats(self) -> Tuple[int, int, float]:
+        """
+        :return: (queued events, max queued events, average number of events merged into an applied batch)
+        """
+        merge_ratio = self.diffs_merged / self.batches_applied if self.batches_applied else 0.0
+        return len(self.data_queue), self.max_queue_size, merge_ratio
+
+    async def process_data(self, data):
+        self.enqueue_data(data)
+        self.drain_data_queue()
 
     def apply_orders(self, msg):
         for bid in msg["bids"]:
@@ -246,34 +674,217 @@ class DepthCacheManager:
         for ask in msg["asks"]:
             self.depth_cache.add_ask(ask)
 
+    def request_reinit(self):
+        """
+        Resync the book from a REST snapshot in background, incoming data is buffered meanwhile
+        """
+        self.pending_reinits += 1  # stops the drain right away, even while another resync is running
+        task = asyncio.create_task(self._reinit())
+        self.reinit_tasks.add(task)
+        task.add_done_callback(self.reinit_tasks.discard)
+
     async def reinit(self):
-        self.pending_reinit = True
+        self.pending_reinits += 1
+        await self._reinit()
+
+    async def _reinit(self):
+        if self._reinit_lock is None:
+            self._reinit_lock = asyncio.Lock()
+        try:
+            async with self._reinit_lock:
+                resynced = await self._resync()
+        finally:
+            self.pending_reinits -= 1
+        if resynced:
+            # buffered events may still not continue the snapshot, then another resync is requested
+            self.drain_data_queue()
+        else:
+            self.request_reinit()
+
+    async def _resync(self) -> bool:
+        """
+        :return: False if the book couldn't be fetched and applied, so it has to be requested again
+        """
+        self.resync_scheduler.mark_unsynced(self.symbol)
         self.depth_cache.clear()
-        while True:
-            try:
-                res = await self.client.get_order_book(symbol=self.symbol, limit=self.limit)
-            except BinanceAPIException as e:
-                self.logger.error(f"Error while fetching snapshot of order book: {e}")
-                await asyncio.sleep(0.5)
-            else:
-                break
-        self.apply_orders(res)
+        self.publish_snapshot()
+        try:
+            res = await self.resync_scheduler.fetch_order_book(self.symbol, self.limit)
+            self.apply_orders(res)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:  # pylint: disable=broad-except
+            self.logger.error(f"OB: {self.symbol} resync failed: {e!r}")
+            self.depth_cache.clear()
+            await asyncio.sleep(self.resync_scheduler.RETRY_DELAY)
+            return False
         self.last_update_id = res["lastUpdateId"]
-        self.pending_reinit = False
+        self.publish_snapshot()
+        self.resync_scheduler.mark_synced(self.symbol)
+        return True
 
     async def process_signal(self, signal):
-        if signal["type"] == "CONNECT":
-            self.logger.debug(f"OB: CONNECT arrived for symbol {self.symbol}")
-            await self.reinit()
-        elif signal["type"] == "DISCONNECT":
-            self.logger.debug(f"OB: DISCONNECT arrived for symbol {self.symbol}")
-            self.depth_cache.clear()
-        self.pending_signals_counter -= 1
+        try:
+            if signal["type"] == "CONNECT":
+                self.logger.debug(f"OB: CONNECT arrived for symbol {self.symbol}")
+                await self.reinit()
+            elif signal["type"] == "DISCONNECT":
+                self.logger.debug(f"OB: DISCONNECT arrived for symbol {self.symbol}")
+                self.depth_cache.clear()
+                self.last_update_id = -1  # book is empty, so next event can't continue its sequence
+                self.publish_snapshot()
+        finally:
+            self.pending_signals_counter -= 1
         assert self.pending_signals_counter >= 0
+        self.drain_data_queue()
 
     def notify_pending_signal(self):
         self.pending_signals_counter += 1
 
+    def close(self):
+        """
+        Stop resyncing the book of a symbol that is no longer traded
+        """
+        for task in self.reinit_tasks:
+            task.cancel()
+        self.resync_scheduler.mark_synced(self.symbol)
+
+
+class ArmedScout:  # pylint: disable=too-few-public-methods
+    """
+    Prices of the last scout a ScoutTrigger compares newer order books with
+    """
+
+    __slots__ = ("symbol", "amount", "sell_price", "sell_growth", "quote_amount", "candidates")
+
+    def __init__(self, symbol: str, sell_price: float, quote_amount: float, candidates: Dict[str, Tuple[float, float]]):
+        self.symbol = symbol
+        self.amount = quote_amount / sell_price
+        self.sell_price = sell_price
+        self.sell_growth = 1.0
+        self.quote_amount = quote_amount
+        # [buy price, required growth, buy price growth] per candidate symbol
+        self.candidates = {symbol: [buy_price, required, 1.0] for symbol, (buy_price, required) in candidates.items()}
+
+
+class ScoutTrigger:
+    """
+    Wakes the trading thread when order book updates may have pushed a jump from the current coin over its threshold.
+
+    A scout that didn't jump arms the trigger with the prices it evaluated: the sell price of the current coin for
+    the quote amount it yields, the buy price of every candidate for that quote amount and how much the sell price /
+    buy price ratio of each candidate has to grow to reach its threshold. After each applied depth batch the stream
+    thread prices the same amounts on the new books of these symbols and sets the event once a ratio grew enough.
+    The armed prices are consumed by the wait that returns the signal, the next scout arms them again. Fee and
+    target ratio changes between two scouts aren't tracked, the scheduled scout still covers them.
+
+    The snapshots are priced directly, the price memo of DepthCacheManager is left to the trading thread, so its hit
+    rate only counts scout queries.
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.signals = 0
+        self._armed: Optional[ArmedScout] = None
+        self._last_scout = 0.0
+
+    def arm(self, symbol: str, sell_price: float, quote_amount: float, candidates: Dict[str, Tuple[float, float]]):
+        """
+        :param candidates: (buy price, required growth of the sell price / buy price ratio) per candidate symbol
+        """
+        self._armed = ArmedScout(symbol, sell_price, quote_amount, candidates)
+
+    def check(self, dcm: DepthCacheManager):
+        armed = self._armed
+        if armed is None or self.event.is_set():
+            return
+        if dcm.symbol == armed.symbol:
+            price, _ = dcm.snapshot.get_market_sell_price(armed.amount)
+            if price is None:
+                return
+            armed.sell_growth = price / armed.sell_price
+            best_growth = max((growth / required for _, required, growth in armed.candidates.values()), default=0.0)
+        else:
+            candidate = armed.candidates.get(dcm.symbol)
+            if candidate is None:
+                return
+            price, _ = dcm.snapshot.get_market_buy_price(armed.quote_amount)
+            if not price:
+                return
+            candidate[2] = candidate[0] / price
+            best_growth = candidate[2] / candidate[1]
+        if armed.sell_growth * best_growth >= 1.0:
+            self.signals += 1
+            self.event.set()
+
+    def wait(self, timeout: float, debounce=0.0, min_interval=0.0) -> bool:
+        """
+        Wait for a signal, then debounce seconds for the rest of a burst of updates and until min_interval seconds
+        passed since the previous signalled scout
+
+        :return: True if a scout should run now
+        """
+        if not self.event.wait(timeout):
+            return False
+        time.sleep(max(debounce, self._last_scout + min_interval - time.monotonic()))
+        self._armed = None
+        self.event.clear()
+        self._last_scout = time.monotonic()
+        return True
+
+
+OVERFLOW_DROP_RESYNC = "drop_resync"  # drop the new message and resync the order book of its symbol
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # drop the oldest queued message
+OVERFLOW_NEVER_DROP = "never_drop"  # keep queueing, a warning is logged when the buffer gets full
+
+
+class StreamQueue(asyncio.Queue):
+    """
+    asyncio.Queue of stream messages, bounds are enforced by AsyncListenerContext so signals are never dropped
+    """
+
+    def drop_oldest_data(self) -> bool:
+        """
+        :return: False if only signals are queued
+        """
+        for idx, item in enumerate(self._queue):
+            if not AsyncListener.is_stream_signal(item):
+                del self._queue[idx]
+                return True
+        return False
+
+
+def event_time_of(data: Dict) -> Optional[float]:
+    """
+    :return: event time of a parsed stream message in seconds, the latest one of multi symbol messages
+    """
+    event_time = data.get("event_time")
+    if event_time is None:
+        items = data.get("data")
+        if isinstance(items, list) and items:
+            event_time = items[-1].get("event_time")
+    return None if event_time is None else event_time / 1000
+
+
+class LagStats:
+    """
+    The latest event-time-to-apply lags of a stream buffer, in seconds
+    """
+
+    def __init__(self, size=4096):
+        self.lags = array("d", [0.0]) * size
+        self.count = 0
+
+    def add(self, lag: float):
+        self.lags[self.count % len(self.lags)] = lag
+        self.count += 1
+
+    def percentiles(self, *quantiles: float) -> Tuple[Optional[float], ...]:
+        lags = sorted(self.lags[: min(self.count, len(self.lags))])
+        if not lags:
+            return tuple(None for _ in quantiles)
+        return tuple(lags[min(int(quantile * len(lags)), len(lags) - 1)] for quantile in quantiles)
+
 
 class AsyncListenerContext:
     def __init__(
@@ -283,8 +894,22 @@ class AsyncListenerContext:
         logger: Logger,
         client: binance.AsyncClient,
         depth_cache_managers: Dict[str, DepthCacheManager],
-    ):
-        self.queues: Dict[str, asyncio.Queue] = {name: asyncio.Queue() for name in buffer_names}
+        recorder: Optional[MarketDataRecorder] = None,
+        max_queue_size=0,
+        overflow_policies: Optional[Dict[str, str]] = None,
+    ):  # pylint:disable=too-many-arguments
+        """
+        :param max_queue_size: data messages a buffer holds before its overflow policy applies, 0 for unbounded
+        :param overflow_policies: OVERFLOW_* policy per buffer name, OVERFLOW_POLICIES by default
+        """
+        self.queues: Dict[str, StreamQueue] = {name: StreamQueue() for name in buffer_names}
+        self.max_queue_size = max_queue_size
+        self.overflow_policies = OVERFLOW_POLICIES if overflow_policies is None else overflow_policies
+        self.dropped_messages = {name: 0 for name in buffer_names}
+        self.lag_stats = {name: LagStats() for name in buffer_names}
+        # messages of the websocket threads, moved to the queues by one loop callback per wakeup
+        self.incoming: Deque[Tuple[object, str]] = deque()
+        self.incoming_drain_scheduled = False
         self.loop = asyncio.get_running_loop()
         self.buffer_names = buffer_names
         self.cache = cache
@@ -294,13 +919,29 @@ class AsyncListenerContext:
         self.client = client
         self.depth_cache_managers = depth_cache_managers
         self.replace_signals = {"CONNECT": set(), "DISCONNECT": set()}
+        # signals of replace_signals delimiting a hot swap, see AutoReplacingStream
+        self.hot_swap_signals = {"CONNECT": set(), "DISCONNECT": set()}
+        self.recorder = recorder
+        self.scout_trigger = ScoutTrigger()
 
     def attach_stream_uuid_resolver(self, resolver: Callable[[uuid.UUID], str]):
         self.resolver = resolver
 
-    def notify_stream_replace(self, old_stream_id: uuid.UUID, new_stream_id: uuid.UUID):
+    def notify_stream_replace(self, old_stream_id: uuid.UUID, new_stream_id: uuid.UUID, hot_swap=False):
         self.replace_signals["CONNECT"].add(new_stream_id)
         self.replace_signals["DISCONNECT"].add(old_stream_id)
+        if hot_swap:
+            self.hot_swap_signals["CONNECT"].add(new_stream_id)
+            self.hot_swap_signals["DISCONNECT"].add(old_stream_id)
+
+    def cancel_stream_replace(self, old_stream_id: uuid.UUID, new_stream_id: uuid.UUID):
+        """
+        The new stream is stopped instead of the old one, so the disconnect of the new stream is expected instead
+        """
+        for signals in (self.replace_signals, self.hot_swap_signals):
+            if old_stream_id in signals["DISCONNECT"]:
+                signals["DISCONNECT"].remove(old_stream_id)
+                signals["DISCONNECT"].add(new_stream_id)
 
     def resolve_stream_id(self, stream_id: uuid.UUID) -> str:
         return self.resolver(stream_id)
@@ -308,70 +949,50 @@ class AsyncListenerContext:
     def add_stream_data(self, stream_data, stream_buffer_name: Union[str, bool] = False):
         if self.stopped:
             return
-        asyncio.run_coroutine_threadsafe(self.queues[stream_buffer_name].put(stream_data), self.loop)
-
-    async def get_market_sell_price_fill_quote(self, symbol: str, quote: float):
-        depth_cache = self.depth_cache_managers[symbol].depth_cache
-        amount = 0.0
-        unfilled_quote = quote
-        filled = False
-        if abs(quote) <= 1e-15:
-            return 0.0, 0.0
-        for (price, bid_amount) in reversed(depth_cache.bids.items()):
-            curr_amount = unfilled_quote / price
-            fill = min(bid_amount, curr_amount)
-            amount += fill
-            unfilled_quote -= price * fill
-            if abs(unfilled_quote) <= 1e-15:
-                filled = True
-                break
-        if not filled:
-            return None, None
-        return quote / amount, amount
-
-    async def get_market_sell_price(self, symbol: str, amount: float):
-        depth_cache = self.depth_cache_managers[symbol].depth_cache
-        quote = 0.0
-        unfilled_amount = amount
-        filled = False
-        if abs(amount) <= 1e-15:
-            return 0.0, 0.0
-        for (price, bid_amount) in reversed(depth_cache.bids.items()):
-            fill = min(bid_amount, unfilled_amount)
-            quote += price * fill
-            unfilled_amount -= fill
-            if abs(unfilled_amount) <= 1e-15:
-                filled = True
-                break
-        if not filled:
-            return None, None
-        return quote / amount, quote
-
-    async def get_market_buy_price(self, symbol: str, quote_amount: float):
-        depth_cache = self.depth_cache_managers[symbol].depth_cache
-        amount = 0.0
-        unfilled_quote = quote_amount
-        filled = False
-        if abs(quote_amount) <= 1e-15:
-            return 0.0, 0.0
-        for (price, ask_amount) in depth_cache.asks.items():
-            curr_amount = unfilled_quote / price
-            fill = min(curr_amount, ask_amount)
-            amount += fill
-            unfilled_quote -= fill * price
-            if abs(unfilled_quote) <= 1e-15:
-                filled = True
-                break
-        if not filled:
-            return None, None
-        return quote_amount / amount, amount
+        self.incoming.append((stream_data, stream_buffer_name))
+        self.schedule_incoming_drain()
+
+    def schedule_incoming_drain(self):
+        # the flag is cleared before the drain, so a message appended meanwhile is drained or schedules another one
+        if not self.incoming_drain_scheduled:
+            self.incoming_drain_scheduled = True
+            self.loop.call_soon_threadsafe(self.drain_incoming)
+
+    def drain_incoming(self):
+        self.incoming_drain_scheduled = False
+        incoming = self.incoming
+        while incoming:
+            data, buffer_name = incoming.popleft()
+            if AsyncListener.is_stream_signal(data):
+                self.queues[buffer_name].put_nowait(data)
+            else:
+                self.put_stream_data(data, buffer_name)
+
+    def put_stream_data(self, stream_data, buffer_name: str):
+        queue = self.queues[buffer_name]
+        if 0 < self.max_queue_size <= queue.qsize():
+            policy = self.overflow_policies.get(buffer_name, OVERFLOW_NEVER_DROP)
+            if policy == OVERFLOW_DROP_RESYNC:
+                self.dropped_messages[buffer_name] += 1
+                dcm = self.depth_cache_managers.get(symbol_of(stream_data))
+                if dcm is not None and not dcm.buffer_incoming_data():
+                    dcm.request_reinit()
+                return
+            if policy == OVERFLOW_DROP_OLDEST:
+                if not queue.drop_oldest_data():
+                    return
+                self.dropped_messages[buffer_name] += 1
+            elif queue.qsize() == self.max_queue_size:
+                self.logger.warning(f"Stream buffer {buffer_name} holds {self.max_queue_size} messages")
+        queue.put_nowait(stream_data)
 
     def add_signal_data(self, signal_data: Dict):
         if self.stopped:
             return
         stream_id = signal_data["stream_id"]
-        buffer_name = self.resolver(stream_id)
-        asyncio.run_coroutine_threadsafe(self.queues[buffer_name].put(signal_data), self.loop)
+        # same path as the data, so signals keep their order relative to it
+        self.incoming.append((signal_data, self.resolver(stream_id)))
+        self.schedule_incoming_drain()
 
     async def shutdown(self):
         self.logger.debug("prepare graceful loop shutdown")
@@ -382,6 +1003,8 @@ class AsyncListenerContext:
         await asyncio.gather(*tasks, return_exceptions=True)
         self.logger.debug("loop shutdown")
         self.resolver = None  # to prevent circular ref
+        if self.recorder is not None:
+            self.recorder.close()
         self.loop.stop()
 
 
@@ -415,21 +1038,35 @@ BUFFER_NAME_MINITICKERS = "mt"
 BUFFER_NAME_USERDATA = "ud"
 BUFFER_NAME_DEPTH = "de"
 
+OVERFLOW_POLICIES = {
+    BUFFER_NAME_MINITICKERS: OVERFLOW_DROP_OLDEST,  # only the latest prices matter
+    BUFFER_NAME_USERDATA: OVERFLOW_NEVER_DROP,
+    BUFFER_NAME_DEPTH: OVERFLOW_DROP_RESYNC,  # a book missing an update is wrong until resynced
+}
+
 
 class LoopExecutor(abc.ABC):  # pylint:disable=too-few-public-methods
     @abc.abstractmethod
-    async def run_loop(self):
-        ...
+    async def run_loop(self): ...
 
 
 class AsyncListener(LoopExecutor):
-    def __init__(self, buffer_name: str, async_context: AsyncListenerContext):
+    def __init__(
+        self,
+        buffer_name: str,
+        async_context: AsyncListenerContext,
+        parser: Optional[Callable[[str], Optional[Dict]]] = None,
+    ):
+        """
+        :param parser: converts raw payloads of streams created with "raw_data" output, see stream_parser
+        """
         self.buffer_name = buffer_name
         self.async_context = async_context
+        self.parser = parser
 
     @staticmethod
     def is_stream_signal(obj):
-        return "type" in obj
+        return isinstance(obj, dict) and "type" in obj
 
     async def handle_signal(self, signal):  # pylint: disable=unused-argument
         ...
@@ -437,7 +1074,24 @@ class AsyncListener(LoopExecutor):
     async def handle_data(self, data):  # pylint: disable=unused-argument
         ...
 
+    async def handle_stream_overlap(self, started: bool):  # pylint: disable=unused-argument
+        """
+        Called when the new connection of a hot swap connects (started) and when the old one disconnects, every
+        message of the old connection was handled before the latter
+        """
+        ...
+
+    def record_lag(self, data: Dict):
+        """
+        Called once data was handled, for the event-time-to-apply lag stats
+        """
+        event_time = event_time_of(data)
+        if event_time is not None:
+            self.async_context.lag_stats[self.buffer_name].add(time.time() - event_time)
+
     async def run_loop(self):
+        # messages are recorded in the order they are consumed here, so a replay reproduces this order exactly
+        recorder = self.async_context.recorder
         while True:
             data = await self.async_context.queues[self.buffer_name].get()
 
@@ -451,21 +1105,41 @@ class AsyncListener(LoopExecutor):
                         self.async_context.logger.debug(
                             [(sig, len(x)) for sig, x in self.async_context.replace_signals.items()]
                         )
-                        continue
-                await self.handle_signal(data)
-            else:
-                await self.handle_data(data)
+                        hot_swap_signals = self.async_context.hot_swap_signals[signal_type]
+                        if stream_id not in hot_swap_signals:
+                            continue
+                        hot_swap_signals.remove(stream_id)
+                        data = dict(data, hot_swap=True)  # marked, so a replay of the recording sees it too
+                if recorder is not None:
+                    recorder.record_signal(data, self.buffer_name)
+                if data.get("hot_swap"):
+                    await self.handle_stream_overlap(signal_type == "CONNECT")
+                else:
+                    await self.handle_signal(data)
+                continue
+            if recorder is not None:
+                recorder.record_data(data, self.buffer_name)
+            if self.parser is not None and isinstance(data, str):
+                data = self.parser(data)
+                if data is None:
+                    continue
+            await self.handle_data(data)
+            self.record_lag(data)
 
 
 class TickerListener(AsyncListener):
-    def __init__(self, async_context: AsyncListenerContext):
-        super().__init__(BUFFER_NAME_MINITICKERS, async_context)
+    def __init__(self, async_context: AsyncListenerContext, parser: Optional[Callable[[str], Optional[Dict]]] = None):
+        super().__init__(BUFFER_NAME_MINITICKERS, async_context, parser)
 
     async def handle_data(self, data):
         if "event_type" in data:
             if data["event_type"] == "24hrMiniTicker":
+                ticker_prices = self.async_context.cache.ticker_prices
+                now = time.time()
                 for event in data["data"]:
-                    self.async_context.cache.ticker_values[event["symbol"]] = float(event["close_price"])
+                    price = float(event["close_price"])
+                    if not ticker_prices.update(event["symbol"], price, now):
+                        self.async_context.cache.ticker_values[event["symbol"]] = price
             else:
                 self.async_context.logger.error(f"Unknown event type found: {data}")
 
@@ -484,18 +1158,18 @@ class UserDataListener(AsyncListener):
                     asset = data["asset"]
                     if asset in balances:
                         del balances[data["asset"]]
-                    self.async_context.cache.balances_changed_event.set()
+                    self.async_context.cache.balances_changed()
             elif event_type in ("outboundAccountPosition", "outboundAccountInfo"):
                 self.async_context.logger.debug(f"{event_type}: {data}")
                 async with self.async_context.cache.open_balances_async() as balances:
                     for bal in data["balances"]:
                         balances[bal["asset"]] = float(bal["free"])
-                    self.async_context.cache.balances_changed_event.set()
+                    self.async_context.cache.balances_changed()
 
     async def _invalidate_balances(self):
         async with self.async_context.cache.open_balances_async() as balances:
             balances.clear()
-            self.async_context.cache.balances_changed_event.set()
+            self.async_context.cache.balances_changed()
 
     async def handle_signal(self, signal):
         signal_type = signal["type"]
@@ -505,19 +1179,66 @@ class UserDataListener(AsyncListener):
 
 
 class DepthListener(AsyncListener):
-    def __init__(self, async_context: AsyncListenerContext, depth_cache_managers: Dict[str, DepthCacheManager]):
-        super().__init__(BUFFER_NAME_DEPTH, async_context)
+    def __init__(
+        self,
+        async_context: AsyncListenerContext,
+        depth_cache_managers: Dict[str, DepthCacheManager],
+        parser: Optional[Callable[[str], Optional[Dict]]] = None,
+    ):
+        super().__init__(BUFFER_NAME_DEPTH, async_context, parser)
         self.depth_cache_managers = depth_cache_managers
+        self.signal_tasks: Set[asyncio.Task] = set()
+        self.pending_drains: Set[DepthCacheManager] = set()
+        self.pending_event_times: List[float] = []
 
     async def handle_data(self, data):
+        # Events are only queued per symbol here. Queues are drained once the shared buffer is empty, so when
+        # the loop falls behind the backlog of every symbol is merged and applied as a single batch
         if "symbol" in data:
-            await self.depth_cache_managers[data["symbol"]].process_data(data)
+            dcm = self.depth_cache_managers.get(data["symbol"])
+            if dcm is None:
+                # sent before the symbol was unsubscribed
+                return
+            if not self.pending_drains:
+                asyncio.get_running_loop().call_soon(self.drain_pending)
+            dcm.enqueue_data(data)
+            self.pending_drains.add(dcm)
+
+    def drain_pending(self):
+        pending_drains, self.pending_drains = self.pending_drains, set()
+        scout_trigger = self.async_context.scout_trigger
+        for dcm in pending_drains:
+            dcm.drain_data_queue()
+            scout_trigger.check(dcm)
+        now = time.time()
+        lag_stats = self.async_context.lag_stats[self.buffer_name]
+        for event_time in self.pending_event_times:
+            lag_stats.add(now - event_time)
+        self.pending_event_times.clear()
+
+    def record_lag(self, data: Dict):
+        # queued events are applied by drain_pending
+        event_time = event_time_of(data)
+        if event_time is not None and "symbol" in data:
+            self.pending_event_times.append(event_time)
+
+    async def handle_stream_overlap(self, started: bool):
+        for dcm in self.depth_cache_managers.values():
+            if started:
+                dcm.begin_stream_overlap()
+            else:
+                dcm.end_stream_overlap()
 
     async def handle_signal(self, signal):
+        # Signals are processed in background, so books that are resynced first (see OrderBookResyncScheduler)
+        # get their buffered data applied without waiting for the rest of them
         dcms = self.depth_cache_managers.values()
         for dcm in dcms:  # switch every dcm to backpressure
             dcm.notify_pending_signal()
-        await asyncio.wait([asyncio.create_task(dcm.process_signal(signal)) for dcm in dcms])
+        for dcm in dcms:
+            task = asyncio.create_task(dcm.process_signal(signal))
+            self.signal_tasks.add(task)
+            task.add_done_callback(self.signal_tasks.discard)
 
 
 class BinanceStreamManager:
@@ -533,26 +1254,93 @@ class BinanceStreamManager:
         self.async_context: AsyncListenerContext = async_context
         self.execution_thread = execution_thread
 
+    @property
+    def scout_trigger(self) -> ScoutTrigger:
+        return self.async_context.scout_trigger
+
+    def get_depth_snapshot(self, symbol: str) -> DepthSnapshot:
+        """
+        Latest published order book of the symbol, safe to read from any thread
+        """
+        return self.async_context.depth_cache_managers[symbol].snapshot
+
     def get_market_sell_price(self, symbol: str, amount: float):
-        return asyncio.run_coroutine_threadsafe(
-            self.async_context.get_market_sell_price(symbol, amount), self.async_context.loop
-        ).result()
+        return self.async_context.depth_cache_managers[symbol].get_market_price(MARKET_SELL, amount)
 
     def get_market_buy_price(self, symbol: str, quote_amount: float):
-        return asyncio.run_coroutine_threadsafe(
-            self.async_context.get_market_buy_price(symbol, quote_amount), self.async_context.loop
-        ).result()
+        return self.async_context.depth_cache_managers[symbol].get_market_price(MARKET_BUY, quote_amount)
+
+    def get_market_prices(self, requests: List[MarketPriceRequest]):
+        """
+        Answer a batch of (symbol, side, amount) market price requests from the published order book snapshots
+
+        :return: list of (price, amount) tuples in the order of requests
+        """
+        dcms = self.async_context.depth_cache_managers
+        return [dcms[symbol].get_market_price(side, amount) for symbol, side, amount in requests]
+
+    def get_price_memo_stats(self) -> Dict[str, Tuple[int, int]]:
+        """
+        :return: (hits, misses) of the market price memo per symbol
+        """
+        return {
+            symbol: (dcm.price_memo_hits, dcm.price_memo_misses)
+            for symbol, dcm in self.async_context.depth_cache_managers.items()
+        }
+
+    def set_resync_priorities(self, symbols: List[str]):
+        """
+        Order books to resync first after a reconnect, most important first
+        """
+        dcms = self.async_context.depth_cache_managers
+        if dcms:
+            next(iter(dcms.values())).resync_scheduler.set_priorities(symbols)
+
+    def get_resync_stats(self) -> Tuple[Optional[float], int, Set[str]]:
+        """
+        :return: (duration of the last resync round, number of books resynced in it, symbols being resynced now)
+        """
+        dcms = self.async_context.depth_cache_managers
+        if not dcms:
+            return None, 0, set()
+        scheduler = next(iter(dcms.values())).resync_scheduler
+        return scheduler.last_round_duration, scheduler.last_round_size, scheduler.unsynced_symbols()
+
+    def get_depth_queue_stats(self) -> Dict[str, Tuple[int, int, float]]:
+        """
+        :return: (queued events, max queued events, events merged per applied batch) of the depth queue per symbol
+        """
+        return {symbol: dcm.get_queue_stats() for symbol, dcm in self.async_context.depth_cache_managers.items()}
+
+    def get_stream_lag_stats(self) -> Dict[str, Tuple[Optional[float], Optional[float], Optional[float]]]:
+        """
+        :return: 50th, 90th and 99th percentile of the event-time-to-apply lag in seconds per stream buffer
+        """
+        return {name: lag_stats.percentiles(0.5, 0.9, 0.99) for name, lag_stats in self.async_context.lag_stats.items()}
+
+    def get_dropped_messages(self) -> Dict[str, int]:
+        """
+        :return: messages dropped by the overflow policy per stream buffer
+        """
+        return dict(self.async_context.dropped_messages)
+
+    def update_coins(self, coins: List[str]):
+        """
+        Subscribe the markets of the added coins and unsubscribe the ones of the removed coins, order books of the
+        added coins are synced in background
+        """
+        asyncio.run_coroutine_threadsafe(self.execution_thread.update_coins(coins), self.async_context.loop).result()
 
     def close(self):
         self.bwam.stop_manager_with_all_streams()
 
     def get_market_sell_price_fill_quote(self, symbol: str, quote_amount: float):
-        return asyncio.run_coroutine_threadsafe(
-            self.async_context.get_market_sell_price_fill_quote(symbol, quote_amount), self.async_context.loop
-        ).result()
+        return self.async_context.depth_cache_managers[symbol].get_market_price(MARKET_SELL_FILL_QUOTE, quote_amount)
 
 
 class AutoReplacingStream(LoopExecutor):  # pylint:disable=too-few-public-methods
+    SWAP_START_TIMEOUT = 60.0
+
     def __init__(
         self,
         bwam: BinanceWebSocketApiManager,
@@ -563,17 +1351,30 @@ class AutoReplacingStream(LoopExecutor):  # pylint:disable=too-few-public-method
         api_secret: Union[str, bool] = False,
         stream_buffer_name: Union[str, bool] = False,
         restart_every=60 * 60,
+        output="UnicornFy",
+        hot_swap=False,
     ):  # pylint:disable=too-many-arguments
+        """
+        :param hot_swap: replace the stream without blocking the loop and keep order books live while both
+            connections are open, see DepthCacheManager.begin_stream_overlap
+        """
         self.context = context
         self.restart_every = restart_every
+        self.hot_swap = hot_swap
         self.bwam = bwam
         self.channels = channels
         self.markets = markets
         self.api_key = api_key
         self.api_secret = api_secret
         self.stream_buffer_name = stream_buffer_name
+        self.output = output
         self.last_stream_id = self.bwam.create_stream(
-            channels, markets, api_key=api_key, api_secret=api_secret, stream_buffer_name=stream_buffer_name
+            channels,
+            markets,
+            api_key=api_key,
+            api_secret=api_secret,
+            stream_buffer_name=stream_buffer_name,
+            output=output,
         )
 
     async def run_loop(self):
@@ -582,6 +1383,9 @@ class AutoReplacingStream(LoopExecutor):  # pylint:disable=too-few-public-method
                 return
             await asyncio.sleep(self.restart_every)
 
+            if self.hot_swap:
+                await self.swap_stream()
+                continue
             old_stream_id = self.last_stream_id
             self.last_stream_id = self.bwam.replace_stream(
                 self.last_stream_id,
@@ -590,10 +1394,56 @@ class AutoReplacingStream(LoopExecutor):  # pylint:disable=too-few-public-method
                 new_stream_buffer_name=self.stream_buffer_name,
                 new_api_key=self.api_key,
                 new_api_secret=self.api_secret,
-                new_output="UnicornFy",
+                new_output=self.output,
             )
             self.context.notify_stream_replace(old_stream_id, self.last_stream_id)
 
+    def set_markets(self, markets: List[str]):
+        """
+        Subscribe and unsubscribe the running stream to the markets, replacement streams are created with them
+        """
+        old_markets, self.markets = self.markets, list(markets)
+        self._subscribe_difference(self.last_stream_id, old_markets)
+
+    def _subscribe_difference(self, stream_id: uuid.UUID, old_markets: List[str]):
+        old_set, new_set = set(old_markets), set(self.markets)
+        added = [market for market in self.markets if market not in old_set]
+        removed = [market for market in old_markets if market not in new_set]
+        if added:
+            self.bwam.subscribe_to_stream(stream_id, markets=added)
+        if removed:
+            self.bwam.unsubscribe_from_stream(stream_id, markets=removed)
+
+    async def swap_stream(self):
+        """
+        Like BinanceWebSocketApiManager.replace_stream, stop the old stream only once the new one received data,
+        but wait for it without blocking the loop, so both connections are processed meanwhile
+        """
+        old_stream_id = self.last_stream_id
+        markets = self.markets
+        new_stream_id = self.bwam.create_stream(
+            self.channels,
+            markets,
+            api_key=self.api_key,
+            api_secret=self.api_secret,
+            stream_buffer_name=self.stream_buffer_name,
+            output=self.output,
+        )
+        # nothing of the new stream is handled before this, the loop wasn't released since it was created
+        self.context.notify_stream_replace(old_stream_id, new_stream_id, hot_swap=True)
+        deadline = asyncio.get_running_loop().time() + self.SWAP_START_TIMEOUT
+        while self.bwam.stream_list.get(new_stream_id, {}).get("last_heartbeat") is None:
+            if asyncio.get_running_loop().time() > deadline:
+                self.context.logger.warning(f"Stream {self.stream_buffer_name} didn't start, keeping the old one")
+                self.context.cancel_stream_replace(old_stream_id, new_stream_id)
+                self.bwam.stop_stream(new_stream_id)
+                return
+            await asyncio.sleep(0.1)
+        self.bwam.stop_stream(old_stream_id)
+        self.last_stream_id = new_stream_id
+        # the markets may have been changed while the new stream was starting
+        self._subscribe_difference(new_stream_id, markets)
+
 
 class StreamManagerWorker(threading.Thread):
     def __init__(self, cache: BinanceCache, config: Config, logger: Logger, fut: concurrent.futures.Future):
@@ -602,22 +1452,78 @@ class StreamManagerWorker(threading.Thread):
         self.config = config
         self.logger = logger
         self.fut = fut
+        self.async_context: Optional[AsyncListenerContext] = None
+        self.ticker_stream: Optional[AutoReplacingStream] = None
+        self.depth_stream: Optional[AutoReplacingStream] = None
+        self.depth_listener: Optional[DepthListener] = None
+        self.client: Optional[binance.AsyncClient] = None
+        self.resync_scheduler: Optional[OrderBookResyncScheduler] = None
+
+    def ticker_markets(self, coins: List[str]) -> List[str]:
+        quotes = [quote.lower() for quote in ticker_quotes(self.config)]
+        return [coin.lower() + quote for quote in quotes for coin in coins]
+
+    def depth_markets(self, coins: List[str]) -> List[str]:
+        return [coin.lower() + self.config.BRIDGE.symbol.lower() for coin in coins]
+
+    def create_depth_cache_manager(self, symbol: str) -> DepthCacheManager:
+        depth_cache_type = DEPTH_CACHE_TYPES[self.config.DEPTH_CACHE_TYPE]
+        return DepthCacheManager(
+            symbol,
+            self.client,
+            self.logger,
+            depth_cache_factory=partial(depth_cache_type, *self.config.get_depth_cache_limits(symbol)),
+            resync_scheduler=self.resync_scheduler,
+        )
+
+    async def update_coins(self, coins: List[str]):
+        """
+        Create order books of the added coins and drop the ones of the removed coins, then change the subscriptions
+        of the streams
+        """
+        depth_markets = self.depth_markets(coins)
+        old_dcms = self.async_context.depth_cache_managers
+        # new books are synced from a snapshot once their first event arrives
+        dcms = {
+            symbol: old_dcms.get(symbol) or self.create_depth_cache_manager(symbol)
+            for symbol in sorted({market.upper() for market in depth_markets})
+        }
+        # other threads iterate the dict, so it is replaced at once instead of changed in place
+        self.async_context.depth_cache_managers = self.depth_listener.depth_cache_managers = dcms
+        for symbol, dcm in old_dcms.items():
+            if symbol not in dcms:
+                dcm.close()
+        self.ticker_stream.set_markets(self.ticker_markets(coins))
+        self.depth_stream.set_markets(depth_markets)
 
     async def arun(self):
         self.cache.attach_loop()
-        client = await binance.AsyncClient.create(
+        client = self.client = await binance.AsyncClient.create(
             self.config.BINANCE_API_KEY, self.config.BINANCE_API_SECRET_KEY, tld=self.config.BINANCE_TLD
         )
-        depth_markets = [coin.lower() + self.config.BRIDGE.symbol.lower() for coin in self.config.SUPPORTED_COIN_LIST]
+        depth_markets = self.depth_markets(self.config.SUPPORTED_COIN_LIST)
+        recorder = None
+        if self.config.MARKET_RECORDER_DIR:
+            recorder = MarketDataRecorder(self.config.MARKET_RECORDER_DIR, self.logger)
+            recorder.start()
+        self.resync_scheduler = OrderBookResyncScheduler(
+            client,
+            self.logger,
+            weight_per_minute=self.config.RESYNC_WEIGHT_PER_MINUTE,
+            max_concurrency=self.config.RESYNC_CONCURRENCY,
+            recorder=recorder,
+        )
         depth_cache_managers = {
-            symbol.upper(): DepthCacheManager(symbol.upper(), client, self.logger) for symbol in depth_markets
+            symbol.upper(): self.create_depth_cache_manager(symbol.upper()) for symbol in depth_markets
         }
-        async_context = AsyncListenerContext(
+        async_context = self.async_context = AsyncListenerContext(
             [BUFFER_NAME_MINITICKERS, BUFFER_NAME_USERDATA, BUFFER_NAME_DEPTH],
             self.cache,
             self.logger,
             client,
             depth_cache_managers,
+            recorder,
+            self.config.STREAM_QUEUE_SIZE,
         )
         bwam = AsyncListenedBWAM(
             async_context,
@@ -625,27 +1531,32 @@ class StreamManagerWorker(threading.Thread):
             enable_stream_signal_buffer=True,
             exchange=f"binance.{self.config.BINANCE_TLD}",
         )
-        quotes = set(map(str.lower, [self.config.BRIDGE.symbol, "usdt", "btc", "bnb"]))
-        markets = [coin.lower() + quote for quote in quotes for coin in self.config.SUPPORTED_COIN_LIST]
         restart_every = 3600 * 4
-        streams: List[LoopExecutor] = [
-            AutoReplacingStream(
-                bwam,
-                async_context,
-                ["miniTicker"],
-                markets,
-                stream_buffer_name=BUFFER_NAME_MINITICKERS,
-                restart_every=restart_every,
-            ),
-            AutoReplacingStream(
-                bwam,
-                async_context,
-                ["depth@100ms"],
-                depth_markets,
-                stream_buffer_name=BUFFER_NAME_DEPTH,
-                restart_every=restart_every,
-            ),
-        ]
+        # with the raw parser, market streams skip UnicornFy and are parsed by their listeners
+        raw_streams = self.config.STREAM_PARSER == "raw"
+        market_output = "raw_data" if raw_streams else "UnicornFy"
+        hot_swap = self.config.STREAM_REPLACE_MODE == "hot_swap"
+        self.ticker_stream = AutoReplacingStream(
+            bwam,
+            async_context,
+            ["miniTicker"],
+            self.ticker_markets(self.config.SUPPORTED_COIN_LIST),
+            stream_buffer_name=BUFFER_NAME_MINITICKERS,
+            restart_every=restart_every,
+            output=market_output,
+            hot_swap=hot_swap,
+        )
+        self.depth_stream = AutoReplacingStream(
+            bwam,
+            async_context,
+            ["depth@100ms"],
+            depth_markets,
+            stream_buffer_name=BUFFER_NAME_DEPTH,
+            restart_every=restart_every,
+            output=market_output,
+            hot_swap=hot_swap,
+        )
+        streams: List[LoopExecutor] = [self.ticker_stream, self.depth_stream]
         bwam.create_stream(
             ["arr"],
             ["!userData"],
@@ -653,10 +1564,13 @@ class StreamManagerWorker(threading.Thread):
             api_secret=self.config.BINANCE_API_SECRET_KEY,
             stream_buffer_name=BUFFER_NAME_USERDATA,
         )
+        self.depth_listener = DepthListener(
+            async_context, depth_cache_managers, parse_depth_update if raw_streams else None
+        )
         listeners: List[LoopExecutor] = [
-            TickerListener(async_context),
+            TickerListener(async_context, parse_mini_ticker if raw_streams else None),
             UserDataListener(async_context),
-            DepthListener(async_context, depth_cache_managers),
+            self.depth_listener,
         ]
         executors: List[LoopExecutor] = listeners + streams
         stream_manager = BinanceStreamManager(self.logger, async_context, bwam, self)
@@ -665,7 +1579,7 @@ class StreamManagerWorker(threading.Thread):
 
     def run(self):
         with suppress(asyncio.CancelledError):
-            asyncio.run(self.arun())
+            run_in_event_loop(self.arun(), self.config.STREAM_EVENT_LOOP)
 
     @staticmethod
     def create(cache: BinanceCache, config: Config, logger: Logger) -> BinanceStreamManager:
@@ -7,6 +7,20 @@ CFG_FL_NAME = "user.cfg"
 USER_CFG_SECTION = "binance_user_config"
 
 
+def read_supported_coin_list():
+    # Get supported coin list from the environment
+    supported_coin_list = [coin.strip() for coin in os.environ.get("SUPPORTED_COIN_LIST", "").split() if coin.strip()]
+    # Get supported coin list from supported_coin_list file
+    if not supported_coin_list and os.path.exists("supported_coin_list"):
+        with open("supported_coin_list") as rfh:
+            for line in rfh:
+                line = line.strip()
+                if not line or line.startswith("#") or line in supported_coin_list:
+                    continue
+                supported_coin_list.append(line)
+    return supported_coin_list
+
+
 class Config:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
     def __init__(self):
         # Init config
@@ -20,6 +34,22 @@ class Config:  # pylint: disable=too-few-public-methods,too-many-instance-attrib
             "tld": "com",
             "strategy": "default",
             "enable_paper_trading": False,
+            "depth_cache_type": "sorted",
+            "depth_keep_limit": "200",
+            "depth_max_size": "400",
+            "depth_cache_limits": "",
+            "resync_weight_per_minute": "600",
+            "resync_concurrency": "5",
+            "stream_parser": "unicornfy",
+            "market_recorder_dir": "",
+            "stream_replace_mode": "replace",
+            "stream_queue_size": "10000",
+            "stream_event_loop": "asyncio",
+            "jump_search_hops": "0",
+            "scout_mode": "schedule",
+            "scout_debounce": "0.05",
+            "scout_max_rate": "5",
+            "phase_timings_interval": "0",
         }
 
         if not os.path.exists(CFG_FL_NAME):
@@ -52,24 +82,102 @@ class Config:  # pylint: disable=too-few-public-methods,too-many-instance-attrib
         self.BINANCE_API_SECRET_KEY = os.environ.get("API_SECRET_KEY") or config.get(USER_CFG_SECTION, "api_secret_key")
         self.BINANCE_TLD = os.environ.get("TLD") or config.get(USER_CFG_SECTION, "tld")
 
-        # Get supported coin list from the environment
-        supported_coin_list = [
-            coin.strip() for coin in os.environ.get("SUPPORTED_COIN_LIST", "").split() if coin.strip()
-        ]
-        # Get supported coin list from supported_coin_list file
-        if not supported_coin_list and os.path.exists("supported_coin_list"):
-            with open("supported_coin_list") as rfh:
-                for line in rfh:
-                    line = line.strip()
-                    if not line or line.startswith("#") or line in supported_coin_list:
-                        continue
-                    supported_coin_list.append(line)
-        self.SUPPORTED_COIN_LIST = supported_coin_list
+        self.SUPPORTED_COIN_LIST = read_supported_coin_list()
 
         self.CURRENT_COIN_SYMBOL = os.environ.get("CURRENT_COIN_SYMBOL") or config.get(USER_CFG_SECTION, "current_coin")
 
         self.STRATEGY = os.environ.get("STRATEGY") or config.get(USER_CFG_SECTION, "strategy")
-        enable_paper_trading = (
-            os.environ.get("ENABLE_PAPER_TRADING") or config.get(USER_CFG_SECTION, "enable_paper_trading")
-        ) 
+        enable_paper_trading = os.environ.get("ENABLE_PAPER_TRADING") or config.get(
+            USER_CFG_SECTION, "enable_paper_trading"
+        )
         self.ENABLE_PAPER_TRADING = str(enable_paper_trading).lower() == "true"
+
+        self.DEPTH_CACHE_TYPE = (
+            os.environ.get("DEPTH_CACHE_TYPE") or config.get(USER_CFG_SECTION, "depth_cache_type")
+        ).lower()
+        if self.DEPTH_CACHE_TYPE not in ("sorted", "array"):
+            raise ValueError("depth_cache_type parameter must be either 'sorted' or 'array'")
+
+        # Order book levels kept after a trim and the size that triggers the trim
+        self.DEPTH_KEEP_LIMIT = int(
+            os.environ.get("DEPTH_KEEP_LIMIT") or config.get(USER_CFG_SECTION, "depth_keep_limit")
+        )
+        self.DEPTH_MAX_SIZE = int(os.environ.get("DEPTH_MAX_SIZE") or config.get(USER_CFG_SECTION, "depth_max_size"))
+        # Per symbol overrides in a form of "SYMBOL:keep_limit:max_size" separated by spaces
+        self.DEPTH_CACHE_LIMITS = {}
+        depth_cache_limits = os.environ.get("DEPTH_CACHE_LIMITS") or config.get(USER_CFG_SECTION, "depth_cache_limits")
+        for override in depth_cache_limits.split():
+            symbol, keep_limit, max_size = override.split(":")
+            self.DEPTH_CACHE_LIMITS[symbol.upper()] = (int(keep_limit), int(max_size))
+        for keep_limit, max_size in [(self.DEPTH_KEEP_LIMIT, self.DEPTH_MAX_SIZE), *self.DEPTH_CACHE_LIMITS.values()]:
+            if not 0 < keep_limit < max_size:
+                raise ValueError("depth cache keep_limit must be positive and less than max_size")
+
+        self.RESYNC_WEIGHT_PER_MINUTE = int(
+            os.environ.get("RESYNC_WEIGHT_PER_MINUTE") or config.get(USER_CFG_SECTION, "resync_weight_per_minute")
+        )
+        self.RESYNC_CONCURRENCY = int(
+            os.environ.get("RESYNC_CONCURRENCY") or config.get(USER_CFG_SECTION, "resync_concurrency")
+        )
+        if self.RESYNC_WEIGHT_PER_MINUTE <= 0 or self.RESYNC_CONCURRENCY <= 0:
+            raise ValueError("resync_weight_per_minute and resync_concurrency must be positive")
+
+        self.STREAM_PARSER = (os.environ.get("STREAM_PARSER") or config.get(USER_CFG_SECTION, "stream_parser")).lower()
+        if self.STREAM_PARSER not in ("unicornfy", "raw"):
+            raise ValueError("stream_parser parameter must be either 'unicornfy' or 'raw'")
+
+        self.MARKET_RECORDER_DIR = os.environ.get("MARKET_RECORDER_DIR") or config.get(
+            USER_CFG_SECTION, "market_recorder_dir"
+        )
+
+        self.STREAM_REPLACE_MODE = (
+            os.environ.get("STREAM_REPLACE_MODE") or config.get(USER_CFG_SECTION, "stream_replace_mode")
+        ).lower()
+        if self.STREAM_REPLACE_MODE not in ("replace", "hot_swap"):
+            raise ValueError("stream_replace_mode parameter must be either 'replace' or 'hot_swap'")
+
+        # Messages a stream buffer holds before its overflow policy applies, 0 for unbounded buffers
+        self.STREAM_QUEUE_SIZE = int(
+            os.environ.get("STREAM_QUEUE_SIZE") or config.get(USER_CFG_SECTION, "stream_queue_size")
+        )
+        if self.STREAM_QUEUE_SIZE < 0:
+            raise ValueError("stream_queue_size must not be negative")
+
+        self.STREAM_EVENT_LOOP = (
+            os.environ.get("STREAM_EVENT_LOOP") or config.get(USER_CFG_SECTION, "stream_event_loop")
+        ).lower()
+        if self.STREAM_EVENT_LOOP not in ("auto", "asyncio", "uvloop"):
+            raise ValueError("stream_event_loop parameter must be either 'auto', 'asyncio' or 'uvloop'")
+
+        self.JUMP_SEARCH_HOPS = int(
+            os.environ.get("JUMP_SEARCH_HOPS") or config.get(USER_CFG_SECTION, "jump_search_hops")
+        )
+        if self.JUMP_SEARCH_HOPS < 0:
+            raise ValueError("jump_search_hops must not be negative")
+
+        self.SCOUT_MODE = (os.environ.get("SCOUT_MODE") or config.get(USER_CFG_SECTION, "scout_mode")).lower()
+        if self.SCOUT_MODE not in ("schedule", "event"):
+            raise ValueError("scout_mode parameter must be either 'schedule' or 'event'")
+
+        # Seconds an order book triggered scout waits for the rest of a burst of updates
+        self.SCOUT_DEBOUNCE = float(os.environ.get("SCOUT_DEBOUNCE") or config.get(USER_CFG_SECTION, "scout_debounce"))
+        if self.SCOUT_DEBOUNCE < 0:
+            raise ValueError("scout_debounce must not be negative")
+
+        # Order book triggered scouts per second at most
+        self.SCOUT_MAX_RATE = float(os.environ.get("SCOUT_MAX_RATE") or config.get(USER_CFG_SECTION, "scout_max_rate"))
+        if self.SCOUT_MAX_RATE <= 0:
+            raise ValueError("scout_max_rate must be positive")
+
+        # Seconds between logs of the scout phase timings, 0 disables the timings
+        self.PHASE_TIMINGS_INTERVAL = int(
+            os.environ.get("PHASE_TIMINGS_INTERVAL") or config.get(USER_CFG_SECTION, "phase_timings_interval")
+        )
+        if self.PHASE_TIMINGS_INTERVAL < 0:
+            raise ValueError("phase_timings_interval must not be negative")
+
+    def get_depth_cache_limits(self, symbol: str):
+        """
+        :return: (keep_limit, max_size) of the order book for the symbol
+        """
+        return self.DEPTH_CACHE_LIMITS.get(symbol, (self.DEPTH_KEEP_LIMIT, self.DEPTH_MAX_SIZE))
@@ -6,15 +6,17 @@ import time
 from threading import Thread
 
 from .binance_api_manager import BinanceAPIManager
-from .config import Config
+from .config import Config, read_supported_coin_list
 from .database import Database
 from .logger import Logger
 from .scheduler import SafeScheduler
 from .strategies import get_strategy
+from .timings import phase_timings
 
 
 def main():  # pylint:disable=too-many-statements
     exiting = False
+    reload_coins = False
     logger = Logger()
     logger.info("Starting")
 
@@ -25,9 +27,13 @@ def main():  # pylint:disable=too-many-statements
     else:
         manager = BinanceAPIManager.create_manager(config, db, logger)
 
+    def clean_up():
+        manager.close()
+        db.close()
+
     def timeout_exit(timeout: int):
         logger.info(f"Waiting for at most {timeout} seconds for clean-up")
-        thread = Thread(target=manager.close)
+        thread = Thread(target=clean_up)
         thread.start()
         thread.join(timeout)
 
@@ -42,8 +48,15 @@ def main():  # pylint:disable=too-many-statements
         # so os._exit should be a temporary WA for it
         os._exit(0)  # pylint:disable=protected-access
 
+    def reload_handler(*_):
+        nonlocal reload_coins
+        reload_coins = True
+
     signal.signal(signal.SIGINT, exit_handler)
     signal.signal(signal.SIGTERM, exit_handler)
+    if hasattr(signal, "SIGHUP"):
+        # the coin list is reloaded between two scouts, see AutoTrader.update_coins
+        signal.signal(signal.SIGHUP, reload_handler)
     atexit.register(exit_handler)
 
     # check if we can access API feature that require valid config
@@ -78,11 +91,25 @@ def main():  # pylint:disable=too-many-statements
     trader.initialize()
 
     schedule = SafeScheduler(logger)
-    schedule.every(config.SCOUT_SLEEP_TIME).seconds.do(trader.scout).tag("scouting")
+    scout_job = schedule.every(config.SCOUT_SLEEP_TIME).seconds.do(trader.scout).tag("scouting")
     schedule.every(1).minutes.do(trader.update_values).tag("updating value history")
     schedule.every(1).minutes.do(db.prune_scout_history).tag("pruning scout history")
     schedule.every(1).hours.do(db.prune_value_history).tag("pruning value history")
+    if config.PHASE_TIMINGS_INTERVAL:
+        phase_timings.enabled = True
+        schedule.every(config.PHASE_TIMINGS_INTERVAL).seconds.do(phase_timings.log_stats, logger).tag(
+            "logging phase timings"
+        )
 
+    # order book updates that may push a jump over its threshold start a scout right away, see ScoutTrigger
+    scout_trigger = manager.stream_manager.scout_trigger if config.SCOUT_MODE == "event" else None
     while not exiting:
+        if reload_coins:
+            reload_coins = False
+            logger.info("Reloading the supported coin list")
+            trader.update_coins(read_supported_coin_list())
         schedule.run_pending()
-        time.sleep(1)
+        if scout_trigger is None:
+            time.sleep(1)
+        elif scout_trigger.wait(1, config.SCOUT_DEBOUNCE, 1 / config.SCOUT_MAX_RATE):
+            schedule.run_job_now(scout_job)
@@ -4,15 +4,18 @@ import time
 from collections import namedtuple
 from contextlib import contextmanager, nullcontext
 from datetime import datetime, timedelta
-from typing import List, Optional, Union
+from typing import Dict, List, Optional, Union
 
+import numpy as np
 from socketio import Client
 from socketio.exceptions import ConnectionError as SocketIOConnectionError
 from sqlalchemy import bindparam, create_engine, func, insert, select, update
 from sqlalchemy.orm import Session, scoped_session, sessionmaker
 
 from binance_trade_bot.postpone import heavy_call
+from binance_trade_bot.ratio_store import PairRatioWriter, RatioStore, ratio_store_path
 from binance_trade_bot.ratios import CoinStub, RatiosManager
+from binance_trade_bot.timings import timed
 
 from .config import Config
 from .logger import Logger
@@ -28,6 +31,9 @@ class Database:
         self.engine = create_engine(uri)
         self.session_factory = scoped_session(sessionmaker(bind=self.engine))
         self.ratios_manager: Optional[RatiosManager] = None
+        self.ratio_store_path = ratio_store_path(uri)
+        self.ratio_store: Optional[RatioStore] = None
+        self.pair_ratio_writer = PairRatioWriter(self._write_pair_ratios, logger)
         self.socketio_client = Client()
 
     def socketio_connect(self):
@@ -78,6 +84,10 @@ class Database:
                 else:
                     coin.enabled = True
 
+        if self.ratios_manager is not None:
+            self._resize_coins()
+            return
+
         CoinStub.reset()
 
         # For all the combinations of coins in the database, add a pair to the database
@@ -85,6 +95,9 @@ class Database:
             coins: List[Coin] = session.query(Coin).filter(Coin.enabled).order_by(Coin.symbol).all()
             for coin in coins:
                 CoinStub.create(coin.symbol)
+            # pairs of the coins in a valid store exist already
+            if self._load_ratio_store([coin.symbol for coin in coins], session):
+                return
             for from_coin in coins:
                 for to_coin in coins:
                     if from_coin != to_coin:
@@ -96,6 +109,101 @@ class Database:
         with self.db_session() as session:
             pairs = session.query(Pair).filter(Pair.enabled.is_(True)).all()
             self.ratios_manager = RatiosManager(pairs)
+            max_pair_id = session.query(func.max(Pair.id)).scalar() or 0
+
+        self._create_ratio_store(max_pair_id)
+
+    def _resize_coins(self):
+        """
+        Resize the ratio matrix of a running bot to the enabled coins in place, only the pairs of the added coins are
+        created and loaded from the pairs table
+        """
+        # re-enabled coins load their ratios from the pairs table
+        self.pair_ratio_writer.flush()
+        session: Session
+        with self.db_session() as session:
+            coins: List[Coin] = session.query(Coin).filter(Coin.enabled).order_by(Coin.symbol).all()
+            symbols = [coin.symbol for coin in coins]
+            old_idxs = CoinStub.resize(symbols)
+            self.ratios_manager.resize(old_idxs)
+            added = {symbols[idx] for idx in np.flatnonzero(old_idxs < 0).tolist()}
+            if added:
+                added_pairs = Pair.from_coin_id.in_(added) | Pair.to_coin_id.in_(added)
+                existing = {
+                    (pair.from_coin_id, pair.to_coin_id) for pair in session.query(Pair).filter(added_pairs).all()
+                }
+                for from_coin in coins:
+                    for to_coin in coins:
+                        if (
+                            from_coin != to_coin
+                            and (from_coin.symbol in added or to_coin.symbol in added)
+                            and (from_coin.symbol, to_coin.symbol) not in existing
+                        ):
+                            session.add(Pair(from_coin, to_coin))
+                session.flush()
+                self.ratios_manager.load_pairs(session.query(Pair).filter(added_pairs, Pair.enabled.is_(True)).all())
+            max_pair_id = session.query(func.max(Pair.id)).scalar() or 0
+
+        self._create_ratio_store(max_pair_id)
+
+    def _create_ratio_store(self, max_pair_id: int):
+        if self.ratio_store_path is not None:
+            self._set_ratio_store(
+                RatioStore.create(
+                    self.ratio_store_path,
+                    [coin.symbol for coin in CoinStub.get_all()],
+                    self.ratios_manager.get_all(),
+                    self.ratios_manager.get_all_pair_ids(),
+                    max_pair_id,
+                )
+            )
+
+    def _set_ratio_store(self, ratio_store: Optional[RatioStore]):
+        if self.ratio_store is not None:
+            self.ratio_store.close()
+        self.ratio_store = ratio_store
+
+    def invalidate_ratio_store(self):
+        """
+        Remove the ratio store after the ratios of the pairs table were changed directly, the next set_coins loads
+        them from the pairs table again
+        """
+        self._set_ratio_store(None)
+        if self.ratio_store_path is not None and os.path.exists(self.ratio_store_path):
+            os.remove(self.ratio_store_path)
+
+    def close(self):
+        """
+        Write the pending ratios to the pairs table and close the ratio store
+        """
+        self.pair_ratio_writer.close()
+        self._set_ratio_store(None)
+
+    def _load_ratio_store(self, symbols: List[str], session: Session) -> bool:
+        """
+        Load the ratios from the ratio store if it was built for the coins and the pairs of the database
+
+        :return: False if there is no valid store, the ratios have to be loaded from the pairs table then
+        """
+        if self.ratio_store_path is None:
+            return False
+        ratio_store = RatioStore.open(self.ratio_store_path)
+        if ratio_store is None:
+            return False
+        if ratio_store.torn:
+            self.logger.warning(f"{self.ratio_store_path} was left by an interrupted commit, rebuilding it")
+        max_pair_id = session.query(func.max(Pair.id)).scalar() or 0
+        if ratio_store.torn or ratio_store.symbols != symbols or ratio_store.max_pair_id != max_pair_id:
+            ratio_store.close()
+            return False
+
+        self.ratios_manager = RatiosManager.from_matrix(ratio_store.ratios, ratio_store.pair_ids)
+        self._set_ratio_store(ratio_store)
+        # the pairs table lags behind the store if the bot stopped before the writer flushed
+        pair_ids = ratio_store.pair_ids
+        cells = pair_ids != 0
+        self.pair_ratio_writer.submit(pair_ids[cells].tolist(), ratio_store.ratios[cells].tolist())
+        return True
 
     def get_coins(self, only_enabled=True) -> List[Coin]:
         session: Session
@@ -146,6 +254,7 @@ class Database:
             return pair
 
     @heavy_call
+    @timed("batch_log_scout")
     def batch_log_scout(self, logs: List[LogScout]):
         session: Session
         with self.db_session() as session:
@@ -289,26 +398,29 @@ class Database:
             self.logger.info(".current_coin_table renamed to .current_coin_table.old - " "You can now delete this file")
 
     @heavy_call
+    @timed("commit_ratios")
     def commit_ratios(self):
-        dirty_cells = self.ratios_manager.get_dirty()
+        pair_ids, pair_ratios = self.ratios_manager.get_dirty_pairs()
 
-        if len(dirty_cells) == 0:
+        if len(pair_ids) == 0:
             return
 
+        if self.ratio_store is None:
+            self._write_pair_ratios(dict(zip(pair_ids, pair_ratios)))
+        else:
+            # the store is written in place right away, the pairs table follows in the background
+            self.ratio_store.write(self.ratios_manager.get_dirty_mask(), self.ratios_manager.get_all())
+            self.pair_ratio_writer.submit(pair_ids, pair_ratios)
+        self.ratios_manager.commit()
+
+    def _write_pair_ratios(self, pair_ratios: Dict[int, float]):
         pair_t = Pair.__table__
         stmt = pair_t.update().where(pair_t.c.id == bindparam("pair_id")).values(ratio=bindparam("pair_ratio"))
         with self.db_session() as session:
             session.execute(
                 stmt,
-                [
-                    {
-                        "pair_id": self.ratios_manager.get_pair_id(from_idx, to_idx),
-                        "pair_ratio": self.ratios_manager.get(from_idx, to_idx),
-                    }
-                    for from_idx, to_idx in dirty_cells
-                ],
+                [{"pair_id": pair_id, "pair_ratio": pair_ratio} for pair_id, pair_ratio in pair_ratios.items()],
             )
-        self.ratios_manager.commit()
 
     def batch_update_coin_values(self, cv_batch: List[CoinValue]):
         session: Session
@@ -65,6 +65,9 @@ class WarmUpDatabase(Database):
                 if fromCoin.symbol != self.config.BRIDGE_SYMBOL and toCoin.symbol != self.config.BRIDGE_SYMBOL:
                     session.add(Pair(fromCoin, toCoin))
 
+        # the warmed up ratios are written to the pairs table
+        self.invalidate_ratio_store()
+
 class WarmUpTrader(AutoTrader):
 
     def initialize_trade_thresholds(self):
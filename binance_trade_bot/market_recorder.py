@@ -0,0 +1,213 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from .logger import Logger
+
+try:
+    from orjson import dumps, loads  # pylint: disable=no-name-in-module
+except ImportError:
+    import json
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, default=str).encode()
+
+    loads = json.loads
+
+MAGIC = b"BTBREC1\n"
+# payload length, timestamp, record kind, buffer name id, symbol id
+RECORD_HEADER = struct.Struct("<IdBHH")
+
+KIND_STRING = 0  # defines a string id used by the following records, symbol id field holds the id
+KIND_RAW = 1  # raw stream payload as received from the websocket
+KIND_JSON = 2  # stream payload already converted to a dict (UnicornFy)
+KIND_SIGNAL = 3  # stream signal dict
+KIND_SNAPSHOT = 4  # REST order book snapshot a depth cache was resynced from, with the symbol added
+
+NO_SYMBOL = 0
+SNAPSHOT_BUFFER_NAME = "ob"
+
+
+class MarketRecord(NamedTuple):
+    timestamp: float
+    kind: int
+    buffer_name: str
+    symbol: Optional[str]
+    payload: bytes
+
+    def decode(self) -> Union[str, Dict]:
+        """
+        :return: the stream data as it was passed to AsyncListenerContext, raw payloads stay strings
+        """
+        if self.kind == KIND_RAW:
+            return self.payload.decode()
+        return loads(self.payload)
+
+
+def symbol_of(stream_data) -> Optional[str]:
+    """
+    Symbol of a single symbol stream message, None for multi symbol and user data messages
+    """
+    if isinstance(stream_data, dict):
+        return stream_data.get("symbol")
+    if isinstance(stream_data, str) and stream_data.startswith('{"stream":'):
+        start = stream_data.find('"', 10) + 1
+        end = stream_data.find("@", start)
+        if end > start > 0 and stream_data[start] != "!":
+            return stream_data[start:end].upper()
+    return None
+
+
+class RecordFileWriter:
+    """
+    One hourly file of the log. Strings (buffer names and symbols) are written once per file and referenced by id,
+    so every file can be read on its own.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "ab", buffering=1 << 20)  # pylint: disable=consider-using-with
+        if self.file.tell() == 0:
+            self.file.write(MAGIC)
+        self.string_ids: Dict[str, int] = {}
+
+    def string_id(self, value: Optional[str], timestamp: float) -> int:
+        if value is None:
+            return NO_SYMBOL
+        string_id = self.string_ids.get(value)
+        if string_id is None:
+            string_id = self.string_ids[value] = len(self.string_ids) + 1
+            encoded = value.encode()
+            self.file.write(RECORD_HEADER.pack(len(encoded), timestamp, KIND_STRING, 0, string_id))
+            self.file.write(encoded)
+        return string_id
+
+    def write(self, timestamp: float, kind: int, buffer_name: str, symbol: Optional[str], payload: bytes):
+        buffer_id = self.string_id(buffer_name, timestamp)
+        symbol_id = self.string_id(symbol, timestamp)
+        self.file.write(RECORD_HEADER.pack(len(payload), timestamp, kind, buffer_id, symbol_id))
+        self.file.write(payload)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class MarketDataRecorder:
+    """
+    Append-only, length-prefixed binary log of everything the stream listeners consume, one file per UTC hour.
+
+    record_* only append the message to a deque, serialization and writes happen in a background thread every
+    flush_interval seconds.
+    """
+
+    def __init__(self, directory: str, logger: Logger, flush_interval=1.0, prefix="market"):
+        self.directory = directory
+        self.logger = logger
+        self.flush_interval = flush_interval
+        self.prefix = prefix
+        self.pending: Deque[Tuple[float, int, str, object]] = deque()
+        self.records_written = 0
+        self._writer: Optional[RecordFileWriter] = None
+        self._hour_start = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="market-recorder", daemon=True)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread.start()
+
+    def record_data(self, stream_data, buffer_name: str):
+        kind = KIND_RAW if isinstance(stream_data, str) else KIND_JSON
+        self.pending.append((time.time(), kind, buffer_name, stream_data))
+
+    def record_signal(self, signal_data: Dict, buffer_name: str):
+        self.pending.append((time.time(), KIND_SIGNAL, buffer_name, signal_data))
+
+    def record_snapshot(self, symbol: str, snapshot: Dict):
+        self.pending.append((time.time(), KIND_SNAPSHOT, SNAPSHOT_BUFFER_NAME, dict(snapshot, symbol=symbol)))
+
+    def file_path(self, timestamp: float) -> str:
+        hour = datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y%m%d-%H")
+        return os.path.join(self.directory, f"{self.prefix}-{hour}.bin")
+
+    def flush(self):
+        """
+        Write every pending message, rotating the file when the hour changes
+        """
+        pending = self.pending
+        written = 0
+        while pending:
+            timestamp, kind, buffer_name, data = pending.popleft()
+            if not self._hour_start <= timestamp < self._hour_start + 3600:
+                self._hour_start = timestamp - timestamp % 3600
+                path = self.file_path(timestamp)
+                if self._writer is None or self._writer.path != path:
+                    if self._writer is not None:
+                        self._writer.close()
+                    self._writer = RecordFileWriter(path)
+            payload = data.encode() if kind == KIND_RAW else dumps(data)
+            symbol = None if kind == KIND_SIGNAL else symbol_of(data)
+            self._writer.write(timestamp, kind, buffer_name, symbol, payload)
+            written += 1
+        if self._writer is not None and written:
+            self._writer.flush()
+        self.records_written += written
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:  # pylint: disable=broad-except
+                self.logger.error(f"Market data recorder failed to write: {e}")
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._hour_start = 0.0
+
+
+def read_records(path: str) -> Iterator[MarketRecord]:
+    """
+    Iterate over the records of a log file through a memory map, a truncated last record is skipped
+    """
+    with open(path, "rb") as file:
+        if os.fstat(file.fileno()).st_size <= len(MAGIC):
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            if buf[: len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a market data log")
+            strings: Dict[int, str] = {}
+            offset = len(MAGIC)
+            size = len(buf)
+            while offset + RECORD_HEADER.size <= size:
+                length, timestamp, kind, buffer_id, symbol_id = RECORD_HEADER.unpack_from(buf, offset)
+                start = offset + RECORD_HEADER.size
+                if start + length > size:
+                    return
+                payload = buf[start : start + length]
+                offset = start + length
+                if kind == KIND_STRING:
+                    strings[symbol_id] = payload.decode()
+                    continue
+                yield MarketRecord(timestamp, kind, strings[buffer_id], strings.get(symbol_id), payload)
+
+
+def list_record_files(directory: str, prefix="market") -> List[str]:
+    """
+    Log files of the directory in chronological order
+    """
+    names = sorted(name for name in os.listdir(directory) if name.startswith(prefix + "-") and name.endswith(".bin"))
+    return [os.path.join(directory, name) for name in names]
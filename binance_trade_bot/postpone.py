@@ -1,6 +1,8 @@
 from contextvars import ContextVar
 from typing import List, Optional
 
+from .timings import timed
+
 
 def _default_list() -> Optional[List]:
     return None
@@ -52,9 +54,13 @@ def postpone_heavy_calls(func):
                 func(*args, **kwargs)
             finally:
                 should_postpone.set(False)
-                pcs = postponed_calls.get()
-                for pfunc, pargs, pkwargs in pcs:
-                    pfunc(*pargs, **pkwargs)
-                pcs.clear()
+                run_postponed_calls(postponed_calls.get())
 
     return wrap
+
+
+@timed("heavy_calls_flush")
+def run_postponed_calls(pcs: List):
+    for pfunc, pargs, pkwargs in pcs:
+        pfunc(*pargs, **pkwargs)
+    pcs.clear()
@@ -0,0 +1,168 @@
+import mmap
+import os
+import struct
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .logger import Logger
+
+MAGIC = b"BTBRAT1\n"
+# generation, coin count, length of the symbols, highest pair id of the database the store was built from
+HEADER = struct.Struct("<QIIQ")
+
+
+def ratio_store_path(db_uri: str) -> Optional[str]:
+    """
+    Path of the ratio store kept next to a SQLite database file, None for in-memory and other databases
+    """
+    prefix = "sqlite:///"
+    if not db_uri.startswith(prefix) or len(db_uri) == len(prefix) or db_uri.endswith(":memory:"):
+        return None
+    return os.path.splitext(db_uri[len(prefix) :])[0] + ".ratios"
+
+
+class RatioStore:
+    """
+    Ratio matrix and pair ids of the enabled coins in a memory-mapped file.
+
+    The file holds a header with the coin symbols in CoinStub order and a generation counter, followed by the n x n
+    float64 ratios and the n x n uint64 pair ids. Commits write the changed cells in place. The generation is odd
+    while a commit is being written, so a store torn by a crash is detected when it is opened.
+    """
+
+    def __init__(self, path: str, file, buf: mmap.mmap):
+        self.path = path
+        self._file = file
+        self._buf = buf
+        generation, n, symbols_length, self.max_pair_id = HEADER.unpack_from(buf, len(MAGIC))
+        symbols_start = len(MAGIC) + HEADER.size
+        symbols = bytes(buf[symbols_start : symbols_start + symbols_length]).decode()
+        self.symbols: List[str] = symbols.split(" ") if symbols else []
+        self.generation = generation
+        offset = RatioStore.data_offset(symbols_length)
+        self.ratios = np.ndarray((n, n), dtype=np.float64, buffer=buf, offset=offset)
+        self.pair_ids = np.ndarray((n, n), dtype=np.uint64, buffer=buf, offset=offset + n * n * 8)
+
+    @staticmethod
+    def data_offset(symbols_length: int) -> int:
+        # the matrices are 8 bytes aligned
+        return (len(MAGIC) + HEADER.size + symbols_length + 7) // 8 * 8
+
+    @staticmethod
+    def create(
+        path: str, symbols: List[str], ratios: np.ndarray, pair_ids: np.ndarray, max_pair_id: int
+    ) -> "RatioStore":
+        """
+        Write a new store, replacing the file atomically
+        """
+        encoded = " ".join(symbols).encode()
+        n = len(symbols)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(MAGIC)
+            file.write(HEADER.pack(0, n, len(encoded), max_pair_id))
+            file.write(encoded)
+            file.write(bytes(RatioStore.data_offset(len(encoded)) - file.tell()))
+            file.write(np.ascontiguousarray(ratios, dtype=np.float64).tobytes())
+            file.write(np.ascontiguousarray(pair_ids, dtype=np.uint64).tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+        return RatioStore.open(path)
+
+    @staticmethod
+    def open(path: str) -> Optional["RatioStore"]:
+        """
+        :return: None if there is no complete store at the path
+        """
+        if not os.path.exists(path):
+            return None
+        file = open(path, "r+b")  # pylint: disable=consider-using-with
+        size = os.fstat(file.fileno()).st_size
+        if size < len(MAGIC) + HEADER.size:
+            file.close()
+            return None
+        buf = mmap.mmap(file.fileno(), 0)
+        _, n, symbols_length, _ = HEADER.unpack_from(buf, len(MAGIC))
+        if buf[: len(MAGIC)] != MAGIC or size < RatioStore.data_offset(symbols_length) + 2 * n * n * 8:
+            buf.close()
+            file.close()
+            return None
+        return RatioStore(path, file, buf)
+
+    @property
+    def torn(self) -> bool:
+        """
+        A commit was interrupted, the ratios may be partly written
+        """
+        return self.generation % 2 == 1
+
+    def _set_generation(self, generation: int):
+        self.generation = generation
+        struct.pack_into("<Q", self._buf, len(MAGIC), generation)
+        self._buf.flush(0, min(mmap.PAGESIZE, len(self._buf)))
+
+    def write(self, cells: np.ndarray, ratios: np.ndarray):
+        """
+        Write the ratios of the cells masked by cells in place and flush them to disk
+        """
+        self._set_generation(self.generation + 1)
+        np.copyto(self.ratios, ratios, where=cells)
+        self._buf.flush()
+        self._set_generation(self.generation + 1)
+
+    def close(self):
+        # the arrays must not be used after the map is closed
+        del self.ratios, self.pair_ids
+        self._buf.close()
+        self._file.close()
+
+
+class PairRatioWriter:
+    """
+    Writes ratios to the pairs table in a background thread every flush_interval seconds. Updates of the same pair
+    are coalesced, only the last ratio is written.
+    """
+
+    def __init__(self, write: Callable[[Dict[int, float]], None], logger: Logger, flush_interval=1.0):
+        self.write = write
+        self.logger = logger
+        self.flush_interval = flush_interval
+        self.pending: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pair-ratio-writer", daemon=True)
+
+    def submit(self, pair_ids: Iterable[int], ratios: Iterable[float]):
+        with self._lock:
+            self.pending.update(zip(pair_ids, ratios))
+            if not self._thread.is_alive() and not self._stop.is_set():
+                self._thread.start()
+
+    def flush(self):
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        try:
+            self.write(pending)
+        except Exception:
+            with self._lock:
+                # keep what failed unless a newer ratio was submitted meanwhile
+                self.pending = {**pending, **self.pending}
+            raise
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:  # pylint: disable=broad-except
+                self.logger.error(f"Pair ratio writer failed to write: {e}")
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.flush()
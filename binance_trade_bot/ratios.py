@@ -1,6 +1,7 @@
-from array import array
 from math import nan
-from typing import Dict, Iterable, KeysView, List, Optional, Tuple, Type
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+
+import numpy as np
 
 from binance_trade_bot.models import Pair
 
@@ -42,6 +43,28 @@ class CoinStub:
         cls._instances.clear()
         cls._instances_by_symbol.clear()
 
+    @classmethod
+    def resize(cls: Type["CoinStub"], symbols: List[str]) -> np.ndarray:
+        """
+        Replace the coins with the symbols in place, coins that stay keep their CoinStub instance with a new idx
+
+        :return: previous idx of every coin in the new order, -1 for the added ones, see RatiosManager.resize
+        """
+        old_idxs = np.full(len(symbols), -1, dtype=np.intp)
+        instances = []
+        for idx, symbol in enumerate(symbols):
+            instance = cls._instances_by_symbol.get(symbol)
+            if instance is None:
+                instance = cls(idx, symbol)
+            else:
+                old_idxs[idx] = instance.idx
+                instance.idx = idx
+            instances.append(instance)
+        cls._instances[:] = instances
+        cls._instances_by_symbol.clear()
+        cls._instances_by_symbol.update((instance.symbol, instance) for instance in instances)
+        return old_idxs
+
     @classmethod
     def len_coins(cls: Type["CoinStub"]) -> int:
         return len(cls._instances)
@@ -56,49 +79,125 @@ class RatiosManager:
     Provides memory storage for all ratios in a form of dense square matrix with a row major order.
     It also has a basic transaction support in a form of commit/rollback calls, which should be much
     more lightweight than SQLAlchemy ORM does.
+
+    The matrix is a NumPy array, rows and columns are returned as views of it. A transaction keeps a bitmap of the
+    changed cells and their values before the first change, so commits and rollbacks are single array operations.
     """
 
     def __init__(self, ratios: Optional[Iterable[Pair]] = None):
         self.n = CoinStub.len_coins()
-        self._data = array("d", (nan if i != j else 1.0 for i in range(self.n) for j in range(self.n)))
-        self._dirty: Dict[Tuple[int, int], float] = {}
-        self._ids: Optional[array] = None
+        self._data = np.full((self.n, self.n), nan)
+        np.fill_diagonal(self._data, 1.0)
+        self._ids = np.zeros((self.n, self.n), dtype=np.uint64)
+        self._dirty = np.zeros((self.n, self.n), dtype=bool)
+        self._saved = np.empty((self.n, self.n))
         if ratios is not None:
-            self._ids = array("Q", (0 for _ in range(self.n * self.n)))
-            for pair in ratios:
-                i = CoinStub.get_by_symbol(pair.from_coin.symbol).idx
-                j = CoinStub.get_by_symbol(pair.to_coin.symbol).idx
-                val = pair.ratio if pair.ratio is not None else nan
-                pair_id = pair.id if pair.id is not None else 0
-                idx = self.n * i + j
-                self._data[idx] = val
-                self._ids[idx] = pair_id
+            self.load_pairs(ratios)
+
+    @classmethod
+    def from_matrix(cls: Type["RatiosManager"], ratios: np.ndarray, pair_ids: np.ndarray) -> "RatiosManager":
+        """
+        Manager of a copy of a ratio matrix and its pair ids, indexed by CoinStub idx
+        """
+        manager = cls()
+        manager._data[:] = ratios
+        manager._ids[:] = pair_ids
+        return manager
+
+    def load_pairs(self, ratios: Iterable[Pair]):
+        """
+        Load the ratios and ids of pairs of enabled coins, outside of the transaction
+        """
+        from_idxs, to_idxs, values, pair_ids = [], [], [], []
+        for pair in ratios:
+            from_idxs.append(CoinStub.get_by_symbol(pair.from_coin.symbol).idx)
+            to_idxs.append(CoinStub.get_by_symbol(pair.to_coin.symbol).idx)
+            values.append(pair.ratio if pair.ratio is not None else nan)
+            pair_ids.append(pair.id if pair.id is not None else 0)
+        self._data[from_idxs, to_idxs] = values
+        self._ids[from_idxs, to_idxs] = pair_ids
+
+    def resize(self, old_idxs: np.ndarray):
+        """
+        Follow CoinStub.resize: keep the ratios between the coins that stay and add empty rows and columns for the
+        added coins, their ratios are loaded with load_pairs
+        """
+        assert not self._dirty.any(), "Can't resize the ratios in a transaction"
+        self.n = len(old_idxs)
+        kept = np.flatnonzero(old_idxs >= 0)
+        kept_cells = np.ix_(kept, kept)
+        old_cells = np.ix_(old_idxs[kept], old_idxs[kept])
+        data = np.full((self.n, self.n), nan)
+        np.fill_diagonal(data, 1.0)
+        data[kept_cells] = self._data[old_cells]
+        ids = np.zeros((self.n, self.n), dtype=np.uint64)
+        ids[kept_cells] = self._ids[old_cells]
+        self._data, self._ids = data, ids
+        self._dirty = np.zeros((self.n, self.n), dtype=bool)
+        self._saved = np.empty((self.n, self.n))
 
     def set(self, from_coin_idx: int, to_coin_idx: int, val: float):
         cell = (from_coin_idx, to_coin_idx)
-        if cell not in self._dirty:
-            self._dirty[cell] = self._data[self.n * cell[0] + cell[1]]
-        self._data[self.n * cell[0] + cell[1]] = val
+        if not self._dirty[cell]:
+            self._dirty[cell] = True
+            self._saved[cell] = self._data[cell]
+        self._data[cell] = val
+
+    def _set_cells(self, cells, values):
+        # saved values are only taken from the cells that aren't dirty yet
+        save = ~self._dirty[cells]
+        self._saved[cells] = np.where(save, self._data[cells], self._saved[cells])
+        self._dirty[cells] = True
+        self._data[cells] = values
+
+    def set_row(self, from_coin_idx: int, values, to_coin_idxs=None):
+        """
+        Set the ratios from a coin to every coin, or to the to_coin_idxs coins only
+        """
+        self._set_cells((from_coin_idx, slice(None) if to_coin_idxs is None else to_coin_idxs), values)
+
+    def set_column(self, to_coin_idx: int, values, from_coin_idxs=None):
+        """
+        Set the ratios from every coin, or from the from_coin_idxs coins only, to a coin
+        """
+        self._set_cells((slice(None) if from_coin_idxs is None else from_coin_idxs, to_coin_idx), values)
 
     def get(self, from_coin_idx: int, to_coin_idx: int) -> float:
-        return self._data[self.n * from_coin_idx + to_coin_idx]
+        return self._data[from_coin_idx, to_coin_idx]
+
+    def get_from_coin(self, from_coin_idx: int) -> np.ndarray:
+        return self._data[from_coin_idx]
 
-    def get_from_coin(self, from_coin_idx: int):
-        return self._data[self.n * from_coin_idx : self.n * (from_coin_idx + 1)]
+    def get_to_coin(self, to_coin_idx: int) -> np.ndarray:
+        return self._data[:, to_coin_idx]
 
-    def get_to_coin(self, to_coin_idx: int):
-        return self._data[to_coin_idx :: self.n]
+    def get_all(self) -> np.ndarray:
+        return self._data
 
-    def get_dirty(self) -> KeysView[Tuple[int, int]]:
-        return self._dirty.keys()
+    def get_dirty(self) -> List[Tuple[int, int]]:
+        return list(zip(*(idxs.tolist() for idxs in np.nonzero(self._dirty))))
+
+    def get_dirty_mask(self) -> np.ndarray:
+        """
+        Bitmap of the cells changed in the current transaction
+        """
+        return self._dirty
+
+    def get_dirty_pairs(self) -> Tuple[List[int], List[float]]:
+        """
+        Pair ids and ratios of the cells changed in the current transaction
+        """
+        return self._ids[self._dirty].tolist(), self._data[self._dirty].tolist()
 
     def get_pair_id(self, from_coin_idx: int, to_coin_idx: int) -> int:
-        return self._ids[from_coin_idx * self.n + to_coin_idx]
+        return int(self._ids[from_coin_idx, to_coin_idx])
+
+    def get_all_pair_ids(self) -> np.ndarray:
+        return self._ids
 
     def rollback(self):
-        for cell, old_value in self._dirty.items():
-            self._data[self.n * cell[0] + cell[1]] = old_value
-        self._dirty.clear()
+        np.copyto(self._data, self._saved, where=self._dirty)
+        self._dirty.fill(False)
 
     def commit(self):
-        self._dirty.clear()
+        self._dirty.fill(False)
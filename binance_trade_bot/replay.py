@@ -0,0 +1,394 @@
+import asyncio
+from collections import defaultdict, deque
+from datetime import datetime
+from functools import partial
+from itertools import chain
+from traceback import format_exc
+from typing import Deque, Dict, Iterator, List, Optional
+
+import numpy as np
+from binance import Client
+
+from .backtest import MockDatabase
+from .binance_api_manager import BinanceAPIManager, BinanceOrderBalanceManager
+from .binance_stream_manager import (
+    BUFFER_NAME_DEPTH,
+    BUFFER_NAME_MINITICKERS,
+    BUFFER_NAME_USERDATA,
+    DEPTH_CACHE_TYPES,
+    AsyncListener,
+    AsyncListenerContext,
+    BinanceCache,
+    BinanceOrder,
+    BinanceStreamManager,
+    DepthCacheManager,
+    DepthListener,
+    TickerListener,
+    UserDataListener,
+)
+from .config import Config
+from .database import Database
+from .logger import Logger
+from .market_recorder import KIND_SNAPSHOT, MarketRecord, list_record_files, read_records
+from .ratios import CoinStub
+from .resync_scheduler import OrderBookResyncScheduler
+from .strategies import get_strategy
+from .stream_parser import parse_depth_update, parse_mini_ticker
+from .timings import phase_timings
+
+
+class ReplayOrderBookClient:
+    """
+    Serves recorded order book snapshots to DepthCacheManagers in place of the REST API.
+
+    A request waits for the next snapshot of the symbol in the recording. A snapshot nobody waits for is kept
+    until the next request of its symbol, only the latest one.
+    """
+
+    def __init__(self):
+        self.snapshots: Dict[str, Dict] = {}
+        self.waiters: Dict[str, Deque[asyncio.Future]] = defaultdict(deque)
+
+    def add_snapshot(self, snapshot: Dict):
+        symbol = snapshot["symbol"]
+        waiters = self.waiters[symbol]
+        while waiters:
+            fut = waiters.popleft()
+            if not fut.done():
+                fut.set_result(snapshot)
+                return
+        self.snapshots[symbol] = snapshot
+
+    async def get_order_book(self, symbol: str, limit=100):  # pylint: disable=unused-argument
+        snapshot = self.snapshots.pop(symbol, None)
+        if snapshot is not None:
+            return snapshot
+        fut = asyncio.get_running_loop().create_future()
+        self.waiters[symbol].append(fut)
+        return await fut
+
+
+class MarketReplay:  # pylint: disable=too-many-instance-attributes
+    """
+    Feeds recorded stream messages (see market_recorder) to the listeners of an AsyncListenerContext instead of
+    BinanceWebSocketApiManager, in the order the listeners consumed them when they were recorded.
+
+    With speed None records are replayed as fast as possible, otherwise at speed times the recorded wall-clock
+    pace. Every record is followed by the loop running until the listeners handled it, so a replay as fast as
+    possible is deterministic.
+    """
+
+    SETTLE_ROUNDS = 3
+
+    def __init__(
+        self,
+        paths: List[str],
+        async_context: AsyncListenerContext,
+        order_book_client: ReplayOrderBookClient,
+        listeners: List[AsyncListener],
+        speed: Optional[float] = None,
+    ):  # pylint:disable=too-many-arguments
+        self.async_context = async_context
+        self.order_book_client = order_book_client
+        self.listeners = listeners
+        self.speed = speed
+        self.records: Iterator[MarketRecord] = chain.from_iterable(map(read_records, paths))
+        self.next_record: Optional[MarketRecord] = next(self.records, None)
+        self.clock = self.next_record.timestamp if self.next_record is not None else 0.0
+        self.records_replayed = 0
+        self._started: Optional[float] = None
+        self._start_clock = self.clock
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def finished(self) -> bool:
+        return self.next_record is None
+
+    def start(self):
+        self._tasks = [asyncio.create_task(listener.run_loop()) for listener in self.listeners]
+
+    async def run_until(self, timestamp: float) -> bool:
+        """
+        Replay every record up to the timestamp and move the replay clock to it
+
+        :return: False once the recording is exhausted
+        """
+        loop = asyncio.get_running_loop()
+        if self._started is None:
+            self._started = loop.time()
+        while self.next_record is not None and self.next_record.timestamp <= timestamp:
+            record = self.next_record
+            if self.speed is not None:
+                delay = self._started + (record.timestamp - self._start_clock) / self.speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self.clock = record.timestamp
+            self._deliver(record)
+            self.records_replayed += 1
+            await self._settle()
+            self.next_record = next(self.records, None)
+        if self.next_record is None:
+            return False
+        if self.speed is not None:
+            delay = self._started + (timestamp - self._start_clock) / self.speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self.clock = max(self.clock, timestamp)
+        return True
+
+    async def run(self):
+        await self.run_until(float("inf"))
+
+    def _deliver(self, record: MarketRecord):
+        if record.kind == KIND_SNAPSHOT:
+            self.order_book_client.add_snapshot(record.decode())
+        else:
+            self.async_context.queues[record.buffer_name].put_nowait(record.decode())
+
+    async def _settle(self):
+        queues = self.async_context.queues.values()
+        while any(not queue.empty() for queue in queues):
+            await asyncio.sleep(0)
+        # depth drains and resyncs woken by the record run in the following iterations
+        for _ in range(self.SETTLE_ROUNDS):
+            await asyncio.sleep(0)
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def create_market_replay(
+    paths: List[str], cache: BinanceCache, config: Config, logger: Logger, speed: Optional[float] = None
+) -> MarketReplay:
+    """
+    Set up depth cache managers and listeners of the configured coins like StreamManagerWorker, fed by a replay
+    """
+    cache.attach_loop()
+    order_book_client = ReplayOrderBookClient()
+    # recorded snapshots are served right away, so there is no request weight to save
+    resync_scheduler = OrderBookResyncScheduler(
+        order_book_client, logger, weight_per_minute=float("inf"), max_concurrency=len(config.SUPPORTED_COIN_LIST)
+    )
+    depth_cache_type = DEPTH_CACHE_TYPES[config.DEPTH_CACHE_TYPE]
+    depth_cache_managers = {
+        symbol: DepthCacheManager(
+            symbol,
+            order_book_client,
+            logger,
+            depth_cache_factory=partial(depth_cache_type, *config.get_depth_cache_limits(symbol)),
+            resync_scheduler=resync_scheduler,
+        )
+        for symbol in (coin + config.BRIDGE.symbol for coin in config.SUPPORTED_COIN_LIST)
+    }
+    async_context = AsyncListenerContext(
+        [BUFFER_NAME_MINITICKERS, BUFFER_NAME_USERDATA, BUFFER_NAME_DEPTH],
+        cache,
+        logger,
+        None,
+        depth_cache_managers,
+    )
+    # parsers only apply to raw payloads, so recordings of both stream parsers can be replayed
+    listeners = [
+        TickerListener(async_context, parse_mini_ticker),
+        UserDataListener(async_context),
+        DepthListener(async_context, depth_cache_managers, parse_depth_update),
+    ]
+    market_replay = MarketReplay(paths, async_context, order_book_client, listeners, speed)
+    market_replay.start()
+    return market_replay
+
+
+class ReplayBinanceManager(BinanceAPIManager):
+    """
+    Paper trading manager for replays: prices come from the replayed order books and tickers, market orders are
+    filled against the replayed books. Symbol filters are still fetched with the client.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        binance_cache: BinanceCache,
+        config: Config,
+        db: Database,
+        logger: Logger,
+        stream_manager: BinanceStreamManager,
+        start_balances: Dict[str, float] = None,
+    ):  # pylint:disable=too-many-arguments
+        super().__init__(
+            client, binance_cache, config, db, logger, BinanceOrderBalanceManager(logger, client, binance_cache)
+        )
+        self.stream_manager = stream_manager
+        self.datetime: Optional[datetime] = None
+        self.balances = start_balances or {config.BRIDGE.symbol: 100}
+
+    def setup_websockets(self):
+        pass  # streams are replayed by MarketReplay
+
+    def close(self):
+        pass
+
+    def get_fee(self, origin_coin: str, target_coin: str, selling: bool):
+        return 0.001
+
+    def get_fee_vector(self, selling: bool) -> np.ndarray:
+        return np.full(CoinStub.len_coins(), 0.001)
+
+    def get_ticker_price(self, ticker_symbol: str):
+        price = self.cache.ticker_prices.get_symbol(ticker_symbol)
+        if price is None:
+            return self.cache.ticker_values.get(ticker_symbol)
+        return price
+
+    def get_currency_balance(self, currency_symbol: str, force=False):
+        return self.balances.get(currency_symbol, 0)
+
+    def buy_alt(self, origin_coin: str, target_coin: str, buy_price: float):
+        origin_symbol = origin_coin
+        target_symbol = target_coin
+
+        target_balance = self.get_currency_balance(target_symbol)
+        from_coin_price, _ = self.get_market_buy_price(origin_symbol + target_symbol, target_balance)
+        if from_coin_price is None:
+            self.logger.info(f"Order book of {origin_symbol + target_symbol} is too thin to buy")
+            return None
+
+        order_quantity = self.buy_quantity(origin_symbol, target_symbol, target_balance, from_coin_price)
+        target_quantity = order_quantity * from_coin_price
+        self.balances[target_symbol] -= target_quantity
+        order_filled_quantity = order_quantity * (1 - self.get_fee(origin_coin, target_coin, False))
+        self.balances[origin_symbol] = self.balances.get(origin_symbol, 0) + order_filled_quantity
+        self.logger.info(
+            f"Bought {origin_symbol} at {from_coin_price}, balance now: {self.balances[origin_symbol]} - bridge: "
+            f"{self.balances[target_symbol]}"
+        )
+        return BinanceOrder(
+            defaultdict(
+                lambda: None,
+                price=from_coin_price,
+                cummulativeQuoteQty=target_quantity,
+                executedQty=order_quantity,
+            )
+        )
+
+    def sell_alt(self, origin_coin: str, target_coin: str, sell_price: float):
+        origin_symbol = origin_coin
+        target_symbol = target_coin
+
+        origin_balance = self.get_currency_balance(origin_symbol)
+        order_quantity = self.sell_quantity(origin_symbol, target_symbol, origin_balance)
+        from_coin_price, target_quantity = self.get_market_sell_price(origin_symbol + target_symbol, order_quantity)
+        if from_coin_price is None:
+            self.logger.info(f"Order book of {origin_symbol + target_symbol} is too thin to sell")
+            return None
+
+        target_filled_quantity = target_quantity * (1 - self.get_fee(origin_coin, target_coin, True))
+        self.balances[target_symbol] = self.balances.get(target_symbol, 0) + target_filled_quantity
+        self.balances[origin_symbol] -= order_quantity
+        self.logger.info(
+            f"Sold {origin_symbol} at {from_coin_price}, balance now: {self.balances[origin_symbol]} - bridge: "
+            f"{self.balances[target_symbol]}"
+        )
+        return BinanceOrder(
+            defaultdict(
+                lambda: None,
+                price=from_coin_price,
+                cummulativeQuoteQty=target_quantity,
+                executedQty=order_quantity,
+            )
+        )
+
+
+def replay(
+    directory: str,
+    speed: Optional[float] = None,
+    scout_interval=1.0,
+    yield_interval=100,
+    warmup=60.0,
+    start_balances: Dict[str, float] = None,
+    starting_coin: str = None,
+    config: Config = None,
+):  # pylint:disable=too-many-arguments,too-many-locals
+    """
+
+    :param directory: Directory of the recording, see market_recorder_dir
+    :param speed: None to replay as fast as possible, otherwise multiple of the recorded wall-clock pace
+    :param scout_interval: Number of recorded seconds between each scout
+    :param yield_interval: After how many intervals should the manager be yielded
+    :param warmup: Recorded seconds to wait at most for every order book to be synced before trading
+    :param start_balances: A dictionary of initial coin values. Default: {BRIDGE: 100}
+    :param starting_coin: The coin to start on. Default: first coin in coin list
+
+    :return: The final coin balances
+    """
+    config = config or Config()
+    logger = Logger("replay", enable_notifications=False)
+
+    db = MockDatabase(logger, config)
+    db.create_database()
+    db.set_coins(config.SUPPORTED_COIN_LIST)
+
+    cache = BinanceCache()
+    loop = asyncio.new_event_loop()
+    market_replay = loop.run_until_complete(
+        create_market_replay(list_record_files(directory), cache, config, logger, speed)
+    )
+    stream_manager = BinanceStreamManager(logger, market_replay.async_context, None, None)
+    manager = ReplayBinanceManager(
+        Client(config.BINANCE_API_KEY, config.BINANCE_API_SECRET_KEY, tld=config.BINANCE_TLD),
+        cache,
+        config,
+        db,
+        logger,
+        stream_manager,
+        start_balances,
+    )
+
+    def advance(timestamp: float) -> bool:
+        running = loop.run_until_complete(market_replay.run_until(timestamp))
+        manager.datetime = datetime.utcfromtimestamp(market_replay.clock)
+        return running
+
+    try:
+        dcms = market_replay.async_context.depth_cache_managers.values()
+        warmup_end = market_replay.clock + warmup
+        while market_replay.clock < warmup_end and any(dcm.snapshot.last_update_id < 0 for dcm in dcms):
+            if not advance(market_replay.clock + scout_interval):
+                break
+
+        starting_coin = db.get_coin(starting_coin or config.SUPPORTED_COIN_LIST[0])
+        if manager.get_currency_balance(starting_coin.symbol) == 0:
+            manager.buy_alt(starting_coin.symbol, config.BRIDGE.symbol, 0.0)
+        db.set_current_coin(starting_coin)
+
+        strategy = get_strategy(config.STRATEGY)
+        if strategy is None:
+            logger.error("Invalid strategy name")
+            return manager
+        trader = strategy(manager, db, logger, config)
+        trader.initialize()
+        phase_timings.enabled = config.PHASE_TIMINGS_INTERVAL > 0
+        phase_timings.reset()
+        yield manager
+
+        n = 1
+        try:
+            while advance(market_replay.clock + scout_interval):
+                try:
+                    trader.scout()
+                except Exception:  # pylint: disable=broad-except
+                    logger.warning(format_exc())
+                if n % yield_interval == 0:
+                    yield manager
+                n += 1
+        except KeyboardInterrupt:
+            pass
+    finally:
+        loop.run_until_complete(market_replay.close())
+        loop.close()
+    logger.info(f"Replayed {market_replay.records_replayed} records")
+    if phase_timings.enabled:
+        phase_timings.log_stats(logger)
+        phase_timings.enabled = False
+    return manager
@@ -0,0 +1,157 @@
+import asyncio
+import heapq
+import itertools
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+import binance.client
+from binance.exceptions import BinanceAPIException
+
+from .logger import Logger
+from .market_recorder import MarketDataRecorder
+
+
+def order_book_weight(limit: int) -> int:
+    """
+    Request weight of GET /api/v3/depth for the given limit
+    """
+    if limit <= 100:
+        return 1
+    if limit <= 500:
+        return 5
+    if limit <= 1000:
+        return 10
+    return 50
+
+
+class OrderBookResyncScheduler:  # pylint: disable=too-many-instance-attributes
+    """
+    Schedules order book snapshot requests of DepthCacheManagers within a request weight budget.
+
+    At most max_concurrency requests are in flight and at most weight_per_minute weight is spent per sliding
+    window. Waiting requests are served by priority (see set_priorities), so the books we trade on become
+    consistent first. A resync round lasts from the first book getting out of sync until every book is
+    consistent again, its duration is logged and kept in last_round_duration. Fetched snapshots are recorded
+    when a recorder is given, so a replay can resync from the same books.
+    """
+
+    RATE_LIMIT_BACKOFF = 60.0
+    RETRY_DELAY = 0.5
+
+    def __init__(
+        self,
+        client: binance.AsyncClient,
+        logger: Logger,
+        weight_per_minute=600,
+        max_concurrency=5,
+        window=60.0,
+        recorder: Optional[MarketDataRecorder] = None,
+    ):  # pylint:disable=too-many-arguments
+        self.client = client
+        self.recorder = recorder
+        self.logger = logger
+        self.weight_per_minute = weight_per_minute
+        self.max_concurrency = max_concurrency
+        self.window = window
+        self._priorities: Dict[str, int] = {}
+        self._waiters: List[Tuple[int, int, asyncio.Future, int]] = []
+        self._sequence = itertools.count()
+        self._running = 0
+        self._spent: Deque[Tuple[float, int]] = deque()
+        self._paused_until = 0.0
+        self._dispatch_handle: Optional[asyncio.TimerHandle] = None
+        self._unsynced: Set[str] = set()
+        self._round_started = 0.0
+        self._round_size = 0
+        self.last_round_duration: Optional[float] = None
+        self.last_round_size = 0
+
+    def set_priorities(self, symbols: List[str]):
+        """
+        Symbols to resync first, in order of importance, every other symbol goes after them.
+        Safe to call from any thread.
+        """
+        self._priorities = {symbol: rank for rank, symbol in enumerate(symbols)}
+
+    def mark_unsynced(self, symbol: str):
+        if not self._unsynced:
+            self._round_started = asyncio.get_running_loop().time()
+            self._round_size = 0
+        if symbol not in self._unsynced:
+            self._unsynced.add(symbol)
+            self._round_size += 1
+
+    def mark_synced(self, symbol: str):
+        if symbol not in self._unsynced:
+            return
+        self._unsynced.remove(symbol)
+        if not self._unsynced:
+            self.last_round_duration = asyncio.get_running_loop().time() - self._round_started
+            self.last_round_size = self._round_size
+            self.logger.info(
+                f"OB: {self.last_round_size} order books are consistent again after {self.last_round_duration:.2f}s",
+                False,
+            )
+
+    def unsynced_symbols(self) -> Set[str]:
+        return set(self._unsynced)
+
+    async def fetch_order_book(self, symbol: str, limit: int):
+        """
+        Wait for a free slot and enough weight budget, then fetch the order book, retrying on errors
+        """
+        weight = order_book_weight(limit)
+        while True:
+            await self._acquire(symbol, weight)
+            try:
+                res = await self.client.get_order_book(symbol=symbol, limit=limit)
+                if self.recorder is not None:
+                    self.recorder.record_snapshot(symbol, res)
+                return res
+            except BinanceAPIException as e:
+                self.logger.error(f"Error while fetching snapshot of order book: {e}")
+                if e.status_code in (418, 429):
+                    self._paused_until = asyncio.get_running_loop().time() + self.RATE_LIMIT_BACKOFF
+            finally:
+                self._release()
+            await asyncio.sleep(self.RETRY_DELAY)
+
+    async def _acquire(self, symbol: str, weight: int):
+        fut = asyncio.get_running_loop().create_future()
+        priority = self._priorities.get(symbol, len(self._priorities))
+        heapq.heappush(self._waiters, (priority, next(self._sequence), fut, weight))
+        self._dispatch()
+        await fut
+
+    def _release(self):
+        self._running -= 1
+        self._dispatch()
+
+    def _spent_weight(self, now: float) -> int:
+        while self._spent and self._spent[0][0] <= now - self.window:
+            self._spent.popleft()
+        return sum(weight for _, weight in self._spent)
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        while self._waiters and self._running < self.max_concurrency:
+            _, _, fut, weight = self._waiters[0]
+            if fut.cancelled():
+                heapq.heappop(self._waiters)
+                continue
+            if now < self._paused_until:
+                self._schedule_dispatch(self._paused_until - now)
+                return
+            if self._spent and self._spent_weight(now) + weight > self.weight_per_minute:
+                self._schedule_dispatch(self._spent[0][0] + self.window - now)
+                return
+            heapq.heappop(self._waiters)
+            self._running += 1
+            self._spent.append((now, weight))
+            fut.set_result(None)
+
+    def _schedule_dispatch(self, delay: float):
+        if self._dispatch_handle is not None:
+            self._dispatch_handle.cancel()
+        self._dispatch_handle = asyncio.get_running_loop().call_later(max(delay, 0.0), self._dispatch)
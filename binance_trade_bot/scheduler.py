@@ -31,3 +31,10 @@ class SafeScheduler(Scheduler):
                 # letting it run
                 # next tick
                 job._schedule_next_run()  # pylint: disable=protected-access
+
+    def run_job_now(self, job: Job):
+        """
+        Run a job ahead of its schedule, failures are handled like in scheduled runs and the next run is
+        rescheduled from now
+        """
+        self._run_job(job)
@@ -4,6 +4,7 @@ from datetime import datetime
 
 from binance_trade_bot.auto_trader import AutoTrader
 from binance_trade_bot.ratios import CoinStub
+from binance_trade_bot.timings import timed
 
 
 class Strategy(AutoTrader):
@@ -11,6 +12,7 @@ class Strategy(AutoTrader):
         super().initialize()
         self.initialize_current_coin()
 
+    @timed("scout")
     def scout(self):
         """
         Scout for potential jumps from the current coin to another coin
@@ -0,0 +1,57 @@
+"""
+Parsers of raw Binance stream payloads.
+
+They produce the same dicts as UnicornFy, but only with the fields the listeners use, and convert price and
+quantity strings to floats in bulk while parsing.
+"""
+
+from itertools import chain
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from orjson import loads  # pylint: disable=no-name-in-module
+except ImportError:
+    from json import loads
+
+
+def parse_levels(levels: List[List[str]]) -> List[Tuple[float, float]]:
+    """
+    Convert [["price", "quantity"], ...] levels into (price, quantity) float pairs
+    """
+    values = map(float, chain.from_iterable(levels))
+    return list(zip(values, values))
+
+
+def parse_depth_update(raw: str) -> Optional[Dict]:
+    """
+    :return: depth diff event with first/final update ids and float levels, None for any other payload
+    """
+    payload = loads(raw)
+    data = payload.get("data", payload)
+    if data.get("e") != "depthUpdate":
+        return None
+    return {
+        "symbol": data["s"],
+        "event_time": data["E"],
+        "first_update_id_in_event": data["U"],
+        "final_update_id_in_event": data["u"],
+        "bids": parse_levels(data["b"]),
+        "asks": parse_levels(data["a"]),
+    }
+
+
+def parse_mini_ticker(raw: str) -> Optional[Dict]:
+    """
+    :return: miniTicker event with float close prices of every symbol in the payload, None for any other payload
+    """
+    payload = loads(raw)
+    data = payload.get("data", payload) if isinstance(payload, dict) else payload
+    items = data if isinstance(data, list) else [data]
+    events = [
+        {"symbol": item["s"], "event_time": item["E"], "close_price": float(item["c"])}
+        for item in items
+        if item.get("e") == "24hrMiniTicker"
+    ]
+    if not events:
+        return None
+    return {"event_type": "24hrMiniTicker", "data": events}
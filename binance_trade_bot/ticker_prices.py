@@ -0,0 +1,93 @@
+import math
+from array import array
+from typing import Dict, List, Optional
+
+from .config import Config
+
+BRIDGE_QUOTE_IDX = 0  # the bridge is always the first quote asset
+TICKER_QUOTES = ["USDT", "BTC", "BNB"]
+
+
+def ticker_quotes(config: Config) -> List[str]:
+    """
+    Quote assets of the ticker streams, bridge first
+    """
+    return [config.BRIDGE.symbol] + [quote for quote in TICKER_QUOTES if quote != config.BRIDGE.symbol]
+
+
+class TickerPrices:
+    """
+    Latest ticker prices in a dense array of coins x quote assets with the time each slot was updated.
+
+    The slot of a price is coin_idx * len(quotes) + quote_idx, coin_idx being the CoinStub idx of the coin. Symbols
+    are mapped to their slot once, so the ticker listener writes prices without allocating and the trader reads
+    them by index without building symbol strings. Only the stream thread writes regular updates, readers of other
+    threads may see a price one update old.
+    """
+
+    def __init__(self, coins: List[str] = (), quotes: List[str] = ()):
+        self.coins = list(coins)
+        self.quotes = list(quotes)
+        size = len(self.coins) * len(self.quotes)
+        self.prices = array("d", [math.nan]) * size
+        self.updated = array("d", [0.0]) * size
+        self.slots: Dict[str, int] = {
+            coin + quote: self.slot(coin_idx, quote_idx)
+            for coin_idx, coin in enumerate(self.coins)
+            for quote_idx, quote in enumerate(self.quotes)
+            if coin != quote
+        }
+        self._quote_ids = {quote: quote_idx for quote_idx, quote in enumerate(self.quotes)}
+
+    @staticmethod
+    def create(config: Config) -> "TickerPrices":
+        # CoinStubs are created in the order of symbols, see Database.set_coins
+        return TickerPrices(sorted(set(config.SUPPORTED_COIN_LIST)), ticker_quotes(config))
+
+    def slot(self, coin_idx: int, quote_idx: int) -> int:
+        return coin_idx * len(self.quotes) + quote_idx
+
+    def quote_idx(self, quote: str) -> Optional[int]:
+        return self._quote_ids.get(quote)
+
+    def symbol(self, coin_idx: int, quote_idx: int) -> str:
+        return self.coins[coin_idx] + self.quotes[quote_idx]
+
+    def update(self, symbol: str, price: float, timestamp: float) -> bool:
+        """
+        :return: False if the symbol has no slot
+        """
+        slot = self.slots.get(symbol)
+        if slot is None:
+            return False
+        self.prices[slot] = price
+        self.updated[slot] = timestamp
+        return True
+
+    def get(self, coin_idx: int, quote_idx: int) -> Optional[float]:
+        price = self.prices[coin_idx * len(self.quotes) + quote_idx]
+        return None if math.isnan(price) else price
+
+    def get_symbol(self, symbol: str) -> Optional[float]:
+        slot = self.slots.get(symbol)
+        if slot is None or math.isnan(self.prices[slot]):
+            return None
+        return self.prices[slot]
+
+    def updated_at(self, coin_idx: int, quote_idx: int) -> float:
+        """
+        :return: time of the last update of the price, 0 if it has never been updated
+        """
+        return self.updated[coin_idx * len(self.quotes) + quote_idx]
+
+    def with_coins(self, coins: List[str]) -> "TickerPrices":
+        """
+        Copy of the prices with another coin axis, prices of the symbols present in both are kept
+        """
+        ticker_prices = TickerPrices(coins, self.quotes)
+        for symbol, slot in self.slots.items():
+            new_slot = ticker_prices.slots.get(symbol)
+            if new_slot is not None:
+                ticker_prices.prices[new_slot] = self.prices[slot]
+                ticker_prices.updated[new_slot] = self.updated[slot]
+        return ticker_prices
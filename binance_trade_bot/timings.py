@@ -0,0 +1,147 @@
+import math
+import time
+from array import array
+from functools import wraps
+from typing import Dict, Optional, Tuple
+
+from .logger import Logger
+
+# sub-buckets of a power of two range of durations, values are kept within 1 / 2 ** (SUB_BUCKET_BITS - 1)
+SUB_BUCKET_BITS = 5
+HALF_SUB_BUCKETS = 1 << (SUB_BUCKET_BITS - 1)
+# durations up to 2 ** 41 ns, about 36 minutes, longer ones are counted in the last bucket
+MAX_BUCKET = ((40 - SUB_BUCKET_BITS + 1) * HALF_SUB_BUCKETS) + HALF_SUB_BUCKETS * 2 - 1
+
+
+def bucket_of(value: int) -> int:
+    """
+    Log-linear bucket of a duration in ns, exact below 2 ** SUB_BUCKET_BITS ns
+    """
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    if shift <= 0:
+        return value
+    return min(shift * HALF_SUB_BUCKETS + (value >> shift), MAX_BUCKET)
+
+
+def bucket_upper_bound(bucket: int) -> int:
+    """
+    Highest duration in ns counted in the bucket
+    """
+    if bucket < 2 * HALF_SUB_BUCKETS:
+        return bucket
+    shift, sub_bucket = divmod(bucket, HALF_SUB_BUCKETS)
+    shift -= 1
+    return ((HALF_SUB_BUCKETS + sub_bucket + 1) << shift) - 1
+
+
+class TimingHistogram:
+    """
+    Durations in HDR histogram style buckets: every power of two range is split into linear sub-buckets, so a
+    record is a bit_length and an increment and percentiles are read with a relative error below 1 / 16
+    """
+
+    __slots__ = ("counts", "count", "max")
+
+    def __init__(self):
+        self.counts = array("Q", [0]) * (MAX_BUCKET + 1)
+        self.count = 0
+        self.max = 0
+
+    def record(self, duration_ns: int):
+        self.counts[bucket_of(duration_ns)] += 1
+        self.count += 1
+        if duration_ns > self.max:
+            self.max = duration_ns
+
+    def percentile(self, quantile: float) -> Optional[int]:
+        """
+        :return: highest duration in ns of the bucket holding the quantile, None if nothing was recorded
+        """
+        if self.count == 0:
+            return None
+        rank = max(1, math.ceil(quantile * self.count))
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_upper_bound(bucket), self.max)
+        return self.max
+
+
+class PhaseTimings:
+    """
+    Duration histograms of the phases of a scout tick, see timed
+
+    Recording is off until enabled is set. A disabled timed call still pays for its wrapper call and one branch, the
+    decorator cannot hand back the bare function since enabled is toggled at runtime.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.histograms: Dict[str, TimingHistogram] = {}
+        self.since = time.monotonic()
+
+    def record(self, phase: str, duration_ns: int):
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            histogram = self.histograms[phase] = TimingHistogram()
+        histogram.record(duration_ns)
+
+    def get_stats(self) -> Dict[str, Tuple[int, float, float, float]]:
+        """
+        :return: (count, 50th percentile, 99th percentile, max) of the durations in seconds per phase since the last
+            reset
+        """
+        return {
+            phase: (
+                histogram.count,
+                histogram.percentile(0.5) / 1e9,
+                histogram.percentile(0.99) / 1e9,
+                histogram.max / 1e9,
+            )
+            for phase, histogram in sorted(self.histograms.items())
+            if histogram.count
+        }
+
+    def reset(self):
+        self.histograms = {}
+        self.since = time.monotonic()
+
+    def log_stats(self, logger: Logger, reset=True):
+        """
+        Log the percentiles of every phase, then start a new period if reset
+        """
+        stats = self.get_stats()
+        period = time.monotonic() - self.since
+        if reset:
+            self.reset()
+        for phase, (count, p50, p99, max_duration) in stats.items():
+            logger.info(
+                f"Phase {phase} over {period:.0f}s: {count} calls, p50 {p50 * 1000:.3f}ms, p99 {p99 * 1000:.3f}ms, "
+                f"max {max_duration * 1000:.3f}ms",
+                notification=False,
+            )
+
+
+phase_timings = PhaseTimings()
+
+
+def timed(phase: str):
+    """
+    Record the duration of every call of the decorated function into the phase histogram of phase_timings
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrap(*args, **kwargs):
+            if not phase_timings.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                phase_timings.record(phase, time.perf_counter_ns() - start)
+
+        return wrap
+
+    return decorator
@@ -0,0 +1,21 @@
+import sys
+
+from binance_trade_bot import replay
+
+if __name__ == "__main__":
+    history = []
+    directory = sys.argv[1] if len(sys.argv) > 1 else "data/recordings"
+    speed = float(sys.argv[2]) if len(sys.argv) > 2 else None
+    for manager in replay(directory, speed):
+        bridge_value = manager.get_currency_balance(manager.config.BRIDGE.symbol)
+        for coin, balance in manager.balances.items():
+            if coin != manager.config.BRIDGE.symbol and balance > 0:
+                _, quote = manager.get_market_sell_price(coin + manager.config.BRIDGE.symbol, balance)
+                bridge_value += quote or 0.0
+        history.append(bridge_value)
+        bridge_diff = round((bridge_value - history[0]) / history[0] * 100, 3)
+        print("------")
+        print("TIME:", manager.datetime)
+        print("BALANCES:", manager.balances)
+        print(f"{manager.config.BRIDGE.symbol} VALUE:", bridge_value, f"({bridge_diff}%)")
+        print("------")
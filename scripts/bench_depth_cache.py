@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark of order book trimming.
+
+Feeds the same synthetic stream of depth diffs into the previous SortedDict implementation (full rebuild on
+overflow), the current SortedDict implementation (in-place trim) and the array backed ladder, and reports
+time per level update, how many updates allocated memory, how much they allocated in total and the largest
+allocation spike of a single update (which is the trim on overflow for the rebuilding implementation).
+
+Allocation counters are taken on the first 5000 diffs only, since tracing is slow.
+Run from the repository root (needs Python 3.9+ for tracemalloc.reset_peak): python scripts/bench_depth_cache.py
+"""
+# pylint: skip-file
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sortedcontainers import SortedDict  # noqa: E402
+
+from binance_trade_bot.binance_stream_manager import ArrayDepthCache, DepthCache  # noqa: E402
+
+
+class RebuildingDepthCache(DepthCache):
+    """DepthCache trimming as it was before, kept here as the baseline"""
+
+    def add_bid(self, bid):
+        price = float(bid[0])
+        amount = self.bids[price] = float(bid[1])
+        if amount == 0:
+            del self.bids[price]
+        elif len(self.bids) >= self.max_size:
+            self.bids = SortedDict({k: self.bids[k] for k in self.bids.keys()[-self.keep_limit :]})
+
+    def add_ask(self, ask):
+        price = float(ask[0])
+        amount = self.asks[price] = float(ask[1])
+        if amount == 0:
+            del self.asks[price]
+        elif len(self.asks) >= self.max_size:
+            self.asks = SortedDict({k: self.asks[k] for k in self.asks.keys()[: self.keep_limit]})
+
+
+def synthetic_diffs(count: int, levels_per_diff=20, seed=42):
+    """Volatile random walk of the mid price, so new levels keep appearing on both ends of the book"""
+    rnd = random.Random(seed)
+    mid = 1000.0
+    diffs = []
+    for _ in range(count):
+        mid = max(1.0, mid + rnd.gauss(0, 2.0))
+        bids = [[f"{mid - rnd.randint(1, 600) / 100:.2f}", f"{rnd.choice([0.0, rnd.random() * 10]):.4f}"]]
+        asks = [[f"{mid + rnd.randint(1, 600) / 100:.2f}", f"{rnd.choice([0.0, rnd.random() * 10]):.4f}"]]
+        for _ in range(levels_per_diff - 1):
+            bids.append([f"{mid - rnd.randint(1, 600) / 100:.2f}", f"{rnd.random() * 10:.4f}"])
+            asks.append([f"{mid + rnd.randint(1, 600) / 100:.2f}", f"{rnd.random() * 10:.4f}"])
+        diffs.append((bids, asks))
+    return diffs
+
+
+def run(cache, diffs):
+    for bids, asks in diffs:
+        for bid in bids:
+            cache.add_bid(bid)
+        for ask in asks:
+            cache.add_ask(ask)
+
+
+def run_traced(cache, diffs):
+    """
+    :return: (number of updates that allocated memory, total bytes allocated, largest single allocation spike)
+    """
+    allocating_updates = total = largest = 0
+    for bids, asks in diffs:
+        for method, levels in ((cache.add_bid, bids), (cache.add_ask, asks)):
+            for level in levels:
+                before, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                method(level)
+                _, peak = tracemalloc.get_traced_memory()
+                spike = peak - before
+                if spike > 0:
+                    allocating_updates += 1
+                    total += spike
+                    largest = max(largest, spike)
+    return allocating_updates, total, largest
+
+
+def bench(name, factory, diffs, repeat=3, traced_diffs=5_000):
+    updates = sum(len(bids) + len(asks) for bids, asks in diffs)
+
+    elapsed = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        cache = factory()
+        started = time.perf_counter()
+        run(cache, diffs)
+        elapsed = min(elapsed, time.perf_counter() - started)
+
+    gc.collect()
+    cache = factory()
+    tracemalloc.start()
+    allocating_updates, total, largest = run_traced(cache, diffs[:traced_diffs])
+    tracemalloc.stop()
+
+    print(
+        f"{name:<26} {elapsed / updates * 1e9:>7.0f} ns/update {allocating_updates:>8} allocating updates "
+        f"{total / 1024:>10.0f} KiB allocated {largest / 1024:>8.1f} KiB largest spike"
+    )
+
+
+def main():
+    diffs = synthetic_diffs(20_000)
+    for keep_limit, max_size in ((200, 400), (100, 120)):
+        print(f"keep_limit={keep_limit} max_size={max_size}")
+        bench("sorted, rebuild (before)", lambda: RebuildingDepthCache(keep_limit, max_size), diffs)
+        bench("sorted, in-place trim", lambda: DepthCache(keep_limit, max_size), diffs)
+        bench("array ladder", lambda: ArrayDepthCache(keep_limit, max_size), diffs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Throughput of handing stream messages from a websocket thread to the stream loop.
+
+A producer thread pushes raw depth payloads of bench_stream_parsing.py as fast as it can, the DepthListener
+parses and applies them, and the time until the last diff is applied is measured. Compared are the former
+handoff (one run_coroutine_threadsafe(queue.put) per message) and AsyncListenerContext.add_stream_data
+(a deque drained by one loop callback per wakeup), each on the asyncio and the uvloop event loop.
+
+Run from the repository root: python scripts/bench_stream_handoff.py
+"""
+# pylint: skip-file
+import asyncio
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_stream_parsing import depth_payloads  # noqa: E402
+
+from binance_trade_bot.binance_stream_manager import (  # noqa: E402
+    BUFFER_NAME_DEPTH,
+    ArrayDepthCache,
+    AsyncListenerContext,
+    BinanceCache,
+    DepthCacheManager,
+    DepthListener,
+    run_in_event_loop,
+    uvloop,
+)
+from binance_trade_bot.stream_parser import parse_depth_update  # noqa: E402
+
+
+class CoroutineHandoffContext(AsyncListenerContext):
+    def add_stream_data(self, stream_data, stream_buffer_name=False):
+        asyncio.run_coroutine_threadsafe(self.queues[stream_buffer_name].put(stream_data), self.loop)
+
+
+async def feed(context_type, payloads):
+    dcm = DepthCacheManager("XLMUSDT", None, None, depth_cache_factory=ArrayDepthCache)
+    dcm.last_update_id = 0
+    context = context_type([BUFFER_NAME_DEPTH], BinanceCache(), None, None, {"XLMUSDT": dcm})
+    listener = asyncio.create_task(DepthListener(context, {"XLMUSDT": dcm}, parse_depth_update).run_loop())
+
+    def produce():
+        for payload in payloads:
+            context.add_stream_data(payload, BUFFER_NAME_DEPTH)
+
+    started = time.perf_counter()
+    producer = threading.Thread(target=produce)
+    producer.start()
+    while dcm.last_update_id < len(payloads):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    producer.join()
+    listener.cancel()
+    return elapsed
+
+
+def rate(context_type, event_loop, payloads, repeat=3):
+    elapsed = min(run_in_event_loop(feed(context_type, payloads), event_loop) for _ in range(repeat))
+    return len(payloads) / elapsed
+
+
+def main():
+    payloads = depth_payloads(50_000)
+    event_loops = ["asyncio"] + (["uvloop"] if uvloop is not None else [])
+    print(f"{'':<24}" + "".join(f"{event_loop:>14}" for event_loop in event_loops))
+    for name, context_type in (
+        ("run_coroutine_threadsafe", CoroutineHandoffContext),
+        ("deque handoff", AsyncListenerContext),
+    ):
+        rates = [rate(context_type, event_loop, payloads) for event_loop in event_loops]
+        print(f"{name:<24}" + "".join(f"{value:>10.0f} m/s" for value in rates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""
+Throughput of depth and miniTicker stream decoding on one core.
+
+Builds raw combined-stream payloads from the same synthetic diffs as bench_depth_cache.py and reports
+messages per second for decoding only and for decoding plus applying the diff with DepthCacheManager,
+once through UnicornFy (stream_parser = unicornfy) and once through stream_parser (stream_parser = raw).
+
+Run from the repository root: python scripts/bench_stream_parsing.py
+"""
+# pylint: skip-file
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_depth_cache import synthetic_diffs  # noqa: E402
+from unicorn_fy.unicorn_fy import UnicornFy  # noqa: E402
+
+from binance_trade_bot.binance_stream_manager import ArrayDepthCache, DepthCacheManager  # noqa: E402
+from binance_trade_bot.stream_parser import loads, parse_depth_update, parse_mini_ticker  # noqa: E402
+
+
+def depth_payloads(count: int):
+    payloads = []
+    for update_id, (bids, asks) in enumerate(synthetic_diffs(count), 1):
+        data = {
+            "e": "depthUpdate",
+            "E": update_id,
+            "s": "XLMUSDT",
+            "U": update_id,
+            "u": update_id,
+            "b": bids,
+            "a": asks,
+        }
+        payloads.append(json.dumps({"stream": "xlmusdt@depth@100ms", "data": data}))
+    return payloads
+
+
+def ticker_payloads(count: int):
+    data = {"e": "24hrMiniTicker", "E": 1, "s": "XLMUSDT", "o": "1.0", "h": "2.0", "l": "0.5", "v": "100", "q": "100"}
+    return [
+        json.dumps({"stream": "xlmusdt@miniTicker", "data": dict(data, c=f"{1 + idx / 1e4:.8f}")})
+        for idx in range(count)
+    ]
+
+
+def rate(func, payloads, repeat=3):
+    elapsed = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(payloads)
+        elapsed = min(elapsed, time.perf_counter() - started)
+    return len(payloads) / elapsed
+
+
+def decode(parser):
+    def run(payloads):
+        for payload in payloads:
+            parser(payload)
+
+    return run
+
+
+def decode_and_apply(parser):
+    def run(payloads):
+        dcm = DepthCacheManager("XLMUSDT", None, None, depth_cache_factory=ArrayDepthCache)
+        dcm.last_update_id = 0
+
+        async def feed():
+            for payload in payloads:
+                await dcm.process_data(parser(payload))
+
+        asyncio.run(feed())
+
+    return run
+
+
+def main():
+    depth = depth_payloads(20_000)
+    tickers = ticker_payloads(50_000)
+    unicorn_fy = UnicornFy.binance_com_websocket
+    print(f"json decoder: {loads.__module__}")
+    print(f"{'':<28} {'UnicornFy':>12} {'raw parser':>12}")
+    for name, payloads, unicorn_func, raw_func in (
+        ("depth, decode", depth, decode(unicorn_fy), decode(parse_depth_update)),
+        ("depth, decode + apply", depth, decode_and_apply(unicorn_fy), decode_and_apply(parse_depth_update)),
+        ("miniTicker, decode", tickers, decode(unicorn_fy), decode(parse_mini_ticker)),
+    ):
+        print(f"{name:<28} {rate(unicorn_func, payloads):>8.0f} m/s {rate(raw_func, payloads):>8.0f} m/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,16 @@
+import math
+import random
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import numpy as np
 import pytest
 
 from binance_trade_bot.auto_trader import AutoTrader
-from binance_trade_bot.ratios import CoinStub
+from binance_trade_bot.binance_stream_manager import MARKET_SELL, MARKET_SELL_FILL_QUOTE
+from binance_trade_bot.database import LogScout
+from binance_trade_bot.models import Coin, Pair
+from binance_trade_bot.ratios import CoinStub, RatiosManager
 from .common import do_user_config, initialize_database_and_mock_manager  # type: ignore
 
 
@@ -103,7 +112,7 @@ class TestAutoTrader:
         assert True  # this shit does nothing :/
 
     @pytest.mark.parametrize("coin_symbol", ['XLM', 'DOGE'])
-    def test_get_ratios(self, do_user_config, initialize_database_and_mock_manager, coin_symbol):
+    def test_get_ratio_diffs(self, do_user_config, initialize_database_and_mock_manager, coin_symbol):
         # test on run
         db, manager, logger, config = initialize_database_and_mock_manager
 
@@ -115,9 +124,9 @@ class TestAutoTrader:
         from_coin_price, from_coin_quote = manager.get_market_sell_price(
             from_coin.symbol + manager.config.BRIDGE.symbol, from_coin_amount
         )
-        ratio_dict, price_amounts = autotrader._get_ratios(from_coin, from_coin_price, from_coin_quote)
-        # print('\n_get_ratios:', ratio_dict, '\n', price_amounts)
-        assert True
+        buy_prices = autotrader._get_buy_prices(from_coin_quote)
+        ratio_diffs = autotrader._get_ratio_diffs(from_coin, from_coin_price, buy_prices)
+        assert len(ratio_diffs) == CoinStub.len_coins()
 
         ''' 
         # NOTE: i do not quite understand how target_ratio is calculated yet, revisit this area and fix it later
@@ -129,13 +138,14 @@ class TestAutoTrader:
         ## Initial values for assert. Sell price & ratio
         quote_amount = 10000
         coin_sell_price = autotrader.manager.get_ticker_price(from_coin.symbol + autotrader.config.BRIDGE.symbol)
-        ratio_dict, price_amounts = autotrader._get_ratios(from_coin, coin_sell_price, quote_amount)
+        buy_prices = autotrader._get_buy_prices(quote_amount)
+        ratio_diffs = autotrader._get_ratio_diffs(from_coin, coin_sell_price, buy_prices)
 
         ## Calculation (???) & asserts
         ratio = (autotrader.db.ratios_manager.get_from_coin(from_coin.idx))[to_coin.idx]  # 1 element from <coin> array
 
-        ratio_dict_to_coin = ratio_dict[(from_coin.idx, to_coin.idx)]  # 1 element from <coin> array
-        price_amounts_to_coin = price_amounts[to_coin.symbol]  # 1 element from <coin> array
+        ratio_dict_to_coin = ratio_diffs[to_coin.idx]  # 1 element from <coin> array
+        price_amounts_to_coin = buy_prices[to_coin.idx]  # 1 element from <coin> array
 
         optional_coin_buy_price, optional_coin_amount = autotrader.manager.get_market_buy_price(
             to_coin.symbol + autotrader.config.BRIDGE.symbol,
@@ -207,9 +217,10 @@ class TestAutoTrader:
                 pricer[coin.symbol] = current_coin_price
                 min_notional = autotrader.manager.get_min_notional(coin.symbol, autotrader.config.BRIDGE.symbol)
                 print('\n', coin, min_notional)
-                ratio_dict, _ = autotrader._get_ratios(coin, current_coin_price, bridge_balance)
-                print([v > 0.0 for v in ratio_dict.values()])
-                print(coin, current_coin_price, bridge_balance, ratio_dict)
+                buy_prices = autotrader._get_buy_prices(bridge_balance)
+                ratio_diffs = autotrader._get_ratio_diffs(coin, current_coin_price, buy_prices)
+                print([v > 0.0 for v in ratio_diffs])
+                print(coin, current_coin_price, bridge_balance, ratio_diffs)
 
         print(pricer)
 
@@ -221,3 +232,322 @@ class TestAutoTrader:
 
         autotrader.update_values()
         assert True
+
+
+@pytest.fixture
+def vector_trader():
+    """
+    Trader of 6 coins on fake prices and fees, ICX has no buy price and the XLM->ADA ratio isn't initialized
+    """
+    CoinStub.reset()
+    rng = random.Random(7)
+    symbols = ["ADA", "EOS", "ICX", "TRX", "XLM", "XMR"]
+    stubs = [CoinStub.create(symbol) for symbol in symbols]
+    coins = [Coin(symbol, True) for symbol in symbols]
+    pairs = [Pair(from_coin, to_coin, rng.uniform(0.5, 2.0)) for from_coin in coins for to_coin in coins]
+    for pair_id, pair in enumerate(pairs, 1):
+        pair.id = pair_id
+    ratios_manager = RatiosManager(pairs)
+    ratios_manager.set(4, 0, math.nan)
+    buy_prices = [(rng.uniform(0.5, 2.0), rng.uniform(1.0, 10.0)) for _ in symbols]
+    buy_prices[2] = (None, None)
+    fees = {(symbol, selling): rng.choice([0.001, 0.00075]) for symbol in symbols for selling in (True, False)}
+    ticker_prices = [rng.uniform(0.5, 2.0) for _ in symbols]
+    ticker_prices[3] = None
+    manager = SimpleNamespace(
+        get_fee=lambda symbol, bridge, selling: fees[(symbol, selling)],
+        get_fee_vector=lambda selling: np.array([fees[(symbol, selling)] for symbol in symbols]),
+        get_market_prices=lambda requests: buy_prices,
+        get_ticker_price_by_idx=lambda coin_idx, quote_idx: ticker_prices[coin_idx],
+        get_currency_balance=lambda symbol: 100.0 if symbol == "USDT" else 0.0,
+        get_min_notional=lambda symbol, bridge: 200.0 if symbol == "EOS" else 10.0,
+        buy_alt=MagicMock(),
+        set_resync_priorities=MagicMock(),
+        ticker_prices=ticker_prices,
+    )
+    scout_logs = []
+    db = SimpleNamespace(ratios_manager=ratios_manager, batch_log_scout=scout_logs.extend, set_current_coin=MagicMock())
+    db.commit_ratios = MagicMock()
+    config = SimpleNamespace(BRIDGE=Coin("USDT", False), SCOUT_MARGIN=0.8, SCOUT_MODE="schedule")
+    yield StubAutoTrader(manager, db, MagicMock(), config), stubs, scout_logs
+    CoinStub.reset()
+
+
+def scalar_ratios(trader, coin, coin_sell_price, quote_amount):
+    """
+    Per coin loop the ratio diffs of a coin were computed with before they were vectorized
+    """
+    ratio_dict, price_amounts, scout_logs = {}, {}, []
+    buy_prices = trader._get_buy_prices(quote_amount)
+    for to_idx, target_ratio in enumerate(trader.db.ratios_manager.get_from_coin(coin.idx)):
+        to_coin = CoinStub.get_by_idx(to_idx)
+        buy_price, buy_amount = buy_prices[to_idx]
+        if coin.idx == to_idx or buy_price is None:
+            continue
+        price_amounts[to_coin.symbol] = (buy_price, buy_amount)
+        from_fee = trader.manager.get_fee(coin.symbol, "USDT", True)
+        to_fee = trader.manager.get_fee(to_coin.symbol, "USDT", False)
+        transaction_fee = from_fee + to_fee - from_fee * to_fee
+        coin_opt_coin_ratio = coin_sell_price / buy_price
+        ratio = (1 - transaction_fee) * coin_opt_coin_ratio / target_ratio - 1 - trader.config.SCOUT_MARGIN / 100
+        ratio_dict[(coin.idx, to_idx)] = ratio
+        pair_id = trader.db.ratios_manager.get_pair_id(coin.idx, to_idx)
+        scout_logs.append(LogScout(pair_id, ratio, target_ratio, coin_sell_price, buy_price))
+    return ratio_dict, price_amounts, scout_logs
+
+
+def scalar_bridge_scout(trader):
+    """
+    Per coin loop bridge_scout was computed with before the ratio matrix
+    """
+    scout_logs = []
+    for coin in CoinStub.get_all():
+        coin_price = trader.manager.get_ticker_price_by_idx(coin.idx, 0)
+        if coin_price is None:
+            continue
+        ratio_dict, _, logs = scalar_ratios(trader, coin, coin_price, 100.0)
+        scout_logs.extend(logs)
+        if not any(v > 0 for v in ratio_dict.values()) and 100.0 > trader.manager.get_min_notional(coin.symbol, "USDT"):
+            return coin, scout_logs
+    return None, scout_logs
+
+
+def same_floats(first, second):
+    return len(first) == len(second) and all(
+        a == b or (math.isnan(a) and math.isnan(b)) for a, b in zip(first, second)
+    )
+
+
+class TestRatioDiffs:
+    @staticmethod
+    @pytest.mark.parametrize("coin_idx", range(6))
+    def test_same_as_scalar_loop(vector_trader, coin_idx):
+        trader, stubs, scout_logs = vector_trader
+        coin = stubs[coin_idx]
+        expected_ratios, expected_prices, expected_logs = scalar_ratios(trader, coin, 1.3, 100.0)
+
+        buy_prices = trader._get_buy_prices(100.0)
+        ratio_diffs = trader._get_ratio_diffs(coin, 1.3, buy_prices)
+        # NaN where the loop skipped a coin
+        expected_diffs = [expected_ratios.get((coin.idx, to_idx), math.nan) for to_idx in range(len(stubs))]
+        assert same_floats(ratio_diffs.tolist(), expected_diffs)
+        assert {stubs[to_idx].symbol: buy_prices[to_idx] for _, to_idx in expected_ratios} == expected_prices
+        assert [log.pair_id for log in scout_logs] == [log.pair_id for log in expected_logs]
+        for field in ("ratio_diff", "target_ratio", "coin_price", "optional_coin_price"):
+            values = [getattr(log, field) for log in scout_logs]
+            assert same_floats(values, [getattr(log, field) for log in expected_logs])
+
+    @staticmethod
+    def test_best_candidate(vector_trader):
+        trader, stubs, _ = vector_trader
+        for coin in stubs:
+            for sell_price in (0.5, 1.0, 2.0, 4.0):
+                ratio_dict, _, _ = scalar_ratios(trader, coin, sell_price, 100.0)
+                positive = {pair: ratio for pair, ratio in ratio_dict.items() if ratio > 0}
+                expected = max(positive, key=positive.get)[1] if positive else None
+                buy_prices = trader._get_buy_prices(100.0)
+                ratio_diffs = trader._get_ratio_diffs(coin, sell_price, buy_prices, enable_scout_log=False)
+                assert trader._best_candidate(ratio_diffs) == expected
+
+    @staticmethod
+    def test_best_candidate_ties_and_no_jump():
+        assert AutoTrader._best_candidate(np.array([math.nan, 0.5, -1.0, 0.5])) == 1
+        assert AutoTrader._best_candidate(np.array([math.nan, 0.0, -1.0])) is None
+
+    @staticmethod
+    def test_ratio_matrix_rows_same_as_single_rows(vector_trader):
+        trader, stubs, _ = vector_trader
+        buy_prices = trader._get_buy_prices(100.0)
+        from_idxs = np.array([4, 0, 2])
+        sell_prices = np.array([1.1, 0.7, 1.9])
+        matrix = trader._get_ratio_diff_matrix(from_idxs, sell_prices, buy_prices)
+        for row, (coin_idx, sell_price) in enumerate(zip(from_idxs, sell_prices)):
+            ratio_diffs = trader._get_ratio_diffs(stubs[coin_idx], sell_price, buy_prices, enable_scout_log=False)
+            assert same_floats(matrix[row].tolist(), ratio_diffs.tolist())
+
+    @staticmethod
+    @pytest.mark.parametrize("price_factor", [0.25, 0.5, 1.0, 2.0, 4.0])
+    def test_bridge_scout_same_as_scalar_loop(vector_trader, price_factor):
+        trader, _, scout_logs = vector_trader
+        ticker_prices = trader.manager.ticker_prices
+        ticker_prices[:] = [None if price is None else price * price_factor for price in ticker_prices]
+        # the first coin with a ratio row without any viable jump may be below min notional
+        ticker_prices[1] = ticker_prices[0]
+        expected_coin, expected_logs = scalar_bridge_scout(trader)
+
+        trader.bridge_scout()
+        assert [log.pair_id for log in scout_logs] == [log.pair_id for log in expected_logs]
+        assert same_floats([log.ratio_diff for log in scout_logs], [log.ratio_diff for log in expected_logs])
+        if expected_coin is None:
+            trader.manager.buy_alt.assert_not_called()
+        else:
+            expected_price = ticker_prices[expected_coin.idx]
+            trader.manager.buy_alt.assert_called_once_with(expected_coin.symbol, "USDT", expected_price)
+            trader.db.set_current_coin.assert_called_once_with(expected_coin.symbol)
+
+
+class TestJumpChainSearch:
+    @staticmethod
+    def test_best_chain_by_hop_limit():
+        ratio_diffs = np.full((4, 4), math.nan)
+        ratio_diffs[0, 1], ratio_diffs[0, 2] = 0.1, 0.05
+        ratio_diffs[1, 0], ratio_diffs[1, 3] = 0.5, -0.1
+        ratio_diffs[2, 3], ratio_diffs[3, 1] = 0.2, 0.01
+        assert AutoTrader._best_jump_chain(0, ratio_diffs, 0) == [0]
+        assert AutoTrader._best_jump_chain(0, ratio_diffs, 1) == [0, 1]
+        # the 1->0 jump back isn't taken
+        assert AutoTrader._best_jump_chain(0, ratio_diffs, 2) == [0, 2, 3]
+        assert AutoTrader._best_jump_chain(0, ratio_diffs, 3) == [0, 2, 3, 1]
+        assert AutoTrader._best_jump_chain(0, ratio_diffs, 10) == [0, 2, 3, 1]
+        assert AutoTrader._best_jump_chain(1, ratio_diffs, 3) == [1, 0, 2, 3]
+
+    @staticmethod
+    def test_single_hop_same_as_best_candidate(vector_trader):
+        trader, stubs, _ = vector_trader
+        buy_prices = trader._get_buy_prices(100.0)
+        for coin in stubs:
+            ratio_diffs = trader._get_ratio_diff_matrix(np.arange(6), np.full(6, 1.3), buy_prices)
+            chain = AutoTrader._best_jump_chain(coin.idx, ratio_diffs, 1)
+            best_idx = trader._best_candidate(ratio_diffs[coin.idx])
+            assert chain == [coin.idx] if best_idx is None else [coin.idx, best_idx]
+
+    @staticmethod
+    @pytest.mark.parametrize("coin_idx", range(6))
+    def test_search_over_one_price_batch(vector_trader, coin_idx):
+        trader, stubs, _ = vector_trader
+        trader.config.JUMP_SEARCH_HOPS = 4
+        coin = stubs[coin_idx]
+        buy_prices = trader._get_buy_prices(100.0)
+        # ICX can be sold but not bought
+        sell_prices = [(1.0, 100.0) if price is None else (price, amount) for price, amount in buy_prices]
+        expected_diffs = np.full((6, 6), math.nan)
+        for from_coin, (sell_price, _) in zip(stubs, sell_prices):
+            sell_price = 1.3 if from_coin is coin else sell_price
+            for (_, to_idx), ratio in scalar_ratios(trader, from_coin, sell_price, 100.0)[0].items():
+                expected_diffs[from_coin.idx, to_idx] = ratio
+        expected_chain = AutoTrader._best_jump_chain(coin_idx, expected_diffs, 4)
+        ratios_before = np.array(trader.db.ratios_manager.get_all())
+
+        def get_market_prices(requests):
+            side = requests[0][1]
+            if side == MARKET_SELL:
+                # selling what was bought of the coins passed through
+                return [(2.0, 2.0 * amount) for _, _, amount in requests]
+            return sell_prices if side == MARKET_SELL_FILL_QUOTE else buy_prices
+
+        trader.manager.get_market_prices = MagicMock(side_effect=get_market_prices)
+
+        jump_chain, last_coin, last_coin_buy_price = trader._search_jump_chain(coin, 1.3, 100.0)
+        assert jump_chain == [stubs[idx].symbol for idx in expected_chain]
+        assert last_coin is stubs[expected_chain[-1]]
+        assert last_coin_buy_price == (0.0 if len(expected_chain) == 1 else buy_prices[expected_chain[-1]][0])
+        # a buy and a sell price batch, then a batch selling the amounts bought of the coins passed through
+        assert trader.manager.get_market_prices.call_count == min(len(expected_chain), 3)
+        if len(expected_chain) > 2:
+            sell_back_requests = trader.manager.get_market_prices.call_args.args[0]
+            assert sell_back_requests == [
+                (stubs[idx].symbol + "USDT", MARKET_SELL, buy_prices[idx][1]) for idx in expected_chain[1:-1]
+            ]
+        ratios = np.array(trader.db.ratios_manager.get_all()).reshape(6, 6)
+        ratios_before = ratios_before.reshape(6, 6)
+        for mid_idx in expected_chain[1:-1]:
+            for from_idx, (sell_price, _) in enumerate(sell_prices):
+                if from_idx != mid_idx:
+                    assert ratios[from_idx, mid_idx] == sell_price / buy_prices[mid_idx][0]
+        if len(expected_chain) > 2:
+            last_idx, next_idx = expected_chain[-2:]
+            assert ratios[last_idx, next_idx] == max(ratios_before[last_idx, next_idx], 2.0 / buy_prices[next_idx][0])
+        untouched = [idx for idx in range(6) if idx not in expected_chain]
+        assert same_floats(ratios[:, untouched].ravel().tolist(), ratios_before[:, untouched].ravel().tolist())
+
+
+class TestUpdateTradeThreshold:
+    @staticmethod
+    @pytest.mark.parametrize("coin_idx", [0, 3, 5])
+    def test_column_from_one_price_batch(vector_trader, coin_idx):
+        trader, stubs, _ = vector_trader
+        sell_prices = [(1.0 + idx / 10, 100.0) for idx in range(5)]
+        trader.manager.get_market_prices = MagicMock(return_value=sell_prices)
+        ratios_before = np.array(trader.db.ratios_manager.get_all())
+
+        assert trader.update_trade_threshold(stubs[coin_idx], None, 2.0, 0, 100.0)
+        trader.manager.get_market_prices.assert_called_once()
+        requests = trader.manager.get_market_prices.call_args.args[0]
+        assert [symbol for symbol, _, _ in requests] == [stub.symbol + "USDT" for stub in stubs if stub.idx != coin_idx]
+        ratios = trader.db.ratios_manager.get_all()
+        other_idxs = [idx for idx in range(6) if idx != coin_idx]
+        assert ratios[other_idxs, coin_idx].tolist() == [price / 2.0 for price, _ in sell_prices]
+        assert ratios[coin_idx, coin_idx] == ratios_before[coin_idx, coin_idx]
+        assert same_floats(np.delete(ratios, coin_idx, 1).ravel(), np.delete(ratios_before, coin_idx, 1).ravel())
+
+    @staticmethod
+    def test_missing_price_reports_pair(vector_trader):
+        trader, stubs, _ = vector_trader
+        sell_prices = [(1.0, 100.0), (None, None), (1.0, 100.0), (None, None), (1.0, 100.0)]
+        trader.manager.get_market_prices = MagicMock(return_value=sell_prices)
+        column_before = np.array(trader.db.ratios_manager.get_to_coin(0))
+
+        assert not trader.update_trade_threshold(stubs[0], None, 2.0, 0, 100.0)
+        trader.logger.info.assert_called_once_with(
+            "Update for coin ICXUSDT can't be performed, not enough orders in order book "
+        )
+        assert same_floats(trader.db.ratios_manager.get_to_coin(0).tolist(), column_before.tolist())
+        assert trader.db.ratios_manager.get_dirty() == [(4, 0)]
+
+
+class TestScoutTriggerArming:
+    @staticmethod
+    @pytest.mark.parametrize("hops", [0, 3])
+    def test_required_growth_reaches_threshold(vector_trader, hops):
+        trader, stubs, _ = vector_trader
+        trader.config.SCOUT_MODE = "event"
+        trader.config.JUMP_SEARCH_HOPS = hops
+        trader.manager.arm_scout_trigger = MagicMock()
+        # a sell price without any positive ratio diff from ADA
+        buy_prices = trader._get_buy_prices(100.0)
+        coin_sell_price = 0.5 * np.nanmin(trader._get_ratio_diffs(stubs[0], 1.0, buy_prices, False) + 1)
+
+        trader._jump_to_best_coin(stubs[0], coin_sell_price, 100.0, 100.0 / coin_sell_price)
+        trader.manager.arm_scout_trigger.assert_called_once()
+        symbol, sell_price, quote_amount, candidates = trader.manager.arm_scout_trigger.call_args.args
+        assert (symbol, sell_price, quote_amount) == ("ADAUSDT", coin_sell_price, 100.0)
+        # ICX has no buy price and the XLM->ADA ratio isn't initialized, ADA is the current coin
+        assert list(candidates) == ["EOSUSDT", "TRXUSDT", "XLMUSDT", "XMRUSDT"]
+        for to_symbol, (buy_price, required_growth) in candidates.items():
+            to_coin = CoinStub.get_by_symbol(to_symbol[:-4])
+            assert buy_price == buy_prices[to_coin.idx][0]
+            grown_diffs = trader._get_ratio_diffs(stubs[0], coin_sell_price * required_growth, buy_prices, False)
+            assert grown_diffs[to_coin.idx] == pytest.approx(0.0, abs=1e-12)
+
+    @staticmethod
+    def test_not_armed_in_schedule_mode_or_on_jump(vector_trader):
+        trader, stubs, _ = vector_trader
+        trader.manager.arm_scout_trigger = MagicMock()
+        trader.config.JUMP_SEARCH_HOPS = 1
+        trader._jump_to_best_coin(stubs[0], 0.01, 100.0, 10_000.0)
+        trader.config.SCOUT_MODE = "event"
+        trader.transaction_through_bridge = MagicMock(return_value=SimpleNamespace(cumulative_filled_quantity=1.0))
+        trader.manager.sell_quantity = MagicMock(return_value=1.0)
+        trader.manager.buy_quantity = MagicMock(return_value=1.0)
+        trader._jump_to_best_coin(stubs[0], 100.0, 100.0, 1.0)
+        trader.transaction_through_bridge.assert_called_once()
+        trader.manager.arm_scout_trigger.assert_not_called()
+
+
+class TestUpdateCoins:
+    @staticmethod
+    def test_keeps_current_coin_and_initializes_new_pairs():
+        CoinStub.reset()
+        db = MagicMock()
+        db.get_current_coin.return_value = Coin("XLM")
+        db.set_coins.side_effect = lambda symbols: CoinStub.resize(sorted(symbols))
+        manager = MagicMock()
+        trader = StubAutoTrader(manager, db, MagicMock(), SimpleNamespace())
+        trader.initialize_trade_thresholds = MagicMock()
+
+        trader.update_coins(["EOS", "ADA"])
+        db.set_coins.assert_called_once_with(["EOS", "ADA", "XLM"])
+        trader.logger.warning.assert_called_once()
+        manager.update_coins.assert_called_once_with(["ADA", "EOS", "XLM"])
+        trader.initialize_trade_thresholds.assert_called_once()
+        CoinStub.reset()
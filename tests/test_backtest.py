@@ -59,14 +59,14 @@ def test_backtest2_on_run(infra, do_user_config, date_start, date_end, interval)
 
 
 class TestMockBinanceManager:  # pylint:disable=no-self-use
-    def test_set_reinit_trader_callback(self, do_user_config, dmlc):
-        def reinit():
+    def test_set_update_coins_callback(self, do_user_config, dmlc):
+        def update_coins(coins_list):
             return
 
         _, manager, *_ = dmlc
-        assert manager.reinit_trader_callback is None
-        manager.set_reinit_trader_callback(reinit)
-        assert manager.reinit_trader_callback is not None
+        assert manager.update_coins_callback is None
+        manager.set_update_coins_callback(update_coins)
+        assert manager.update_coins_callback is not None
 
     @pytest.mark.parametrize(
         "coins_list",
@@ -0,0 +1,122 @@
+import math
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from binance_trade_bot.binance_api_manager import BinanceAPIManager
+from binance_trade_bot.binance_stream_manager import BinanceCache
+from binance_trade_bot.models import Coin
+from binance_trade_bot.ratios import CoinStub
+from binance_trade_bot.ticker_prices import TickerPrices
+
+SYMBOLS = ["ADA", "BNB", "EOS", "XLM"]
+
+
+class OfflineBinanceManager(BinanceAPIManager):
+    def setup_websockets(self):
+        pass
+
+
+@pytest.fixture()
+def fee_manager():
+    CoinStub.reset()
+    for symbol in SYMBOLS:
+        CoinStub.create(symbol)
+    client = MagicMock()
+    client.get_trade_fee.return_value = [
+        {"symbol": symbol + "USDT", "takerCommission": "0.001"} for symbol in SYMBOLS if symbol != "EOS"
+    ]
+    client.get_bnb_burn_spot_margin.return_value = {"spotBNBBurn": True}
+    client.get_symbol_info.return_value = {"filters": [{"filterType": "LOT_SIZE", "stepSize": "0.10000000"}]}
+    client.get_symbol_ticker.return_value = []
+    balances = {"USDT": 100.0, "BNB": 0.0003, "ADA": 30.0, "XLM": 200000.0}
+    cache = BinanceCache(TickerPrices(SYMBOLS, ["USDT", "BTC", "BNB"]))
+    for symbol, price in [("ADAUSDT", 1.5), ("BNBUSDT", 300.0), ("EOSUSDT", 5.0), ("XLMUSDT", 0.4)]:
+        cache.ticker_prices.update(symbol, price, 1.0)
+    for symbol, price in [("ADABNB", 0.005), ("EOSBNB", 0.016), ("XLMBNB", 0.0013)]:
+        cache.ticker_prices.update(symbol, price, 1.0)
+    order_balance_manager = SimpleNamespace(get_currency_balance=lambda symbol, force=False: balances.get(symbol, 0.0))
+    config = SimpleNamespace(BINANCE_TLD="com", BRIDGE=Coin("USDT", False))
+    manager = OfflineBinanceManager(client, cache, config, MagicMock(), MagicMock(), order_balance_manager)
+    manager.get_fee = MagicMock(side_effect=manager.get_fee)
+    yield manager, balances
+    CoinStub.reset()
+
+
+def scalar_fees(manager, selling: bool):
+    fees = []
+    for symbol in SYMBOLS:
+        try:
+            fees.append(BinanceAPIManager.get_fee(manager, symbol, "USDT", selling))
+        except KeyError:
+            fees.append(math.nan)
+    return fees
+
+
+def computed_symbols(manager):
+    symbols = [call.args[0] for call in manager.get_fee.call_args_list]
+    manager.get_fee.reset_mock()
+    return symbols
+
+
+def assert_same_fees(fees, expected):
+    assert [None if math.isnan(fee) else fee for fee in fees] == [None if math.isnan(fee) else fee for fee in expected]
+
+
+@pytest.mark.parametrize("selling", [True, False])
+def test_fee_vector_same_as_get_fee(fee_manager, selling):
+    manager, _ = fee_manager
+    fees = manager.get_fee_vector(selling)
+    assert_same_fees(fees, scalar_fees(manager, selling))
+    # EOS has no trade fee
+    assert math.isnan(fees[2])
+    # selling the XLM balance needs more BNB than the balance for the discount
+    assert fees.tolist()[:2] + fees.tolist()[3:] == [0.00075, 0.00075, 0.001 if selling else 0.00075]
+
+
+def test_fee_vector_recomputes_changed_inputs_only(fee_manager):
+    manager, balances = fee_manager
+    manager.get_fee_vector(False)
+    assert computed_symbols(manager) == SYMBOLS
+
+    manager.get_fee_vector(False)
+    assert computed_symbols(manager) == []
+
+    # a BNB ticker and a bridge ticker updated
+    manager.cache.ticker_prices.update("XLMBNB", 0.01, 2.0)
+    manager.cache.ticker_prices.update("ADAUSDT", 1.6, 2.0)
+    assert_same_fees(manager.get_fee_vector(False), scalar_fees(manager, False))
+    assert computed_symbols(manager) == ["ADA", "XLM"]
+    assert manager.get_fee_vector(False)[3] == 0.001
+
+    # the bridge ticker doesn't change the amount sold
+    manager.get_fee_vector(True)
+    computed_symbols(manager)
+    manager.cache.ticker_prices.update("ADAUSDT", 1.7, 3.0)
+    manager.get_fee_vector(True)
+    assert computed_symbols(manager) == []
+
+    balances["BNB"] = 0.0
+    manager.cache.balances_changed()
+    assert_same_fees(manager.get_fee_vector(True), scalar_fees(manager, True))
+    assert computed_symbols(manager) == SYMBOLS
+    assert manager.get_fee_vector(True)[0] == 0.001
+
+
+def test_fee_vector_follows_fee_table_and_burn_flag(fee_manager):
+    manager, _ = fee_manager
+    manager.get_fee_vector(True)
+    computed_symbols(manager)
+
+    manager.get_using_bnb_for_fees = lambda: False
+    assert_same_fees(manager.get_fee_vector(True), scalar_fees(manager, True))
+    assert computed_symbols(manager) == SYMBOLS
+    # without BNB burn tickers don't matter
+    manager.cache.ticker_prices.update("ADABNB", 0.004, 2.0)
+    manager.get_fee_vector(True)
+    assert computed_symbols(manager) == []
+
+    manager.get_trade_fees = lambda: {symbol + "USDT": 0.002 for symbol in SYMBOLS}
+    assert manager.get_fee_vector(True).tolist() == [0.002] * len(SYMBOLS)
+    assert computed_symbols(manager) == SYMBOLS
@@ -0,0 +1,787 @@
+import asyncio
+import random
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import pytest
+
+from binance_trade_bot import binance_stream_manager
+from binance_trade_bot.binance_stream_manager import (
+    BUFFER_NAME_DEPTH,
+    BUFFER_NAME_MINITICKERS,
+    BUFFER_NAME_USERDATA,
+    MARKET_BUY,
+    MARKET_SELL,
+    MARKET_SELL_FILL_QUOTE,
+    ArrayDepthCache,
+    AsyncListenerContext,
+    AutoReplacingStream,
+    BinanceCache,
+    BinanceStreamManager,
+    DepthCache,
+    DepthCacheManager,
+    DepthLadder,
+    DepthListener,
+    DepthSnapshot,
+    LagStats,
+    ScoutTrigger,
+    StreamManagerWorker,
+    TickerListener,
+    new_event_loop,
+    run_in_event_loop,
+)
+
+
+def random_levels(count: int, seed: int):
+    rnd = random.Random(seed)
+    return [
+        (f"{rnd.randint(1, 500) / 100:.2f}", f"{rnd.choice([0, 0, rnd.randint(1, 1000) / 10]):.1f}")
+        for _ in range(count)
+    ]
+
+
+def walk_fill(levels, value: float, value_is_quote: bool):
+    """
+    Reference fill over (price, quantity) levels, best price first
+
+    :return: (filled base quantity, filled quote amount) or None if the levels are too shallow
+    """
+    quantity = quote = 0.0
+    for price, level_quantity in levels:
+        unfilled = value - (quote if value_is_quote else quantity)
+        fill = min(level_quantity, unfilled / price if value_is_quote else unfilled)
+        quantity += fill
+        quote += price * fill
+        if abs(value - (quote if value_is_quote else quantity)) <= 1e-9:
+            return quantity, quote
+    return None
+
+
+def walk_market_prices(depth_cache: DepthCache, amount: float):
+    """
+    Market prices of the three sides computed by walking the SortedDict levels of the depth cache
+    """
+    if amount == 0:
+        return [(0.0, 0.0)] * 3
+    sell_fill_quote = walk_fill(depth_cache.get_bids(), amount, True)
+    sell = walk_fill(depth_cache.get_bids(), amount, False)
+    buy = walk_fill(depth_cache.get_asks(), amount, True)
+    return [
+        (amount / sell_fill_quote[0], sell_fill_quote[0]) if sell_fill_quote else (None, None),
+        (sell[1] / amount, sell[1]) if sell else (None, None),
+        (amount / buy[0], buy[0]) if buy else (None, None),
+    ]
+
+
+class TestDepthLadder:
+    @staticmethod
+    def test_ascending_order():
+        ladder = DepthLadder(descending=False)
+        for price in (3.0, 1.0, 2.0):
+            ladder.update(price, price * 10)
+        assert list(ladder.items()) == [(1.0, 10.0), (2.0, 20.0), (3.0, 30.0)]
+
+    @staticmethod
+    def test_descending_order():
+        ladder = DepthLadder(descending=True)
+        for price in (3.0, 1.0, 2.0):
+            ladder.update(price, price * 10)
+        assert list(ladder.items()) == [(3.0, 30.0), (2.0, 20.0), (1.0, 10.0)]
+
+    @staticmethod
+    def test_update_and_remove():
+        ladder = DepthLadder(descending=False)
+        ladder.update(1.0, 5.0)
+        ladder.update(1.0, 7.0)
+        assert list(ladder.items()) == [(1.0, 7.0)]
+        ladder.update(1.0, 0.0)
+        ladder.update(2.0, 0.0)
+        assert len(ladder) == 0
+
+    @staticmethod
+    def test_truncate_keeps_best_levels():
+        ladder = DepthLadder(descending=True)
+        for price in range(10):
+            ladder.update(float(price), 1.0)
+        ladder.truncate(3)
+        assert [price for price, _ in ladder.items()] == [9.0, 8.0, 7.0]
+
+
+class TestArrayDepthCache:
+    @staticmethod
+    @pytest.mark.parametrize("seed", [1, 2, 3])
+    def test_same_as_sorted_depth_cache(seed: int):
+        sorted_cache = DepthCache(keep_limit=20, max_size=40)
+        array_cache = ArrayDepthCache(keep_limit=20, max_size=40)
+        for bid, ask in zip(random_levels(2000, seed), random_levels(2000, seed + 100)):
+            for cache in (sorted_cache, array_cache):
+                cache.add_bid(bid)
+                cache.add_ask(ask)
+        assert list(array_cache.get_bids()) == list(sorted_cache.get_bids())
+        assert list(array_cache.get_asks()) == list(sorted_cache.get_asks())
+
+    @staticmethod
+    def test_clear():
+        cache = ArrayDepthCache()
+        cache.add_bid(["1.0", "2.0"])
+        cache.add_ask(["1.1", "2.0"])
+        cache.clear()
+        assert not list(cache.get_bids())
+        assert not list(cache.get_asks())
+
+    @staticmethod
+    @pytest.mark.parametrize("seed", [4, 5, 6])
+    def test_fill_prices_same_as_level_walk(seed: int):
+        sorted_cache = DepthCache()
+        array_cache = ArrayDepthCache()
+        rnd = random.Random(seed)
+        for _ in range(50):
+            for bid, ask in zip(random_levels(20, rnd.random()), random_levels(20, rnd.random())):
+                for cache in (sorted_cache, array_cache):
+                    cache.add_bid(bid)
+                    cache.add_ask(ask)
+            for amount in (0.0, rnd.random() * 10, rnd.random() * 1000, 1e9):
+                expected = walk_market_prices(sorted_cache, amount)
+                for cache in (sorted_cache, array_cache):
+                    snapshot = DepthSnapshot(0, 0, *cache.snapshot_ladders())
+                    actual = [
+                        snapshot.get_market_sell_price_fill_quote(amount),
+                        snapshot.get_market_sell_price(amount),
+                        snapshot.get_market_buy_price(amount),
+                    ]
+                    for expected_price, actual_price in zip(expected, actual):
+                        if expected_price[0] is None:
+                            assert actual_price == (None, None)
+                        else:
+                            assert actual_price == pytest.approx(expected_price)
+
+
+class TestBinanceStreamManager:
+    @staticmethod
+    def test_batched_market_prices():
+        dcms = {symbol: DepthCacheManager(symbol, None, None) for symbol in ("XLMUSDT", "EOSUSDT")}
+        for idx, dcm in enumerate(dcms.values()):
+            dcm.apply_orders({"bids": [[1.0 + idx, 10.0], [0.5 + idx, 10.0]], "asks": [[2.0 + idx, 10.0]]})
+            dcm.publish_snapshot()
+        manager = BinanceStreamManager(None, SimpleNamespace(depth_cache_managers=dcms), None, None)
+        requests = [
+            ("XLMUSDT", MARKET_SELL, 15.0),
+            ("EOSUSDT", MARKET_SELL_FILL_QUOTE, 20.0),
+            ("EOSUSDT", MARKET_BUY, 30.0),
+            ("XLMUSDT", MARKET_BUY, 100.0),
+        ]
+        batched = manager.get_market_prices(requests)
+        single = [
+            manager.get_market_sell_price("XLMUSDT", 15.0),
+            manager.get_market_sell_price_fill_quote("EOSUSDT", 20.0),
+            manager.get_market_buy_price("EOSUSDT", 30.0),
+            manager.get_market_buy_price("XLMUSDT", 100.0),
+        ]
+        assert batched == single
+        assert batched[0] == (12.5 / 15.0, 12.5)
+        assert batched[3] == (None, None)
+        assert manager.get_price_memo_stats() == {"XLMUSDT": (2, 2), "EOSUSDT": (2, 2)}
+
+
+class TestDepthSnapshot:
+    @staticmethod
+    @pytest.mark.parametrize("depth_cache_factory", [DepthCache, ArrayDepthCache])
+    def test_published_snapshot_is_immutable(depth_cache_factory):
+        async def feed():
+            dcm = DepthCacheManager("XLMUSDT", None, None, depth_cache_factory=depth_cache_factory)
+            dcm.last_update_id = 10
+            await dcm.process_data(
+                {
+                    "first_update_id_in_event": 11,
+                    "final_update_id_in_event": 12,
+                    "bids": [["1.0", "10.0"], ["0.9", "10.0"]],
+                    "asks": [["1.1", "10.0"]],
+                }
+            )
+            first = dcm.snapshot
+            await dcm.process_data(
+                {
+                    "first_update_id_in_event": 13,
+                    "final_update_id_in_event": 13,
+                    "bids": [["1.0", "0.0"]],
+                    "asks": [["1.2", "5.0"]],
+                }
+            )
+            return first, dcm.snapshot, dcm.depth_cache
+
+        first, second, depth_cache = asyncio.run(feed())
+        assert first.last_update_id == 12
+        assert second.last_update_id == 13
+        assert second.is_newer_than(first.version)
+        assert not first.is_newer_than(second.version)
+        assert list(first.bids.items()) == [(1.0, 10.0), (0.9, 10.0)]
+        assert list(second.bids.items()) == list(depth_cache.get_bids())
+        assert first.get_market_sell_price(15.0) == (14.5 / 15.0, 14.5)
+        assert second.get_market_sell_price(15.0) == (None, None)
+        assert second.get_market_buy_price(11.0) == pytest.approx(walk_market_prices(depth_cache, 11.0)[2])
+
+
+class TestPriceMemo:
+    @staticmethod
+    def test_memo_invalidated_by_new_snapshot():
+        dcm = DepthCacheManager("XLMUSDT", None, None, depth_cache_factory=ArrayDepthCache)
+        dcm.apply_orders({"bids": [["1.0", "10.0"]], "asks": [["1.1", "10.0"]]})
+        dcm.publish_snapshot()
+        assert dcm.get_market_price(MARKET_SELL, 5.0) == (1.0, 5.0)
+        assert dcm.get_market_price(MARKET_SELL, 5.0) == (1.0, 5.0)
+        assert dcm.get_market_price(MARKET_BUY, 5.0) == pytest.approx((1.1, 5.0 / 1.1))
+        assert (dcm.price_memo_hits, dcm.price_memo_misses) == (1, 2)
+        dcm.apply_orders({"bids": [["1.0", "2.0"]], "asks": []})
+        assert dcm.get_market_price(MARKET_SELL, 5.0) == (1.0, 5.0)
+        dcm.publish_snapshot()
+        assert dcm.get_market_price(MARKET_SELL, 5.0) == (None, None)
+        assert (dcm.price_memo_hits, dcm.price_memo_misses) == (2, 3)
+
+
+def depth_event(first: int, final: int, bids, asks=()):
+    return {
+        "symbol": "XLMUSDT",
+        "first_update_id_in_event": first,
+        "final_update_id_in_event": final,
+        "bids": [list(bid) for bid in bids],
+        "asks": [list(ask) for ask in asks],
+    }
+
+
+class TestDiffCoalescing:
+    @staticmethod
+    def test_queued_diffs_applied_as_one_batch():
+        dcm = DepthCacheManager("XLMUSDT", None, None)
+        dcm.last_update_id = 10
+        events = [
+            depth_event(5, 10, [("9.0", "1.0")]),  # already in the book
+            depth_event(11, 12, [("1.0", "10.0"), ("0.9", "5.0")], [("1.1", "3.0")]),
+            depth_event(13, 15, [("1.0", "0.0"), ("0.8", "2.0")]),
+            depth_event(16, 16, [("0.9", "7.0")], [("1.1", "0.0"), ("1.2", "1.0")]),
+        ]
+        for event in events:
+            dcm.enqueue_data(event)
+        dcm.drain_data_queue()
+        assert dcm.last_update_id == 16
+        assert list(dcm.depth_cache.get_bids()) == [(0.9, 7.0), (0.8, 2.0)]
+        assert list(dcm.depth_cache.get_asks()) == [(1.2, 1.0)]
+        assert dcm.snapshot.last_update_id == 16
+        assert dcm.get_queue_stats() == (0, 4, 3.0)
+
+    @staticmethod
+    def test_gap_stops_the_batch():
+        class SnapshotClient:  # pylint: disable=too-few-public-methods
+            @staticmethod
+            async def get_order_book(symbol, limit):  # pylint: disable=unused-argument
+                return {"lastUpdateId": 19, "bids": [["0.5", "1.0"]], "asks": []}
+
+        async def feed():
+            dcm = DepthCacheManager("XLMUSDT", SnapshotClient(), MagicMock())
+            dcm.last_update_id = 10
+            dcm.enqueue_data(depth_event(11, 12, [("1.0", "10.0")]))
+            dcm.enqueue_data(depth_event(20, 21, [("1.0", "5.0")]))
+            dcm.drain_data_queue()
+            before_resync = (dcm.last_update_id, list(dcm.depth_cache.get_bids()), len(dcm.data_queue))
+            assert dcm.buffer_incoming_data()
+            while dcm.reinit_tasks:
+                await asyncio.gather(*dcm.reinit_tasks)
+            return dcm, before_resync
+
+        dcm, before_resync = asyncio.run(feed())
+        assert before_resync == (12, [(1.0, 10.0)], 1)
+        assert dcm.last_update_id == 21
+        assert list(dcm.depth_cache.get_bids()) == [(1.0, 5.0), (0.5, 1.0)]
+        assert not dcm.data_queue
+
+    @staticmethod
+    def test_listener_coalesces_backlog():
+        async def feed():
+            dcms = {symbol: DepthCacheManager(symbol, None, None) for symbol in ("XLMUSDT", "EOSUSDT")}
+            for dcm in dcms.values():
+                dcm.last_update_id = 0
+            context = AsyncListenerContext([BUFFER_NAME_DEPTH], BinanceCache(), None, None, dcms)
+            listener = DepthListener(context, dcms)
+            for update_id in range(1, 11):
+                for symbol in dcms:
+                    event = depth_event(update_id, update_id, [("1.0", str(update_id))])
+                    event["symbol"] = symbol
+                    context.queues[BUFFER_NAME_DEPTH].put_nowait(event)
+            task = asyncio.create_task(listener.run_loop())
+            await asyncio.sleep(0.01)
+            task.cancel()
+            return dcms
+
+        dcms = asyncio.run(feed())
+        for dcm in dcms.values():
+            assert list(dcm.depth_cache.get_bids()) == [(1.0, 10.0)]
+            assert (dcm.batches_applied, dcm.diffs_merged) == (1, 10)
+
+
+class SnapshotClient:  # pylint: disable=too-few-public-methods
+    @staticmethod
+    async def get_order_book(symbol, limit):  # pylint: disable=unused-argument
+        return {"lastUpdateId": 19, "bids": [["0.5", "1.0"]], "asks": []}
+
+
+def apply_event(dcm: DepthCacheManager, bids=(), asks=()):
+    event = depth_event(dcm.last_update_id + 1, dcm.last_update_id + 1, bids, asks)
+    event["symbol"] = dcm.symbol
+    dcm.enqueue_data(event)
+    dcm.drain_data_queue()
+
+
+@pytest.fixture()
+def scout_books():
+    """
+    Books of the current coin XLM and of the candidates EOS and ADA, and a trigger armed with their prices
+    """
+    dcms = {symbol: DepthCacheManager(symbol, None, None) for symbol in ("XLMUSDT", "EOSUSDT", "ADAUSDT", "TRXUSDT")}
+    for dcm in dcms.values():
+        dcm.last_update_id = 0
+    apply_event(dcms["XLMUSDT"], bids=[("1.0", "100.0")])
+    apply_event(dcms["EOSUSDT"], asks=[("2.0", "100.0")])
+    apply_event(dcms["ADAUSDT"], asks=[("0.5", "100.0")])
+    trigger = ScoutTrigger()
+    trigger.arm("XLMUSDT", 1.0, 10.0, {"EOSUSDT": (2.0, 1.05), "ADAUSDT": (0.5, 1.2)})
+    return dcms, trigger
+
+
+class TestScoutTrigger:
+    @staticmethod
+    def test_signals_once_a_ratio_grew_enough(scout_books):
+        dcms, trigger = scout_books
+        for symbol in ("XLMUSDT", "TRXUSDT"):
+            trigger.check(dcms[symbol])
+        assert not trigger.event.is_set()
+
+        # the EOS ask drops by 2.5%, the XLM bid has to rise by 2.4% more
+        apply_event(dcms["EOSUSDT"], asks=[("2.0", "0.0"), ("1.95", "100.0")])
+        trigger.check(dcms["EOSUSDT"])
+        assert not trigger.event.is_set()
+        apply_event(dcms["XLMUSDT"], bids=[("1.02", "100.0")])
+        trigger.check(dcms["XLMUSDT"])
+        assert not trigger.event.is_set()
+        apply_event(dcms["XLMUSDT"], bids=[("1.03", "100.0")])
+        trigger.check(dcms["XLMUSDT"])
+        assert trigger.event.is_set()
+        assert trigger.signals == 1
+
+    @staticmethod
+    def test_candidate_move_alone(scout_books):
+        dcms, trigger = scout_books
+        # the EOS ask drops by 4.8%, not enough, ADA's has to drop by 16.7%
+        apply_event(dcms["EOSUSDT"], asks=[("2.0", "0.0"), ("1.91", "100.0")])
+        apply_event(dcms["ADAUSDT"], asks=[("0.5", "0.0"), ("0.41", "100.0")])
+        trigger.check(dcms["EOSUSDT"])
+        assert not trigger.event.is_set()
+        trigger.check(dcms["ADAUSDT"])
+        assert trigger.event.is_set()
+
+    @staticmethod
+    def test_wait_consumes_the_signal(scout_books):
+        dcms, trigger = scout_books
+        assert not trigger.wait(0.01)
+        apply_event(dcms["EOSUSDT"], asks=[("2.0", "0.0"), ("1.8", "100.0")])
+        trigger.check(dcms["EOSUSDT"])
+        started = time.monotonic()
+        assert trigger.wait(1.0, debounce=0.02)
+        assert time.monotonic() - started >= 0.02
+        assert not trigger.event.is_set()
+        # disarmed until the next scout arms it again
+        trigger.check(dcms["EOSUSDT"])
+        assert not trigger.event.is_set()
+
+        trigger.arm("XLMUSDT", 1.0, 10.0, {"EOSUSDT": (2.0, 1.05)})
+        trigger.check(dcms["EOSUSDT"])
+        started = time.monotonic()
+        assert trigger.wait(1.0, min_interval=0.1)
+        assert time.monotonic() - started >= 0.05
+
+    @staticmethod
+    def test_check_leaves_price_memo_alone(scout_books):
+        dcms, trigger = scout_books
+        apply_event(dcms["EOSUSDT"], asks=[("2.0", "0.0"), ("1.8", "100.0")])
+        trigger.check(dcms["XLMUSDT"])
+        trigger.check(dcms["EOSUSDT"])
+        assert trigger.event.is_set()
+        for dcm in dcms.values():
+            assert (dcm.price_memo_hits, dcm.price_memo_misses) == (0, 0)
+            assert not dcm._price_memo[1]  # pylint: disable=protected-access
+
+    @staticmethod
+    def test_listener_checks_drained_books(scout_books):
+        dcms, trigger = scout_books
+
+        async def feed():
+            context = AsyncListenerContext([BUFFER_NAME_DEPTH], BinanceCache(), None, None, dcms)
+            context.scout_trigger = trigger
+            event = depth_event(2, 2, [], [("2.0", "0.0"), ("1.8", "100.0")])
+            event["symbol"] = "EOSUSDT"
+            context.queues[BUFFER_NAME_DEPTH].put_nowait(event)
+            task = asyncio.create_task(DepthListener(context, dcms).run_loop())
+            await asyncio.sleep(0.01)
+            task.cancel()
+
+        asyncio.run(feed())
+        assert trigger.event.is_set()
+
+
+class FakeWebSocketManager:
+    def __init__(self, started=True):
+        self.started = started
+        self.stream_list = {}
+        self.stopped = []
+        self.subscriptions = []
+
+    def create_stream(self, *args, **kwargs):  # pylint: disable=unused-argument
+        stream_id = uuid.uuid4()
+        self.stream_list[stream_id] = {"last_heartbeat": None}
+        if self.started:
+            asyncio.get_running_loop().call_later(0.05, self.stream_list[stream_id].update, {"last_heartbeat": 1.0})
+        return stream_id
+
+    def stop_stream(self, stream_id):
+        self.stopped.append(stream_id)
+
+    def subscribe_to_stream(self, stream_id, markets):
+        self.subscriptions.append(("subscribe", stream_id, markets))
+
+    def unsubscribe_from_stream(self, stream_id, markets):
+        self.subscriptions.append(("unsubscribe", stream_id, markets))
+
+
+class TestStreamHotSwap:
+    @staticmethod
+    def test_overlap_merges_events_of_both_connections():
+        dcm = DepthCacheManager("XLMUSDT", None, MagicMock())
+        dcm.last_update_id = 10
+        dcm.begin_stream_overlap()
+        # the new connection is ahead of the old one
+        dcm.enqueue_data(depth_event(13, 14, [("1.0", "3.0")]))
+        dcm.drain_data_queue()
+        assert dcm.last_update_id == 10
+        assert not dcm.buffer_incoming_data()
+        dcm.enqueue_data(depth_event(11, 12, [("1.0", "2.0")]))
+        dcm.enqueue_data(depth_event(13, 14, [("1.0", "3.0")]))
+        dcm.drain_data_queue()
+        dcm.end_stream_overlap()
+        assert dcm.last_update_id == 14
+        assert list(dcm.depth_cache.get_bids()) == [(1.0, 3.0)]
+        assert not dcm.held_data and not dcm.reinit_tasks
+
+    @staticmethod
+    def test_gap_after_overlap_resyncs_the_book():
+        async def feed():
+            dcm = DepthCacheManager("XLMUSDT", SnapshotClient(), MagicMock())
+            dcm.last_update_id = 10
+            dcm.begin_stream_overlap()
+            dcm.enqueue_data(depth_event(20, 21, [("1.0", "5.0")]))
+            dcm.drain_data_queue()
+            assert dcm.last_update_id == 10 and not dcm.reinit_tasks
+            dcm.end_stream_overlap()
+            assert dcm.buffer_incoming_data()
+            while dcm.reinit_tasks:
+                await asyncio.gather(*dcm.reinit_tasks)
+            return dcm
+
+        dcm = asyncio.run(feed())
+        assert dcm.last_update_id == 21
+        assert list(dcm.depth_cache.get_bids()) == [(1.0, 5.0), (0.5, 1.0)]
+
+    @staticmethod
+    def test_listener_keeps_books_through_hot_swap():
+        async def feed():
+            dcms = {symbol: DepthCacheManager(symbol, None, MagicMock()) for symbol in ("XLMUSDT", "EOSUSDT")}
+            for dcm in dcms.values():
+                dcm.last_update_id = 10
+            context = AsyncListenerContext([BUFFER_NAME_DEPTH], BinanceCache(), MagicMock(), None, dcms)
+            listener = DepthListener(context, dcms)
+            old_stream, new_stream = uuid.uuid4(), uuid.uuid4()
+            context.notify_stream_replace(old_stream, new_stream, hot_swap=True)
+            queue = context.queues[BUFFER_NAME_DEPTH]
+            queue.put_nowait({"type": "CONNECT", "stream_id": new_stream})
+            queue.put_nowait(depth_event(12, 12, [("1.0", "2.0")]))
+            queue.put_nowait(depth_event(11, 11, [("1.0", "1.0")]))
+            queue.put_nowait(depth_event(12, 12, [("1.0", "2.0")]))
+            queue.put_nowait({"type": "DISCONNECT", "stream_id": old_stream})
+            task = asyncio.create_task(listener.run_loop())
+            await asyncio.sleep(0.01)
+            task.cancel()
+            return context, dcms
+
+        context, dcms = asyncio.run(feed())
+        assert dcms["XLMUSDT"].last_update_id == 12
+        assert list(dcms["XLMUSDT"].depth_cache.get_bids()) == [(1.0, 2.0)]
+        for dcm in dcms.values():
+            assert dcm.stream_overlaps == 0 and not dcm.reinit_tasks and not dcm.buffer_incoming_data()
+        assert not any(context.replace_signals.values()) and not any(context.hot_swap_signals.values())
+
+    @staticmethod
+    def test_swap_stream_stops_old_stream_once_new_one_started():
+        async def swap():
+            bwam = FakeWebSocketManager()
+            context = AsyncListenerContext([BUFFER_NAME_DEPTH], BinanceCache(), MagicMock(), None, {})
+            stream = AutoReplacingStream(bwam, context, ["depth"], ["xlmusdt"], hot_swap=True)
+            old_stream = stream.last_stream_id
+            await stream.swap_stream()
+            return bwam, context, stream, old_stream
+
+        bwam, context, stream, old_stream = asyncio.run(swap())
+        assert bwam.stopped == [old_stream]
+        assert stream.last_stream_id != old_stream
+        assert context.hot_swap_signals == {"CONNECT": {stream.last_stream_id}, "DISCONNECT": {old_stream}}
+
+    @staticmethod
+    def test_swap_stream_keeps_old_stream_if_new_one_does_not_start():
+        async def swap():
+            bwam = FakeWebSocketManager(started=False)
+            context = AsyncListenerContext([BUFFER_NAME_DEPTH], BinanceCache(), MagicMock(), None, {})
+            stream = AutoReplacingStream(bwam, context, ["depth"], ["xlmusdt"], hot_swap=True)
+            stream.SWAP_START_TIMEOUT = 0.2
+            old_stream = stream.last_stream_id
+            await stream.swap_stream()
+            return bwam, context, stream, old_stream
+
+        bwam, context, stream, old_stream = asyncio.run(swap())
+        new_stream = bwam.stopped[0]
+        assert new_stream != old_stream and stream.last_stream_id == old_stream
+        # the disconnect of the stopped new stream is skipped, not the one of the old stream
+        assert context.replace_signals["DISCONNECT"] == {new_stream}
+        assert context.hot_swap_signals["DISCONNECT"] == {new_stream}
+
+
+class TestCoinListUpdate:
+    @staticmethod
+    def test_set_markets_changes_subscriptions():
+        async def update():
+            bwam = FakeWebSocketManager()
+            context = AsyncListenerContext([BUFFER_NAME_DEPTH], BinanceCache(), MagicMock(), None, {})
+            stream = AutoReplacingStream(bwam, context, ["depth"], ["eosusdt", "xlmusdt"])
+            stream.set_markets(["adausdt", "xlmusdt"])
+            return bwam, stream
+
+        bwam, stream = asyncio.run(update())
+        assert bwam.subscriptions == [
+            ("subscribe", stream.last_stream_id, ["adausdt"]),
+            ("unsubscribe", stream.last_stream_id, ["eosusdt"]),
+        ]
+        assert stream.markets == ["adausdt", "xlmusdt"]
+
+    @staticmethod
+    def test_markets_changed_during_swap_follow_the_new_stream():
+        async def swap():
+            bwam = FakeWebSocketManager()
+            context = AsyncListenerContext([BUFFER_NAME_DEPTH], BinanceCache(), MagicMock(), None, {})
+            stream = AutoReplacingStream(bwam, context, ["depth"], ["xlmusdt"], hot_swap=True)
+            old_stream = stream.last_stream_id
+            task = asyncio.create_task(stream.swap_stream())
+            await asyncio.sleep(0.01)
+            stream.set_markets(["adausdt", "xlmusdt"])
+            await task
+            return bwam, stream, old_stream
+
+        bwam, stream, old_stream = asyncio.run(swap())
+        assert bwam.subscriptions == [
+            ("subscribe", old_stream, ["adausdt"]),
+            ("subscribe", stream.last_stream_id, ["adausdt"]),
+        ]
+
+    @staticmethod
+    def make_worker(coins):
+        """
+        Worker with the streams and the books of the coins, without a connection
+        """
+        config = SimpleNamespace(
+            BRIDGE=SimpleNamespace(symbol="USDT"),
+            DEPTH_CACHE_TYPE="sorted",
+            get_depth_cache_limits=lambda symbol: (200, 400),
+        )
+        worker = StreamManagerWorker(BinanceCache(), config, MagicMock(), None)
+        worker.resync_scheduler = MagicMock()
+        dcms = {
+            symbol.upper(): worker.create_depth_cache_manager(symbol.upper()) for symbol in worker.depth_markets(coins)
+        }
+        worker.async_context = AsyncListenerContext([BUFFER_NAME_DEPTH], BinanceCache(), None, None, dcms)
+        worker.depth_listener = DepthListener(worker.async_context, dcms)
+        bwam = FakeWebSocketManager()
+        worker.ticker_stream = AutoReplacingStream(
+            bwam, worker.async_context, ["miniTicker"], worker.ticker_markets(coins)
+        )
+        worker.depth_stream = AutoReplacingStream(bwam, worker.async_context, ["depth"], worker.depth_markets(coins))
+        return worker, bwam
+
+    @staticmethod
+    def test_worker_updates_only_changed_books():
+        async def update():
+            worker, bwam = TestCoinListUpdate.make_worker(["XLM", "EOS"])
+            old_dcms = worker.async_context.depth_cache_managers
+            await worker.update_coins(["ADA", "XLM"])
+            # events of an unsubscribed market may still arrive
+            event = depth_event(1, 1, [("1.0", "1.0")])
+            event["symbol"] = "EOSUSDT"
+            await worker.depth_listener.handle_data(event)
+            return worker, bwam, old_dcms
+
+        worker, bwam, old_dcms = asyncio.run(update())
+        dcms = worker.async_context.depth_cache_managers
+        assert worker.depth_listener.depth_cache_managers is dcms
+        assert set(dcms) == {"ADAUSDT", "XLMUSDT"} and dcms["XLMUSDT"] is old_dcms["XLMUSDT"]
+        # the previous dict is left as it was for threads still reading it
+        assert set(old_dcms) == {"EOSUSDT", "XLMUSDT"}
+        assert dcms["ADAUSDT"].resync_scheduler is worker.resync_scheduler
+        worker.resync_scheduler.mark_synced.assert_called_once_with("EOSUSDT")
+        assert ("subscribe", worker.depth_stream.last_stream_id, ["adausdt"]) in bwam.subscriptions
+        assert ("unsubscribe", worker.depth_stream.last_stream_id, ["eosusdt"]) in bwam.subscriptions
+        assert "adabtc" in worker.ticker_stream.markets and "eosbtc" not in worker.ticker_stream.markets
+
+    @staticmethod
+    def test_readers_of_other_threads_survive_updates():
+        errors = []
+        done = threading.Event()
+
+        def read(manager: BinanceStreamManager):
+            while not done.is_set():
+                try:
+                    manager.get_price_memo_stats()
+                    manager.get_depth_queue_stats()
+                    manager.get_market_prices([("XLMUSDT", MARKET_SELL, 1.0)])
+                except Exception as e:  # pylint: disable=broad-except
+                    errors.append(e)
+
+        async def update():
+            worker, bwam = TestCoinListUpdate.make_worker(["XLM"])
+            manager = BinanceStreamManager(None, worker.async_context, bwam, worker)
+            reader = threading.Thread(target=read, args=(manager,))
+            reader.start()
+            coins = ["ADA", "BAT", "DOGE", "EOS", "TRX", "XLM"]
+            for idx in range(500):
+                await worker.update_coins(coins[idx % 5 :])
+                await asyncio.sleep(0)
+            done.set()
+            reader.join()
+
+        asyncio.run(update())
+        assert not errors
+
+
+class TestStreamBackpressure:
+    @staticmethod
+    def test_ticker_buffer_drops_oldest_data():
+        async def feed():
+            context = AsyncListenerContext([BUFFER_NAME_MINITICKERS], BinanceCache(), MagicMock(), None, {}, None, 2)
+            signal = {"type": "CONNECT", "stream_id": uuid.uuid4()}
+            context.queues[BUFFER_NAME_MINITICKERS].put_nowait(signal)
+            for price in ("1.0", "2.0", "3.0"):
+                context.put_stream_data(price, BUFFER_NAME_MINITICKERS)
+            queue = context.queues[BUFFER_NAME_MINITICKERS]
+            return context, [queue.get_nowait() for _ in range(queue.qsize())], signal
+
+        context, queued, signal = asyncio.run(feed())
+        assert queued == [signal, "3.0"]
+        assert context.dropped_messages == {BUFFER_NAME_MINITICKERS: 2}
+
+    @staticmethod
+    def test_depth_buffer_drops_and_resyncs():
+        async def feed():
+            dcm = DepthCacheManager("XLMUSDT", SnapshotClient(), MagicMock())
+            dcm.last_update_id = 10
+            context = AsyncListenerContext(
+                [BUFFER_NAME_DEPTH], BinanceCache(), MagicMock(), None, {"XLMUSDT": dcm}, None, 1
+            )
+            context.put_stream_data(depth_event(11, 11, [("1.0", "1.0")]), BUFFER_NAME_DEPTH)
+            context.put_stream_data(depth_event(12, 12, [("1.0", "2.0")]), BUFFER_NAME_DEPTH)
+            resyncing = dcm.buffer_incoming_data()
+            while dcm.reinit_tasks:
+                await asyncio.gather(*dcm.reinit_tasks)
+            return context, dcm, resyncing
+
+        context, dcm, resyncing = asyncio.run(feed())
+        assert resyncing
+        assert context.queues[BUFFER_NAME_DEPTH].qsize() == 1
+        assert context.dropped_messages == {BUFFER_NAME_DEPTH: 1}
+        assert dcm.last_update_id == 19
+
+    @staticmethod
+    def test_user_data_is_never_dropped():
+        async def feed():
+            logger = MagicMock()
+            context = AsyncListenerContext([BUFFER_NAME_USERDATA], BinanceCache(), logger, None, {}, None, 1)
+            for idx in range(3):
+                context.put_stream_data({"event_type": "balanceUpdate", "idx": idx}, BUFFER_NAME_USERDATA)
+            return context, logger
+
+        context, logger = asyncio.run(feed())
+        assert context.queues[BUFFER_NAME_USERDATA].qsize() == 3
+        assert context.dropped_messages == {BUFFER_NAME_USERDATA: 0}
+        logger.warning.assert_called_once()
+
+    @staticmethod
+    def test_lag_percentiles():
+        lag_stats = LagStats(size=100)
+        assert lag_stats.percentiles(0.5, 0.99) == (None, None)
+        for lag in range(1, 151):
+            lag_stats.add(float(lag))
+        # only the latest 100 lags are kept
+        assert lag_stats.percentiles(0.0, 0.5, 0.99, 1.0) == (51.0, 101.0, 150.0, 150.0)
+
+    @staticmethod
+    def test_listener_records_lag():
+        async def feed():
+            context = AsyncListenerContext([BUFFER_NAME_MINITICKERS], BinanceCache(), MagicMock(), None, {})
+            event_time = int((time.time() - 2.0) * 1000)
+            context.queues[BUFFER_NAME_MINITICKERS].put_nowait(
+                {
+                    "event_type": "24hrMiniTicker",
+                    "data": [{"symbol": "XLMUSDT", "event_time": event_time, "close_price": "0.41"}],
+                }
+            )
+            task = asyncio.create_task(TickerListener(context).run_loop())
+            await asyncio.sleep(0.01)
+            task.cancel()
+            return context
+
+        context = asyncio.run(feed())
+        lag_p50, lag_p99 = context.lag_stats[BUFFER_NAME_MINITICKERS].percentiles(0.5, 0.99)
+        assert 2.0 <= lag_p50 == lag_p99 < 3.0
+
+
+class TestStreamHandoff:
+    @staticmethod
+    def test_websocket_threads_keep_message_order():
+        async def feed():
+            context = AsyncListenerContext([BUFFER_NAME_DEPTH], BinanceCache(), MagicMock(), None, {})
+            stream_id = uuid.uuid4()
+            context.attach_stream_uuid_resolver(lambda _: BUFFER_NAME_DEPTH)
+
+            def produce():
+                context.add_signal_data({"type": "CONNECT", "stream_id": stream_id})
+                for idx in range(1000):
+                    context.add_stream_data(str(idx), BUFFER_NAME_DEPTH)
+                context.add_signal_data({"type": "DISCONNECT", "stream_id": stream_id})
+
+            producer = threading.Thread(target=produce)
+            producer.start()
+            queue = context.queues[BUFFER_NAME_DEPTH]
+            received = [await queue.get() for _ in range(1002)]
+            producer.join()
+            return received
+
+        received = asyncio.run(feed())
+        assert received[0]["type"] == "CONNECT" and received[-1]["type"] == "DISCONNECT"
+        assert received[1:-1] == [str(idx) for idx in range(1000)]
+
+    @staticmethod
+    def test_event_loop_selection(monkeypatch):
+        async def loop_type():
+            return type(asyncio.get_running_loop())
+
+        assert issubclass(run_in_event_loop(loop_type(), "asyncio"), asyncio.BaseEventLoop)
+        monkeypatch.setattr(binance_stream_manager, "uvloop", None)
+        with pytest.raises(ValueError):
+            new_event_loop("uvloop")
+        loop = new_event_loop("auto")
+        assert isinstance(loop, asyncio.BaseEventLoop)
+        loop.close()
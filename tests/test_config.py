@@ -85,3 +85,17 @@ def test_config_on_run(do_user_config_env):
         assert (
                 mustvalue == getvalue
         ), f"Config values and input values not compare for {ikey}, must be {mustvalue}, get {getvalue}"
+
+
+def test_config_depth_cache_limits(do_user_config_env, monkeypatch):
+    monkeypatch.setenv("DEPTH_KEEP_LIMIT", "50")
+    monkeypatch.setenv("DEPTH_MAX_SIZE", "100")
+    monkeypatch.setenv("DEPTH_CACHE_LIMITS", "btcusdt:10:20 DOGEUSDT:300:600")
+    config = Config()
+    assert config.get_depth_cache_limits("BTCUSDT") == (10, 20)
+    assert config.get_depth_cache_limits("DOGEUSDT") == (300, 600)
+    assert config.get_depth_cache_limits("XLMUSDT") == (50, 100)
+
+    monkeypatch.setenv("DEPTH_CACHE_LIMITS", "BTCUSDT:20:10")
+    with pytest.raises(ValueError):
+        Config()
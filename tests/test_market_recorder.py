@@ -0,0 +1,88 @@
+import json
+import os
+import uuid
+from unittest.mock import MagicMock
+
+from binance_trade_bot.market_recorder import (
+    KIND_JSON,
+    KIND_RAW,
+    KIND_SIGNAL,
+    MarketDataRecorder,
+    list_record_files,
+    read_records,
+    symbol_of,
+)
+
+RAW_DEPTH = json.dumps(
+    {
+        "stream": "xlmusdt@depth@100ms",
+        "data": {"e": "depthUpdate", "E": 1, "s": "XLMUSDT", "U": 1, "u": 2, "b": [["1.0", "2.0"]], "a": []},
+    }
+)
+UNICORN_DEPTH = {
+    "symbol": "EOSUSDT",
+    "first_update_id_in_event": 1,
+    "final_update_id_in_event": 2,
+    "bids": [["1.0", "2.0"]],
+    "asks": [],
+}
+
+
+def test_symbol_of():
+    assert symbol_of(RAW_DEPTH) == "XLMUSDT"
+    assert symbol_of(UNICORN_DEPTH) == "EOSUSDT"
+    assert symbol_of(json.dumps({"stream": "!miniTicker@arr", "data": []})) is None
+    assert symbol_of({"event_type": "balanceUpdate"}) is None
+
+
+def test_records_read_back(tmp_path):
+    recorder = MarketDataRecorder(str(tmp_path), MagicMock())
+    stream_id = uuid.uuid4()
+    recorder.record_signal({"type": "CONNECT", "stream_id": stream_id}, "de")
+    recorder.record_data(RAW_DEPTH, "de")
+    recorder.record_data(UNICORN_DEPTH, "de")
+    recorder.record_data(RAW_DEPTH, "de")
+    recorder.close()
+
+    files = list_record_files(str(tmp_path))
+    assert len(files) == 1
+    records = list(read_records(files[0]))
+    assert [(record.kind, record.buffer_name, record.symbol) for record in records] == [
+        (KIND_SIGNAL, "de", None),
+        (KIND_RAW, "de", "XLMUSDT"),
+        (KIND_JSON, "de", "EOSUSDT"),
+        (KIND_RAW, "de", "XLMUSDT"),
+    ]
+    assert records[0].decode() == {"type": "CONNECT", "stream_id": str(stream_id)}
+    assert records[1].decode() == RAW_DEPTH
+    assert records[2].decode() == UNICORN_DEPTH
+    assert all(a.timestamp <= b.timestamp for a, b in zip(records, records[1:]))
+    # strings are written once per file
+    with open(files[0], "rb") as file:
+        assert file.read().count(b"XLMUSDT") == 2 + 1
+
+
+def test_hourly_rotation(tmp_path):
+    recorder = MarketDataRecorder(str(tmp_path), MagicMock())
+    hour = 3600 * 450000
+    for timestamp in (hour + 10, hour + 3599, hour + 3600, hour + 7300):
+        recorder.pending.append((timestamp, KIND_RAW, "de", RAW_DEPTH))
+    recorder.close()
+    files = list_record_files(str(tmp_path))
+    assert [len(list(read_records(path))) for path in files] == [2, 1, 1]
+    assert [os.path.basename(path) for path in files] == [
+        "market-20210503-00.bin",
+        "market-20210503-01.bin",
+        "market-20210503-02.bin",
+    ]
+
+
+def test_truncated_record_is_skipped(tmp_path):
+    recorder = MarketDataRecorder(str(tmp_path), MagicMock())
+    recorder.record_data(RAW_DEPTH, "de")
+    recorder.record_data(RAW_DEPTH, "de")
+    recorder.close()
+    path = list_record_files(str(tmp_path))[0]
+    with open(path, "r+b") as file:
+        file.truncate(os.path.getsize(path) - 5)
+    assert len(list(read_records(path))) == 1
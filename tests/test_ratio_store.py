@@ -0,0 +1,179 @@
+import math
+import os
+import struct
+from unittest.mock import MagicMock
+
+import numpy as np
+import pytest
+
+from binance_trade_bot.config import Config
+from binance_trade_bot.database import Database
+from binance_trade_bot.models import Pair
+from binance_trade_bot.ratio_store import MAGIC, PairRatioWriter, RatioStore, ratio_store_path
+from binance_trade_bot.ratios import CoinStub
+
+from .common import do_user_config  # type: ignore  # pylint: disable=unused-import
+
+SYMBOLS = ["ADA", "EOS", "XLM"]
+
+
+@pytest.fixture()
+def database(tmp_path, do_user_config):  # pylint: disable=redefined-outer-name,unused-argument
+    CoinStub.reset()
+    db = Database(MagicMock(), Config(), f"sqlite:///{tmp_path}/crypto_trading.db")
+    db.create_database()
+    yield db
+    db.close()
+    CoinStub.reset()
+
+
+def reopen(db: Database, symbols):
+    db.close()
+    CoinStub.reset()
+    reopened = Database(db.logger, db.config, str(db.engine.url))
+    reopened.set_coins(symbols)
+    return reopened
+
+
+def pair_ratios(db: Database):
+    with db.db_session() as session:
+        return {(pair.from_coin_id, pair.to_coin_id): pair.ratio for pair in session.query(Pair).all()}
+
+
+def test_ratio_store_path():
+    assert ratio_store_path("sqlite:///data/crypto_trading.db") == "data/crypto_trading.ratios"
+    assert ratio_store_path("sqlite:///") is None
+    assert ratio_store_path("sqlite:///:memory:") is None
+    assert ratio_store_path("postgresql://localhost/bot") is None
+
+
+def test_create_and_write(tmp_path):
+    path = str(tmp_path / "test.ratios")
+    ratios = np.array([[1.0, 2.0], [math.nan, 1.0]])
+    pair_ids = np.array([[0, 1], [2, 0]], dtype=np.uint64)
+    store = RatioStore.create(path, ["ADA", "XLM"], ratios, pair_ids, 2)
+    assert store.symbols == ["ADA", "XLM"]
+    assert not store.torn
+
+    store.write(np.array([[False, False], [True, False]]), np.array([[5.0, 5.0], [0.5, 5.0]]))
+    assert store.generation == 2
+    store.close()
+
+    store = RatioStore.open(path)
+    assert store.max_pair_id == 2
+    assert store.ratios.tolist() == [[1.0, 2.0], [0.5, 1.0]]
+    assert store.pair_ids.tolist() == [[0, 1], [2, 0]]
+    store.close()
+
+
+def test_open_invalid(tmp_path):
+    path = str(tmp_path / "test.ratios")
+    assert RatioStore.open(path) is None
+    with open(path, "wb") as file:
+        file.write(MAGIC)
+    assert RatioStore.open(path) is None
+
+    RatioStore.create(path, ["ADA", "XLM"], np.ones((2, 2)), np.zeros((2, 2), dtype=np.uint64), 0).close()
+    with open(path, "r+b") as file:
+        file.truncate(os.path.getsize(path) - 8)
+    assert RatioStore.open(path) is None
+
+
+def test_set_coins_loads_store(database):
+    database.set_coins(SYMBOLS)
+    assert database.ratio_store.symbols == SYMBOLS
+
+    ratios_manager = database.ratios_manager
+    ratios_manager.set(0, 2, 3.0)
+    ratios_manager.set(2, 0, 1 / 3)
+    database.commit_ratios()
+    database.pair_ratio_writer.flush()
+    assert pair_ratios(database)[("ADA", "XLM")] == 3.0
+
+    # the pairs table lags behind the store
+    ratios_manager.set(0, 2, 4.0)
+    database.pair_ratio_writer.submit = MagicMock()
+    database.commit_ratios()
+    assert pair_ratios(database)[("ADA", "XLM")] == 3.0
+
+    database = reopen(database, SYMBOLS)
+    assert database.ratios_manager.get(0, 2) == 4.0
+    assert math.isnan(database.ratios_manager.get(0, 1))
+    database.pair_ratio_writer.flush()
+    assert pair_ratios(database)[("ADA", "XLM")] == 4.0
+    database.close()
+
+
+def test_torn_store_is_rebuilt(database):
+    database.set_coins(SYMBOLS)
+    database.ratios_manager.set(0, 2, 3.0)
+    database.commit_ratios()
+    database.pair_ratio_writer.flush()
+    # a commit interrupted after writing the cell
+    struct.pack_into("<Q", database.ratio_store._buf, len(MAGIC), 3)
+    database.ratio_store.ratios[0, 2] = 5.0
+
+    database = reopen(database, SYMBOLS)
+    database.logger.warning.assert_called_once()
+    assert database.ratios_manager.get(0, 2) == 3.0
+    assert not database.ratio_store.torn
+    database.close()
+
+
+def test_changed_coins_rebuild_store(database):
+    database.set_coins(SYMBOLS)
+    database.ratios_manager.set(0, 2, 3.0)
+    database.commit_ratios()
+
+    database = reopen(database, SYMBOLS + ["DOGE"])
+    assert database.ratio_store.symbols == ["ADA", "DOGE", "EOS", "XLM"]
+    assert database.ratios_manager.get(0, 3) == 3.0
+
+    database.invalidate_ratio_store()
+    assert database.ratio_store is None
+    assert not os.path.exists(database.ratio_store_path)
+    database.close()
+
+
+def test_set_coins_resizes_in_place(database):
+    database.set_coins(SYMBOLS)
+    ratios_manager = database.ratios_manager
+    ratios_manager.set(0, 1, 2.0)
+    ratios_manager.set(0, 2, 3.0)
+    database.commit_ratios()
+    eos = CoinStub.get_by_symbol("EOS")
+
+    database.set_coins(["ADA", "DOGE", "XLM"])
+    assert database.ratios_manager is ratios_manager
+    assert CoinStub.get_by_symbol("EOS") is None and database.ratio_store.symbols == ["ADA", "DOGE", "XLM"]
+    assert ratios_manager.get(0, 2) == 3.0
+    # only the pairs of the added coin are new
+    assert np.isnan(ratios_manager.get_from_coin(1)[[0, 2]]).all()
+    assert np.isnan(ratios_manager.get_to_coin(1)[[0, 2]]).all()
+    assert (ratios_manager.get_all_pair_ids()[[0, 1, 1, 2], [1, 0, 2, 1]] != 0).all()
+    assert len(pair_ratios(database)) == 10
+
+    # the ratios of a coin enabled again are loaded from the pairs table
+    database.set_coins(SYMBOLS + ["DOGE"])
+    assert CoinStub.get_by_symbol("EOS") is not eos
+    assert ratios_manager.get(0, 2) == 2.0 and ratios_manager.get(0, 3) == 3.0
+    assert np.array_equal(database.ratio_store.ratios, ratios_manager.get_all(), equal_nan=True)
+
+
+def test_pair_ratio_writer_coalesces():
+    written = []
+    writer = PairRatioWriter(written.append, MagicMock(), flush_interval=60)
+    writer.submit([1, 2], [1.0, 2.0])
+    writer.submit([1], [1.5])
+    writer.flush()
+    assert written == [{1: 1.5, 2: 2.0}]
+
+    writer.write = MagicMock(side_effect=OSError)
+    writer.submit([3], [3.0])
+    with pytest.raises(OSError):
+        writer.flush()
+    writer.write = written.append
+    writer.submit([3], [3.5])
+    writer.close()
+    assert written[-1] == {3: 3.5}
+    assert not writer._thread.is_alive()
@@ -1,6 +1,7 @@
 import random
 from typing import List
 
+import numpy as np
 import pytest
 
 from binance_trade_bot.models import Coin, Pair
@@ -55,6 +56,18 @@ class TestCoinStubs:
         for coin in coins_stubs:
             assert repr(coin) == f"CoinStub({coin.idx}, {coin.symbol})"
 
+    @staticmethod
+    def test_resize(coins_stubs: List[CoinStub]):
+        xmr, eos, doge, _ = coins_stubs
+        old_idxs = CoinStub.resize(["ADA", "DOGE", "EOS", "XMR"])
+        assert old_idxs.tolist() == [-1, 2, 1, 0]
+        assert [coin.symbol for coin in CoinStub.get_all()] == ["ADA", "DOGE", "EOS", "XMR"]
+        # the stubs of the coins that stay are kept
+        assert CoinStub.get_by_symbol("DOGE") is doge and doge.idx == 1
+        assert CoinStub.get_by_idx(3) is xmr and eos.idx == 2
+        assert CoinStub.get_by_symbol("BTC") is None
+        assert CoinStub.get_by_symbol("ADA").idx == 0
+
 
 class TestRatioManager:
     @staticmethod
@@ -125,3 +138,71 @@ class TestRatioManager:
         col_last = manager.get_to_coin(n - 1)
         assert len(col_last) == n
         assert list(col_last) == [float(n * i + (n - 1)) for i in range(n)]
+
+    @staticmethod
+    def test_rows_and_columns_are_views(ratios: List[Pair]):
+        manager = RatiosManager(ratios)
+        row, col = manager.get_from_coin(1), manager.get_to_coin(2)
+        manager.set(1, 2, 42.0)
+        assert row[2] == 42.0
+        assert col[1] == 42.0
+        assert np.shares_memory(row, manager.get_all())
+        assert np.shares_memory(col, manager.get_all())
+
+    @staticmethod
+    def test_set_row_and_column(ratios: List[Pair]):
+        manager = RatiosManager(ratios)
+        before = manager.get_all().copy()
+        manager.set(0, 2, 34.0)
+        manager.set_column(2, [1.0, 2.0, 3.0], [0, 1, 3])
+        manager.set_row(3, np.arange(4.0))
+        manager.set_row(1, [5.0, 6.0], [0, 3])
+        assert list(manager.get_to_coin(2)) == [1.0, 2.0, 1.0, 2.0]
+        assert list(manager.get_from_coin(3)) == [0.0, 1.0, 2.0, 3.0]
+        assert list(manager.get_from_coin(1)) == [5.0, 1.0, 2.0, 6.0]
+        assert sorted(manager.get_dirty()) == [(0, 2), (1, 0), (1, 2), (1, 3), (3, 0), (3, 1), (3, 2), (3, 3)]
+
+        manager.rollback()
+        assert len(manager.get_dirty()) == 0
+        assert np.array_equal(manager.get_all(), before, equal_nan=True)
+
+    @staticmethod
+    def test_dirty_pairs(coins_stubs: List[CoinStub]):
+        coins = [Coin(stub.symbol, True) for stub in coins_stubs]
+        pairs = [Pair(coins[0], coins[1], 0.5), Pair(coins[2], coins[3], 2.0)]
+        for pair_id, pair in enumerate(pairs, 1):
+            pair.id = pair_id
+        manager = RatiosManager(pairs)
+        assert manager.get_pair_id(2, 3) == 2
+        manager.set(2, 3, 3.0)
+        manager.set_row(0, [0.7], [1])
+        assert manager.get_dirty_pairs() == ([1, 2], [0.7, 3.0])
+        manager.commit()
+        assert manager.get_dirty_pairs() == ([], [])
+        assert manager.get(0, 1) == 0.7
+
+    @staticmethod
+    def test_resize(coins_stubs: List[CoinStub]):
+        coins = {stub.symbol: Coin(stub.symbol, True) for stub in coins_stubs}
+        pairs = [Pair(coins["XMR"], coins["DOGE"], 0.5), Pair(coins["BTC"], coins["EOS"], 2.0)]
+        for pair_id, pair in enumerate(pairs, 1):
+            pair.id = pair_id
+        manager = RatiosManager(pairs)
+
+        manager.resize(CoinStub.resize(["ADA", "DOGE", "XMR"]))
+        assert manager.n == 3
+        assert manager.get(2, 1) == 0.5 and manager.get_pair_id(2, 1) == 1
+        assert np.isnan(manager.get(1, 2))
+        assert np.isnan(manager.get_from_coin(0)[1:]).all() and np.isnan(manager.get_to_coin(0)[1:]).all()
+        assert np.diag(manager.get_all()).tolist() == [1.0, 1.0, 1.0]
+
+        coins["ADA"] = Coin("ADA", True)
+        added = Pair(coins["ADA"], coins["XMR"], 3.0)
+        added.id = 3
+        manager.load_pairs([added])
+        assert manager.get(0, 2) == 3.0 and manager.get_pair_id(0, 2) == 3
+        assert manager.get_dirty_pairs() == ([], [])
+
+        manager.set(0, 1, 4.0)
+        with pytest.raises(AssertionError):
+            manager.resize(CoinStub.resize(["ADA"]))
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import time
+import uuid
+from unittest.mock import MagicMock
+
+import pytest
+
+from binance_trade_bot.binance_stream_manager import (
+    BUFFER_NAME_DEPTH,
+    BUFFER_NAME_MINITICKERS,
+    AsyncListenerContext,
+    BinanceCache,
+    DepthListener,
+    TickerListener,
+)
+from binance_trade_bot.config import Config
+from binance_trade_bot.market_recorder import (
+    KIND_JSON,
+    KIND_RAW,
+    KIND_SIGNAL,
+    KIND_SNAPSHOT,
+    SNAPSHOT_BUFFER_NAME,
+    MarketDataRecorder,
+    list_record_files,
+    read_records,
+)
+from binance_trade_bot.replay import ReplayBinanceManager, create_market_replay
+
+START = 1620000000.0
+
+
+@pytest.fixture()
+def replay_config(monkeypatch):
+    monkeypatch.setenv("API_KEY", "key")
+    monkeypatch.setenv("API_SECRET_KEY", "secret")
+    monkeypatch.setenv("SUPPORTED_COIN_LIST", "XLM EOS")
+    monkeypatch.setenv("BRIDGE_SYMBOL", "USDT")
+    monkeypatch.setenv("CURRENT_COIN_SYMBOL", "XLM")
+    return Config()
+
+
+def raw_depth(symbol: str, first: int, final: int, bids, asks):
+    data = {"e": "depthUpdate", "E": 1, "s": symbol, "U": first, "u": final, "b": bids, "a": asks}
+    return json.dumps({"stream": f"{symbol.lower()}@depth@100ms", "data": data})
+
+
+def raw_ticker(symbol: str, close_price: str):
+    data = {"e": "24hrMiniTicker", "E": 1, "s": symbol, "c": close_price}
+    return json.dumps({"stream": f"{symbol.lower()}@miniTicker", "data": data})
+
+
+def write_recording(directory: str):
+    recorder = MarketDataRecorder(directory, MagicMock())
+    connect = {"type": "CONNECT", "stream_id": uuid.uuid4()}
+    records = [
+        (KIND_SIGNAL, BUFFER_NAME_DEPTH, connect),
+        # arrives before the snapshot, so it is buffered until the book is resynced
+        (KIND_RAW, BUFFER_NAME_DEPTH, raw_depth("XLMUSDT", 9, 11, [["0.40", "5"]], [])),
+        (KIND_SNAPSHOT, SNAPSHOT_BUFFER_NAME, {"lastUpdateId": 10, "bids": [["0.41", "1"]], "asks": [["0.42", "1"]]}),
+        (KIND_SNAPSHOT, SNAPSHOT_BUFFER_NAME, {"lastUpdateId": 3, "bids": [["5.0", "2"]], "asks": [["5.1", "2"]]}),
+        (KIND_RAW, BUFFER_NAME_DEPTH, raw_depth("XLMUSDT", 12, 12, [["0.41", "0"]], [["0.43", "2"]])),
+        (
+            KIND_JSON,
+            BUFFER_NAME_MINITICKERS,
+            {"event_type": "24hrMiniTicker", "data": [{"symbol": "XLMUSDT", "close_price": "0.4"}]},
+        ),
+        (KIND_RAW, BUFFER_NAME_MINITICKERS, raw_ticker("EOSUSDT", "5.05")),
+    ]
+    symbols = [None, None, "XLMUSDT", "EOSUSDT", None, None, None]
+    for idx, ((kind, buffer_name, data), symbol) in enumerate(zip(records, symbols)):
+        if kind == KIND_SNAPSHOT:
+            data = dict(data, symbol=symbol)
+        recorder.pending.append((START + idx * 0.5, kind, buffer_name, data))
+    recorder.close()
+
+
+def run_replay(directory: str, config: Config, speed=None):
+    async def replay():
+        cache = BinanceCache()
+        market_replay = await create_market_replay(list_record_files(directory), cache, config, MagicMock(), speed)
+        await market_replay.run()
+        await market_replay.close()
+        return cache, market_replay
+
+    return asyncio.run(replay())
+
+
+def book(market_replay, symbol: str):
+    snapshot = market_replay.async_context.depth_cache_managers[symbol].snapshot
+    return snapshot.last_update_id, list(snapshot.bids.items()), list(snapshot.asks.items())
+
+
+def test_replay_resyncs_from_recorded_snapshots(tmp_path, replay_config):
+    write_recording(str(tmp_path))
+    cache, market_replay = run_replay(str(tmp_path), replay_config)
+
+    assert market_replay.finished
+    assert market_replay.records_replayed == 7
+    assert market_replay.clock == START + 3
+    assert book(market_replay, "XLMUSDT") == (12, [(0.40, 5.0)], [(0.42, 1.0), (0.43, 2.0)])
+    assert book(market_replay, "EOSUSDT") == (3, [(5.0, 2.0)], [(5.1, 2.0)])
+    assert cache.ticker_values == {"XLMUSDT": 0.4, "EOSUSDT": 5.05}
+
+
+def test_replay_is_deterministic(tmp_path, replay_config):
+    write_recording(str(tmp_path))
+    _, first = run_replay(str(tmp_path), replay_config)
+    _, second = run_replay(str(tmp_path), replay_config)
+    for symbol, dcm in first.async_context.depth_cache_managers.items():
+        assert book(first, symbol) == book(second, symbol)
+        assert dcm.snapshot.version == second.async_context.depth_cache_managers[symbol].snapshot.version
+
+
+def test_replay_at_scaled_speed(tmp_path, replay_config):
+    write_recording(str(tmp_path))
+    started = time.monotonic()
+    _, market_replay = run_replay(str(tmp_path), replay_config, speed=20.0)
+    # 3 recorded seconds at 20 times the recorded pace
+    assert time.monotonic() - started >= 0.15
+    assert book(market_replay, "XLMUSDT")[0] == 12
+
+
+def test_listeners_record_what_they_consume(tmp_path):
+    async def feed():
+        recorder = MarketDataRecorder(str(tmp_path), MagicMock())
+        context = AsyncListenerContext(
+            [BUFFER_NAME_DEPTH, BUFFER_NAME_MINITICKERS], BinanceCache(), MagicMock(), None, {}, recorder
+        )
+        listeners = [DepthListener(context, {}), TickerListener(context)]
+        old_stream, new_stream = uuid.uuid4(), uuid.uuid4()
+        context.notify_stream_replace(old_stream, new_stream)
+        context.queues[BUFFER_NAME_DEPTH].put_nowait({"type": "CONNECT", "stream_id": new_stream})
+        context.queues[BUFFER_NAME_DEPTH].put_nowait({"type": "DISCONNECT", "stream_id": old_stream})
+        context.queues[BUFFER_NAME_MINITICKERS].put_nowait(raw_ticker("XLMUSDT", "0.4"))
+        tasks = [asyncio.create_task(listener.run_loop()) for listener in listeners]
+        await asyncio.sleep(0.01)
+        for task in tasks:
+            task.cancel()
+        recorder.close()
+
+    asyncio.run(feed())
+    records = list(read_records(list_record_files(str(tmp_path))[0]))
+    # signals of replaced streams are skipped by the listeners, so they are not recorded either
+    assert [(record.kind, record.buffer_name) for record in records] == [(KIND_RAW, BUFFER_NAME_MINITICKERS)]
+
+
+def test_replay_manager_fills_against_books(tmp_path, replay_config):
+    write_recording(str(tmp_path))
+    cache, market_replay = run_replay(str(tmp_path), replay_config)
+    client = MagicMock()
+    client.get_symbol_info.return_value = {"filters": [{"filterType": "LOT_SIZE", "stepSize": "0.10000000"}]}
+    stream_manager = MagicMock()
+    stream_manager.get_market_sell_price = lambda symbol, amount: market_replay.async_context.depth_cache_managers[
+        symbol
+    ].snapshot.get_market_sell_price(amount)
+    stream_manager.get_market_buy_price = lambda symbol, quote: market_replay.async_context.depth_cache_managers[
+        symbol
+    ].snapshot.get_market_buy_price(quote)
+    manager = ReplayBinanceManager(
+        client, cache, replay_config, MagicMock(), MagicMock(), stream_manager, {"USDT": 0.84}
+    )
+
+    order = manager.buy_alt("XLM", "USDT", 0.0)
+    # the whole bridge balance walks 0.42 and 0.43 asks, not the 0.4 ticker price
+    buy_price = 0.84 / (1 + 0.42 / 0.43)
+    assert order.price == pytest.approx(buy_price)
+    assert manager.balances["XLM"] == pytest.approx(1.9 * 0.999)
+    assert manager.balances["USDT"] == pytest.approx(0.84 - 1.9 * buy_price)
+
+    order = manager.sell_alt("XLM", "USDT", 0.0)
+    assert order.price == pytest.approx(0.40)
+    assert order.cumulative_filled_quantity == pytest.approx(1.8)
+    assert manager.balances["USDT"] == pytest.approx(0.84 - 1.9 * buy_price + 1.8 * 0.40 * 0.999)
@@ -0,0 +1,152 @@
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from binance_trade_bot.binance_stream_manager import DepthCacheManager
+from binance_trade_bot.resync_scheduler import OrderBookResyncScheduler, order_book_weight
+
+
+class FakeAsyncClient:
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.requested = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.last_update_id = 100
+
+    async def get_order_book(self, symbol, limit):
+        self.requested.append(symbol)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        return {"lastUpdateId": self.last_update_id, "bids": [["1.0", "10.0"]], "asks": [["1.1", "10.0"]]}
+
+
+def resync_all(scheduler: OrderBookResyncScheduler, symbols):
+    async def resync():
+        for symbol in symbols:
+            scheduler.mark_unsynced(symbol)
+
+        async def fetch(symbol):
+            await scheduler.fetch_order_book(symbol, 100)
+            scheduler.mark_synced(symbol)
+
+        await asyncio.gather(*(fetch(symbol) for symbol in symbols))
+
+    asyncio.run(resync())
+
+
+def test_order_book_weight():
+    assert [order_book_weight(limit) for limit in (5, 100, 500, 1000, 5000)] == [1, 1, 5, 10, 50]
+
+
+class TestOrderBookResyncScheduler:
+    @staticmethod
+    def test_priorities_served_first():
+        client = FakeAsyncClient()
+        scheduler = OrderBookResyncScheduler(client, MagicMock(), max_concurrency=1)
+        scheduler.set_priorities(["EOSUSDT", "XLMUSDT"])
+        resync_all(scheduler, ["ADAUSDT", "BTTUSDT", "XLMUSDT", "EOSUSDT"])
+        # first request is dispatched before any other one is queued
+        assert client.requested == ["ADAUSDT", "EOSUSDT", "XLMUSDT", "BTTUSDT"]
+
+    @staticmethod
+    def test_concurrency_limit():
+        client = FakeAsyncClient()
+        scheduler = OrderBookResyncScheduler(client, MagicMock(), max_concurrency=3)
+        resync_all(scheduler, [f"COIN{idx}USDT" for idx in range(10)])
+        assert len(client.requested) == 10
+        assert client.max_in_flight == 3
+
+    @staticmethod
+    def test_weight_budget():
+        client = FakeAsyncClient(delay=0)
+        scheduler = OrderBookResyncScheduler(client, MagicMock(), weight_per_minute=2, max_concurrency=10, window=0.1)
+        resync_all(scheduler, [f"COIN{idx}USDT" for idx in range(6)])
+        assert len(client.requested) == 6
+        # 6 requests of weight 1 with a budget of 2 per window take at least 2 extra windows
+        assert scheduler.last_round_duration >= 0.2
+
+    @staticmethod
+    def test_round_duration():
+        logger = MagicMock()
+        scheduler = OrderBookResyncScheduler(FakeAsyncClient(delay=0.05), logger, max_concurrency=2)
+        resync_all(scheduler, ["XLMUSDT", "EOSUSDT", "ADAUSDT"])
+        assert scheduler.last_round_size == 3
+        assert scheduler.last_round_duration == pytest.approx(0.1, abs=0.05)
+        assert not scheduler.unsynced_symbols()
+        logger.info.assert_called_once()
+
+
+async def wait_reinits(dcm: DepthCacheManager):
+    while dcm.reinit_tasks:
+        await asyncio.gather(*dcm.reinit_tasks)
+
+
+class TestDepthCacheManagerResync:
+    @staticmethod
+    def test_gap_triggers_background_resync():
+        async def feed():
+            client = FakeAsyncClient()
+            dcm = DepthCacheManager("XLMUSDT", client, MagicMock())
+            await dcm.reinit()
+            assert dcm.last_update_id == 100
+            # gap in the sequence, the event is buffered until the book is resynced
+            await dcm.process_data(
+                {"first_update_id_in_event": 150, "final_update_id_in_event": 151, "bids": [], "asks": []}
+            )
+            assert dcm.buffer_incoming_data()
+            client.last_update_id = 200
+            await wait_reinits(dcm)
+            return dcm
+
+        dcm = asyncio.run(feed())
+        assert not dcm.buffer_incoming_data()
+        assert dcm.last_update_id == 200
+        assert not dcm.data_queue
+        assert dcm.snapshot.get_market_sell_price(5.0) == (1.0, 5.0)
+
+    @staticmethod
+    def test_stale_snapshot_is_requested_again():
+        async def feed():
+            client = FakeAsyncClient()
+            dcm = DepthCacheManager("XLMUSDT", client, MagicMock())
+            await dcm.reinit()
+            client.last_update_id = 120  # still older than the buffered event
+            await dcm.process_data(
+                {"first_update_id_in_event": 150, "final_update_id_in_event": 151, "bids": [], "asks": []}
+            )
+            while len(client.requested) < 3:
+                await asyncio.sleep(0)
+            client.last_update_id = 149
+            await asyncio.wait_for(wait_reinits(dcm), 5)
+            return dcm, client
+
+        dcm, client = asyncio.run(feed())
+        assert len(client.requested) >= 3
+        assert dcm.last_update_id == 151
+        assert not dcm.data_queue
+        assert not dcm.buffer_incoming_data()
+
+    @staticmethod
+    def test_client_error_is_retried():
+        class FlakyAsyncClient(FakeAsyncClient):
+            async def get_order_book(self, symbol, limit):
+                if not self.requested:
+                    self.requested.append(symbol)
+                    raise asyncio.TimeoutError()
+                return await super().get_order_book(symbol, limit)
+
+        async def resync():
+            dcm = DepthCacheManager("XLMUSDT", FlakyAsyncClient(), MagicMock())
+            await dcm.reinit()
+            await asyncio.wait_for(wait_reinits(dcm), 5)
+            return dcm
+
+        dcm = asyncio.run(resync())
+        assert dcm.last_update_id == 100
+        assert not dcm.resync_scheduler.unsynced_symbols()
+        assert dcm.resync_scheduler.last_round_size == 1
+        dcm.logger.error.assert_called_once()
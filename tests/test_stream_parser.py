@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+from unicorn_fy.unicorn_fy import UnicornFy
+
+from binance_trade_bot.binance_stream_manager import (
+    BUFFER_NAME_DEPTH,
+    BUFFER_NAME_MINITICKERS,
+    AsyncListenerContext,
+    BinanceCache,
+    DepthCacheManager,
+    DepthListener,
+    TickerListener,
+)
+from binance_trade_bot.stream_parser import parse_depth_update, parse_levels, parse_mini_ticker
+
+DEPTH_PAYLOAD = json.dumps(
+    {
+        "stream": "xlmusdt@depth@100ms",
+        "data": {
+            "e": "depthUpdate",
+            "E": 1620000000000,
+            "s": "XLMUSDT",
+            "U": 11,
+            "u": 13,
+            "b": [["0.41230000", "120.50000000"], ["0.41220000", "0.00000000"]],
+            "a": [["0.41250000", "7.10000000"]],
+        },
+    }
+)
+
+
+def mini_ticker(symbol: str, close_price: str):
+    return {
+        "e": "24hrMiniTicker",
+        "E": 1620000000000,
+        "s": symbol,
+        "c": close_price,
+        "o": "1.0",
+        "h": "2.0",
+        "l": "0.5",
+        "v": "100.0",
+        "q": "100.0",
+    }
+
+
+def test_parse_levels():
+    assert parse_levels([["1.5", "2"], ["1.25", "0.00000000"]]) == [(1.5, 2.0), (1.25, 0.0)]
+    assert parse_levels([]) == []
+
+
+def test_depth_update_same_as_unicorn_fy():
+    expected = UnicornFy.binance_com_websocket(DEPTH_PAYLOAD)
+    parsed = parse_depth_update(DEPTH_PAYLOAD)
+    for key in ("symbol", "event_time", "first_update_id_in_event", "final_update_id_in_event"):
+        assert parsed[key] == expected[key]
+    for side in ("bids", "asks"):
+        assert parsed[side] == [(float(price), float(quantity)) for price, quantity in expected[side]]
+
+
+def test_mini_ticker_same_as_unicorn_fy():
+    for payload in (
+        {"stream": "xlmusdt@miniTicker", "data": mini_ticker("XLMUSDT", "0.4123")},
+        {"stream": "!miniTicker@arr", "data": [mini_ticker("XLMUSDT", "0.4123"), mini_ticker("EOSUSDT", "5.1")]},
+    ):
+        raw = json.dumps(payload)
+        expected = UnicornFy.binance_com_websocket(raw)
+        parsed = parse_mini_ticker(raw)
+        assert parsed["event_type"] == expected["event_type"]
+        assert [(event["symbol"], event["close_price"]) for event in parsed["data"]] == [
+            (event["symbol"], float(event["close_price"])) for event in expected["data"]
+        ]
+
+
+def test_other_payloads_are_skipped():
+    subscription_result = json.dumps({"result": None, "id": 1})
+    assert parse_depth_update(subscription_result) is None
+    assert parse_mini_ticker(subscription_result) is None
+    assert parse_depth_update(json.dumps({"stream": "xlmusdt@miniTicker", "data": mini_ticker("XLMUSDT", "1")})) is None
+
+
+def test_listeners_parse_raw_payloads():
+    async def feed():
+        cache = BinanceCache()
+        dcm = DepthCacheManager("XLMUSDT", None, None)
+        dcm.last_update_id = 10
+        context = AsyncListenerContext([BUFFER_NAME_DEPTH, BUFFER_NAME_MINITICKERS], cache, None, None, {})
+        listeners = [
+            DepthListener(context, {"XLMUSDT": dcm}, parse_depth_update),
+            TickerListener(context, parse_mini_ticker),
+        ]
+        context.queues[BUFFER_NAME_DEPTH].put_nowait(json.dumps({"result": None, "id": 1}))
+        context.queues[BUFFER_NAME_DEPTH].put_nowait(DEPTH_PAYLOAD)
+        context.queues[BUFFER_NAME_MINITICKERS].put_nowait(
+            json.dumps({"stream": "xlmusdt@miniTicker", "data": mini_ticker("XLMUSDT", "0.4124")})
+        )
+        tasks = [asyncio.create_task(listener.run_loop()) for listener in listeners]
+        await asyncio.sleep(0.01)
+        for task in tasks:
+            task.cancel()
+        return cache, dcm
+
+    cache, dcm = asyncio.run(feed())
+    assert cache.ticker_values == {"XLMUSDT": 0.4124}
+    assert dcm.last_update_id == 13
+    assert list(dcm.depth_cache.get_bids()) == [(0.4123, 120.5)]
+    assert list(dcm.depth_cache.get_asks()) == [(0.4125, 7.1)]
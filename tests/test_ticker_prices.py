@@ -0,0 +1,66 @@
+import asyncio
+from types import SimpleNamespace
+
+from binance_trade_bot.binance_stream_manager import (
+    BUFFER_NAME_MINITICKERS,
+    AsyncListenerContext,
+    BinanceCache,
+    TickerListener,
+)
+from binance_trade_bot.models import Coin
+from binance_trade_bot.ticker_prices import BRIDGE_QUOTE_IDX, TickerPrices, ticker_quotes
+
+
+def test_ticker_quotes():
+    assert ticker_quotes(SimpleNamespace(BRIDGE=Coin("USDT", False))) == ["USDT", "BTC", "BNB"]
+    assert ticker_quotes(SimpleNamespace(BRIDGE=Coin("BUSD", False))) == ["BUSD", "USDT", "BTC", "BNB"]
+
+
+def test_prices_by_index():
+    ticker_prices = TickerPrices(["ADA", "BTC", "XLM"], ["USDT", "BTC", "BNB"])
+    assert "BTCBTC" not in ticker_prices.slots
+    assert ticker_prices.get(2, BRIDGE_QUOTE_IDX) is None
+    assert ticker_prices.updated_at(2, BRIDGE_QUOTE_IDX) == 0.0
+
+    assert ticker_prices.update("XLMUSDT", 0.41, 100.0)
+    assert ticker_prices.update("ADABNB", 0.003, 101.0)
+    assert not ticker_prices.update("XLMETH", 0.0002, 102.0)
+
+    assert ticker_prices.get(2, BRIDGE_QUOTE_IDX) == 0.41
+    assert ticker_prices.get(0, ticker_prices.quote_idx("BNB")) == 0.003
+    assert ticker_prices.get(0, BRIDGE_QUOTE_IDX) is None
+    assert ticker_prices.updated_at(2, BRIDGE_QUOTE_IDX) == 100.0
+    assert ticker_prices.get_symbol("XLMUSDT") == 0.41
+    assert ticker_prices.get_symbol("XLMETH") is None
+    assert ticker_prices.symbol(0, 2) == "ADABNB"
+
+
+def test_with_coins_keeps_prices():
+    ticker_prices = TickerPrices(["ADA", "XLM"], ["USDT", "BTC"])
+    ticker_prices.update("XLMUSDT", 0.41, 100.0)
+    ticker_prices.update("ADABTC", 0.00002, 100.0)
+
+    resized = ticker_prices.with_coins(["DOGE", "XLM"])
+    assert resized.get(1, 0) == 0.41
+    assert resized.updated_at(1, 0) == 100.0
+    assert resized.get(0, 0) is None
+    assert resized.get_symbol("ADABTC") is None
+
+
+def test_ticker_listener_writes_slots():
+    async def feed():
+        cache = BinanceCache(TickerPrices(["XLM"], ["USDT"]))
+        context = AsyncListenerContext([BUFFER_NAME_MINITICKERS], cache, None, None, {})
+        await TickerListener(context).handle_data(
+            {
+                "event_type": "24hrMiniTicker",
+                "data": [{"symbol": "XLMUSDT", "close_price": "0.41"}, {"symbol": "XLMETH", "close_price": "0.0002"}],
+            }
+        )
+        return cache
+
+    cache = asyncio.run(feed())
+    assert cache.ticker_prices.get(0, 0) == 0.41
+    assert cache.ticker_prices.updated_at(0, 0) > 0
+    # symbols without a slot are still kept by name
+    assert cache.ticker_values == {"XLMETH": 0.0002}
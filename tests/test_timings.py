@@ -0,0 +1,76 @@
+import random
+from unittest.mock import MagicMock
+
+import pytest
+
+from binance_trade_bot.timings import MAX_BUCKET, TimingHistogram, bucket_of, bucket_upper_bound, phase_timings, timed
+
+
+@pytest.fixture()
+def enabled_timings():
+    phase_timings.reset()
+    phase_timings.enabled = True
+    yield phase_timings
+    phase_timings.enabled = False
+    phase_timings.reset()
+
+
+def test_buckets_are_contiguous():
+    assert [bucket_of(value) for value in range(40)] == list(range(32)) + [32, 32, 33, 33, 34, 34, 35, 35]
+    for value in [0, 31, 32, 33, 1000, 123_456_789, 2**39 + 5]:
+        bucket = bucket_of(value)
+        assert bucket_upper_bound(bucket) >= value
+        assert bucket == 0 or bucket_upper_bound(bucket - 1) < value
+        # within 1/16 of the value
+        assert bucket_upper_bound(bucket) - value <= value / 16
+    assert bucket_of(2**50) == MAX_BUCKET
+
+
+def test_percentiles_close_to_exact():
+    rnd = random.Random(3)
+    durations = [int(rnd.lognormvariate(13, 1.5)) for _ in range(5000)]
+    histogram = TimingHistogram()
+    for duration in durations:
+        histogram.record(duration)
+    durations.sort()
+    for quantile in (0.5, 0.9, 0.99):
+        exact = durations[int(quantile * len(durations)) - 1]
+        assert exact <= histogram.percentile(quantile) <= exact * 17 / 16
+    assert histogram.percentile(1.0) == histogram.max == durations[-1]
+    assert TimingHistogram().percentile(0.5) is None
+
+
+def test_timed_records_only_when_enabled():
+    @timed("test_phase")
+    def phase(value, offset=0):
+        return value + offset
+
+    phase_timings.reset()
+    assert phase(1, offset=2) == 3
+    assert phase_timings.get_stats() == {}
+
+
+def test_timed_records_failed_calls(enabled_timings):
+    @timed("test_phase")
+    def phase(fail):
+        if fail:
+            raise ValueError()
+
+    phase(False)
+    with pytest.raises(ValueError):
+        phase(True)
+    count, p50, p99, max_duration = enabled_timings.get_stats()["test_phase"]
+    assert count == 2
+    assert 0 < p50 <= p99 <= max_duration
+
+
+def test_log_stats_starts_a_new_period(enabled_timings):
+    # the upper bound of its bucket
+    enabled_timings.record("scout", 2**21 - 1)
+    enabled_timings.record("scout", 4_000_000)
+    logger = MagicMock()
+    enabled_timings.log_stats(logger)
+    message = logger.info.call_args.args[0]
+    assert message.startswith("Phase scout over") and "2 calls, p50 2.097ms, p99 4.000ms, max 4.000ms" in message
+    assert logger.info.call_args.kwargs == {"notification": False}
+    assert enabled_timings.get_stats() == {}